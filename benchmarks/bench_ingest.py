@@ -0,0 +1,156 @@
+"""
+Compare parse time and peak RSS of the /create-space dataset formats.
+
+Each (format, rows) case is decoded in a fresh process so peak RSS is not
+polluted by earlier cases. The JSON row reproduces the existing path:
+json.loads of the request body followed by pd.DataFrame(dict-of-lists).
+
+    python -m benchmarks.bench_ingest --rows 1000 10000 100000
+"""
+
+import argparse
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.tasks.ingest import decode_dataset
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    words = np.array(["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"])
+    return pd.DataFrame({
+        "title": [f"Item {i}" for i in range(rows)],
+        "text": [" ".join(rng.choice(words, 30)) for _ in range(rows)],
+        "category": rng.choice(["a", "b", "c", "d"], rows),
+        "value": rng.normal(size=rows),
+        "count": rng.integers(0, 1000, rows),
+    })
+
+
+def encode(df: pd.DataFrame, file_format: str) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == "json":
+        return json.dumps({"data": df.to_dict(orient="list")}).encode("utf-8")
+
+    if file_format == "csv.gz":
+        return gzip.compress(df.to_csv(index=False).encode("utf-8"))
+
+    if file_format == "ndjson":
+        return df.to_json(orient="records", lines=True).encode("utf-8")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    if file_format == "parquet":
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def decode(file_format: str, raw: bytes) -> pd.DataFrame:
+    if file_format == "json":
+        return pd.DataFrame(json.loads(raw).get("data", {}))
+    if file_format == "csv.gz":
+        return decode_dataset("csv", raw, "gzip")
+    if file_format == "arrow":
+        return decode_dataset("arrow_stream", raw)
+    return decode_dataset(file_format, raw)
+
+
+def _reset_peak_rss() -> bool:
+    # Linux can reset the high-water mark, so the peak reflects the parse alone
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mib() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # macOS reports bytes
+
+
+def _measure(file_format: str, path: str, queue):
+    # read from disk rather than receiving the body as a pickled argument, whose
+    # unpickling would set the peak before the measurement starts
+    import pyarrow  # noqa: F401  import cost is not part of the parse
+
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    _reset_peak_rss()
+    baseline = _peak_rss_mib()
+    start = time.perf_counter()
+    df = decode(file_format, raw)
+    elapsed = time.perf_counter() - start
+    queue.put({"seconds": elapsed, "peak_rss_delta_mib": _peak_rss_mib() - baseline, "rows": len(df)})
+
+
+def run_case(file_format: str, raw: bytes) -> dict:
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_measure, args=(file_format, path, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        return result
+    finally:
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--formats", nargs="+", default=["json", "ndjson", "csv.gz", "parquet", "arrow"])
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'format':<8} {'rows':>8} {'body MiB':>9} {'parse ms':>9} {'peak RSS +MiB':>14}")
+    for rows in args.rows:
+        df = make_frame(rows)
+        for file_format in args.formats:
+            raw = encode(df, file_format)
+            measured = run_case(file_format, raw)
+            result = {"format": file_format, "rows": rows, "body_mib": len(raw) / 2**20, **measured}
+            results.append(result)
+            print(
+                f"{file_format:<8} {rows:>8} {result['body_mib']:>9.2f} "
+                f"{result['seconds'] * 1000:>9.1f} {result['peak_rss_delta_mib']:>14.1f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
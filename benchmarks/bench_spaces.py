@@ -0,0 +1,296 @@
+"""
+Load-test space creation and get_proxy against the fake Mantis backend.
+
+Start the backend (python -m benchmarks.fake_mantis) and the stack with
+MANTIS_HOST pointing at it, then run one of:
+
+    python -m benchmarks.bench_spaces api --spaces 40 --concurrency 1 4 16
+    python -m benchmarks.bench_spaces task --spaces 40 --concurrency 8
+    python -m benchmarks.bench_spaces proxy --requests 2000 --concurrency 8 32 --blob-bytes 1048576
+
+"api" submits through POST /api/create-space and follows space-task-status,
+"task" enqueues process_space_creation directly, and "proxy" fetches a blob
+from the fake backend through /api/get_proxy. Results are saved as JSON
+tagged with the current commit; --compare prints the change against an
+earlier result file.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+import psutil
+import requests
+
+from benchmarks.bench_ingest import make_frame
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+TERMINAL_STATES = ("SUCCESS", "FAILURE")
+
+
+class RssSampler:
+    """
+    Samples the summed RSS of the processes whose command line contains
+    pattern (the Celery worker and its children by default).
+    """
+
+    def __init__(self, pattern: str, interval: float = 0.5):
+        self.pattern = pattern
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int | None:
+        total, found = 0, False
+        for process in psutil.process_iter(["cmdline", "memory_info"]):
+            cmdline = " ".join(process.info["cmdline"] or [])
+            if self.pattern in cmdline and process.pid != os.getpid():
+                total += process.info["memory_info"].rss
+                found = True
+        return total if found else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = self._sample()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def fake_stats(fake_url: str) -> dict | None:
+    try:
+        return requests.get(f"{fake_url}/__stats__", timeout=5).json()
+    except requests.RequestException:
+        return None
+
+
+def make_spec(index: int, rows: int, cookie: str) -> dict:
+    from mantis_sdk.client import DataType
+
+    df = make_frame(rows)
+    # a distinct column per space keeps deduplication from collapsing the submissions
+    df["run"] = f"{time.time_ns()}-{index}"
+    return {
+        "name": f"bench-{index}",
+        "cookie": cookie,
+        "data_types": {
+            "title": DataType.Title,
+            "text": DataType.Semantic,
+            "category": DataType.Categoric,
+            "value": DataType.Numeric,
+            "count": DataType.Numeric,
+        },
+        "job": f"bench-{time.time_ns()}-{index}",
+        "data": df.to_dict(orient="list"),
+    }
+
+
+def user_cookie(args, index: int) -> str:
+    # admission control caps the spaces each user has in flight, so load is spread over --users sessions
+    return f"{args.cookie}-{index % args.users}"
+
+
+def run_api_space(args, index: int) -> dict:
+    spec = make_spec(index, args.rows, user_cookie(args, index))
+    start = time.perf_counter()
+    rejections = 0
+
+    while True:
+        response = requests.post(f"{args.web_url}/api/create-space", json=spec, timeout=60)
+        if response.status_code != 429:
+            break
+        rejections += 1
+        if rejections > args.max_rejections:
+            return {"seconds": time.perf_counter() - start, "ok": False, "rejections": rejections}
+        time.sleep(float(response.headers.get("Retry-After", 5)))
+
+    body = response.json()
+    if "task_id" not in body:
+        return {"seconds": time.perf_counter() - start, "ok": False, "rejections": rejections}
+    task_id = body["task_id"]
+
+    while True:
+        status = requests.get(f"{args.web_url}/api/space-task-status/{task_id}", timeout=30).json()
+        if status["state"] in TERMINAL_STATES:
+            break
+        time.sleep(args.poll_interval)
+
+    ok = status["state"] == "SUCCESS" and "result" in status
+    return {"seconds": time.perf_counter() - start, "ok": ok, "rejections": rejections}
+
+
+def run_task_space(args, index: int) -> dict:
+    from src import payloads
+    from src.tasks.space_tasks import process_space_creation
+
+    spec = make_spec(index, args.rows, user_cookie(args, index))
+    start = time.perf_counter()
+    result = process_space_creation.delay(payloads.offload(spec))
+
+    while result.state not in TERMINAL_STATES:
+        time.sleep(args.poll_interval)
+
+    ok = result.state == "SUCCESS" and "error" not in (result.result or {})
+    return {"seconds": time.perf_counter() - start, "ok": ok}
+
+
+def run_proxy_request(args, index: int) -> dict:
+    url = f"{args.fake_url}/blob/{args.blob_bytes}?n={index % args.distinct_urls}"
+    start = time.perf_counter()
+    response = requests.get(f"{args.web_url}/api/get_proxy/{quote(url, safe='')}", timeout=60)
+    size = len(response.content)
+    return {
+        "seconds": time.perf_counter() - start,
+        "ok": response.status_code == 200,
+        "bytes": size,
+        "cache": response.headers.get("X-Cache"),
+    }
+
+
+RUNNERS = {"api": run_api_space, "task": run_task_space, "proxy": run_proxy_request}
+
+
+def run_level(args, concurrency: int) -> dict:
+    total = args.requests if args.mode == "proxy" else args.spaces
+    runner = RUNNERS[args.mode]
+    before = fake_stats(args.fake_url)
+
+    with RssSampler(args.worker_match) as rss, ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        samples = list(pool.map(lambda index: runner(args, index), range(total)))
+        elapsed = time.perf_counter() - start
+
+    after = fake_stats(args.fake_url)
+    seconds = np.array([sample["seconds"] for sample in samples])
+    ok = sum(sample["ok"] for sample in samples)
+
+    result = {
+        "concurrency": concurrency,
+        "count": total,
+        "ok": ok,
+        "errors": total - ok,
+        "wall_seconds": elapsed,
+        "p50_seconds": float(np.percentile(seconds, 50)),
+        "p99_seconds": float(np.percentile(seconds, 99)),
+        "worker_peak_rss_mib": rss.peak / 2**20 if rss.peak else None,
+    }
+
+    if args.mode == "proxy":
+        result["requests_per_second"] = total / elapsed
+        result["bytes_relayed"] = sum(sample["bytes"] for sample in samples)
+        result["cache_hits"] = sum(sample["cache"] == "HIT" for sample in samples)
+    else:
+        result["spaces_per_minute"] = ok / elapsed * 60
+        result["rejections"] = sum(sample.get("rejections", 0) for sample in samples)
+
+    if before is not None and after is not None:
+        result["bytes_uploaded"] = after["bytes_uploaded"] - before["bytes_uploaded"]
+        result["backend_requests"] = {
+            endpoint: count - before["requests"].get(endpoint, 0)
+            for endpoint, count in after["requests"].items()
+        }
+
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results: list[dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+    throughput = "requests_per_second" if "requests_per_second" in results[0] else "spaces_per_minute"
+    print(f"\nvs {baseline_path}")
+    for level in results:
+        previous = baseline.get(level["concurrency"])
+        if previous is None:
+            continue
+        changes = []
+        for key in ("p50_seconds", "p99_seconds", throughput):
+            if previous.get(key):
+                changes.append(f"{key} {100 * (level[key] - previous[key]) / previous[key]:+.1f}%")
+        print(f"  concurrency {level['concurrency']:>3}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mode", choices=sorted(RUNNERS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--spaces", type=int, default=20, help="spaces created per concurrency level")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=1000, help="proxy requests per concurrency level")
+    parser.add_argument("--blob-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--distinct-urls", type=int, default=50, help="proxy URLs cycled through, to exercise the cache")
+    parser.add_argument("--web-url", default="http://localhost:8111")
+    parser.add_argument("--fake-url", default="http://localhost:8200", help="fake backend as the web tier reaches it")
+    parser.add_argument("--cookie", default="bench-session", help="cookie prefix; each simulated user gets its own")
+    parser.add_argument("--users", type=int, default=16, help="simulated users the spaces are spread over")
+    parser.add_argument("--max-rejections", type=int, default=20, help="429s a space may get before it counts as an error")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--worker-match", default="celery", help="command-line substring of worker processes for RSS")
+    parser.add_argument("--output", help="result path (default benchmarks/results/<time>-<commit>-<mode>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(args, concurrency)
+        levels.append(level)
+        throughput = (
+            f"{level['requests_per_second']:.1f} req/s" if args.mode == "proxy"
+            else f"{level['spaces_per_minute']:.1f} spaces/min"
+        )
+        rss = f"{level['worker_peak_rss_mib']:.0f} MiB" if level["worker_peak_rss_mib"] else "n/a"
+        print(
+            f"concurrency {concurrency:>3}: p50 {level['p50_seconds']:.3f}s  p99 {level['p99_seconds']:.3f}s  "
+            f"{throughput}  errors {level['errors']}  rejections {level.get('rejections', 0)}  worker RSS {rss}  "
+            f"uploaded {level.get('bytes_uploaded', 0) / 2**20:.1f} MiB"
+        )
+
+    commit = git_commit()
+    report = {
+        "mode": args.mode,
+        "commit": commit,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "cookie")},
+        "levels": levels,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{commit or 'unknown'}-{args.mode}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {output}")
+
+    if args.compare:
+        print_comparison(levels, args.compare)
+
+
+if __name__ == "__main__":
+    main()
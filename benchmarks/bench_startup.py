@@ -0,0 +1,117 @@
+"""
+Measure cold-start time and RSS of the web and worker entrypoints.
+
+Each entrypoint is started in fresh interpreters, so nothing is cached in
+sys.modules between runs. The web tier only enqueues tasks by name and must
+not import pandas, numpy or mantis_sdk; --check exits non-zero when it does.
+
+    python -m benchmarks.bench_startup --runs 5 --check
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules only the worker needs; loading any of them in the web tier is a regression
+WORKER_ONLY_MODULES = ("pandas", "numpy", "pyarrow", "mantis_sdk", "src.tasks.space_tasks", "src.tasks.mantis_client")
+
+ENTRYPOINTS = {
+    "web": "from src.app import create_app; create_app()",
+    "worker": "from src.worker import celery; celery.loader.import_default_modules()",
+}
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "worker_only": [name for name in {worker_only!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_once(code: str) -> dict:
+    probe = PROBE.format(code=code, worker_only=WORKER_ONLY_MODULES)
+    completed = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(code: str, top: int) -> list[tuple[str, float]]:
+    """
+    Modules with the largest cumulative import time, from python -X importtime.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    timings = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        timings.append((name.strip(), int(cumulative) / 1e6))
+    # top-level packages only, their submodules are included in the cumulative time
+    timings = [(name, seconds) for name, seconds in timings if "." not in name]
+    return sorted(timings, key=lambda timing: timing[1], reverse=True)[:top]
+
+
+def measure(name: str, runs: int, top: int) -> dict:
+    samples = [run_once(ENTRYPOINTS[name]) for _ in range(runs)]
+    errors = [sample["error"] for sample in samples if "error" in sample]
+    if errors:
+        return {"entrypoint": name, "error": errors[0]}
+
+    return {
+        "entrypoint": name,
+        "median_seconds": statistics.median(sample["seconds"] for sample in samples),
+        "max_rss_mib": max(sample["max_rss_kib"] for sample in samples) / 1024,
+        "modules": samples[0]["modules"],
+        "worker_only_modules": samples[0]["worker_only"],
+        "slowest_imports": slowest_imports(ENTRYPOINTS[name], top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entrypoints", nargs="+", choices=sorted(ENTRYPOINTS), default=["web", "worker"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest top-level imports to list")
+    parser.add_argument("--check", action="store_true", help="fail when the web tier imports worker-only modules")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+
+    results = []
+    for name in args.entrypoints:
+        result = measure(name, args.runs, args.top)
+        results.append(result)
+        if "error" in result:
+            print(f"{name:<7} failed to start: {result['error']}")
+            continue
+
+        print(
+            f"{name:<7} startup {result['median_seconds'] * 1000:7.1f} ms  RSS {result['max_rss_mib']:6.1f} MiB  "
+            f"modules {result['modules']:>5}  worker-only {', '.join(result['worker_only_modules']) or '-'}"
+        )
+        for module, seconds in result["slowest_imports"]:
+            print(f"          {module:<28} {seconds * 1000:7.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        web = next((result for result in results if result["entrypoint"] == "web"), None)
+        if web is None or "error" in web or web["worker_only_modules"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Time the web tier's streaming validation of JSON /create-space bodies.
+
+For each row count, reports how long the body takes to validate and parse
+when it is valid, against json.loads alone, and how long it takes to
+reject when it is too small, lacks a cookie or has too many rows.
+
+    python -m benchmarks.bench_validation --rows 1000 10000 100000
+"""
+
+import argparse
+import io
+import json
+import time
+
+from src import validation
+
+
+def make_body(rows: int, **fields) -> bytes:
+    body = {
+        "name": "bench",
+        "cookie": "bench",
+        "data": {
+            "title": [f"Item {i}" for i in range(rows)],
+            "text": [f"alpha beta gamma delta {i} epsilon zeta eta theta" for i in range(rows)],
+            "value": [i * 0.5 for i in range(rows)],
+        },
+        "data_types": {"title": "title", "text": "semantic", "value": "numeric"},
+    }
+    body.update(fields)
+    return json.dumps(body).encode("utf-8")
+
+
+def best_of(runs: int, fn) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def validate(raw: bytes):
+    try:
+        json.loads(validation.read_json_submission(io.BytesIO(raw)))
+    except validation.Invalid:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'MiB':>7} {'json.loads':>11} {'validated':>10} {'no cookie':>10} {'too large':>10}")
+    for rows in args.rows:
+        raw = make_body(rows)
+        # An empty cookie stops the scan where it appears, before the dataset; row limits stop it part way
+        no_cookie = make_body(rows, cookie="")
+        too_large = make_body(validation.MAX_TOTAL_ROWS + rows)
+
+        results = [best_of(args.runs, lambda body=body: validate(body)) for body in (raw, no_cookie, too_large)]
+        plain = best_of(args.runs, lambda: json.loads(raw))
+        print(
+            f"{rows:>8} {len(raw) / 2**20:>7.1f} {plain * 1000:>9.1f}ms "
+            + " ".join(f"{seconds * 1000:>8.1f}ms" for seconds in results)
+        )
+
+    small = make_body(validation.MIN_ROWS - 1)
+    print(f"too small ({validation.MIN_ROWS - 1} rows) rejected in {best_of(args.runs, lambda: validate(small)) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Local stand-in for the Mantis backend, for benchmarks and load tests.
+
+Serves the synthesis endpoints under /api/proxy/ the way ResilientMantisClient
+calls them, plus /blob/<bytes> as a get_proxy upstream. Each space's progress
+follows a curve over --build-seconds from its upload; latency, 404s and 504s
+can be injected, and uploaded bytes are counted per space.
+
+    python -m benchmarks.fake_mantis --port 8200 --build-seconds 20 --error-504 0.05
+
+Point the worker at it with MANTIS_HOST=http://<host>:8200. GET /__stats__
+returns the counters and POST /__reset__ clears them.
+"""
+
+import argparse
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import Flask, Response, jsonify, request
+
+SPACE_ID_FIELD = re.compile(rb'name="space_id"\r\n\r\n([^\r]+)\r\n')
+
+CURVES = {
+    "linear": lambda x: x,
+    # slow embedding phase, then a quick finish
+    "sigmoid": lambda x: 1 / (1 + math.exp(-12 * (x - 0.5))),
+    # long stall before the UMAP step, the shape that triggers client timeouts
+    "step": lambda x: 0.45 if x < 0.8 else x,
+}
+
+
+class FakeBackend:
+    def __init__(self, latency: float, jitter: float, build_seconds: float, curve: str,
+                 error_404: float, error_504: float, fail_rate: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.build_seconds = build_seconds
+        self.curve = CURVES[curve]
+        self.error_404 = error_404
+        self.error_504 = error_504
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spaces = {}
+            self.requests = Counter()
+            self.injected = Counter()
+            self.bytes_uploaded = 0
+            self.started_at = time.time()
+
+    def delay(self):
+        time.sleep(max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0))
+
+    def inject(self, endpoint: str, allow_404: bool = True):
+        """
+        Injected error response for this request, if any.
+        """
+        roll = self.random.random()
+        if roll < self.error_504:
+            self.injected[f"{endpoint}:504"] += 1
+            return Response("Gateway Timeout", status=504)
+        if allow_404 and roll < self.error_504 + self.error_404:
+            self.injected[f"{endpoint}:404"] += 1
+            return Response("SynthesisProgress not found", status=404)
+        return None
+
+    def progress(self, space: dict) -> int:
+        fraction = min((time.time() - space["created_at"]) / self.build_seconds, 1) if self.build_seconds else 1
+        value = int(100 * self.curve(fraction))
+        if value >= 50 and not space["umap_selected"]:
+            # synthesis waits for the client to choose a UMAP variation
+            value = 50
+        return min(value, 100)
+
+    def stats(self) -> dict:
+        with self.lock:
+            finished = sum(1 for space in self.spaces.values() if space["finished_at"])
+            return {
+                "uptime_seconds": time.time() - self.started_at,
+                "spaces_created": len(self.spaces),
+                "spaces_finished": finished,
+                "spaces_failed": sum(1 for space in self.spaces.values() if space["failed"]),
+                "bytes_uploaded": self.bytes_uploaded,
+                "requests": dict(self.requests),
+                "injected_errors": dict(self.injected),
+            }
+
+
+def create_app(backend: FakeBackend) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/api/proxy/synthesis/landscape/', methods=['POST'])
+    def landscape():
+        backend.requests["landscape"] += 1
+
+        # count the body as it streams in rather than buffering it; space_id is
+        # the first form field, so it is always in the first chunk
+        head = request.stream.read(64 * 1024)
+        size = len(head)
+        while True:
+            chunk = request.stream.read(64 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+
+        backend.delay()
+        error = backend.inject("landscape", allow_404=False)
+        if error is not None:
+            return error
+
+        match = SPACE_ID_FIELD.search(head)
+        space_id = match.group(1).decode() if match else f"fake-{len(backend.spaces)}"
+        with backend.lock:
+            backend.bytes_uploaded += size
+            backend.spaces[space_id] = {
+                "created_at": time.time(),
+                "bytes": size,
+                "umap_selected": False,
+                "finished_at": None,
+                "failed": backend.random.random() < backend.fail_rate,
+            }
+
+        return jsonify({"space_id": space_id, "layer_id": space_id})
+
+    @app.route('/api/proxy/synthesis/progress/<space_id>/', methods=['GET'])
+    def progress(space_id):
+        backend.requests["progress"] += 1
+        backend.delay()
+        error = backend.inject("progress")
+        if error is not None:
+            return error
+
+        space = backend.spaces.get(space_id)
+        if space is None:
+            return Response("SynthesisProgress not found", status=404)
+
+        if space["failed"]:
+            return jsonify({"progress": 0, "error": "Synthesis failed (injected)"})
+
+        value = backend.progress(space)
+        if value >= 100 and space["finished_at"] is None:
+            space["finished_at"] = time.time()
+        return jsonify({"progress": value, "error": False})
+
+    @app.route('/api/proxy/synthesis/parameters/<space_id>/', methods=['GET'])
+    def parameters(space_id):
+        backend.requests["parameters"] += 1
+        backend.delay()
+        error = backend.inject("parameters")
+        if error is not None:
+            return error
+
+        return jsonify({"umap_variations": {"parameters": {
+            "default": {"n_neighbors": 15, "min_dist": 0.1, "metric": "euclidean"},
+            "tight": {"n_neighbors": 5, "min_dist": 0.01, "metric": "cosine"},
+        }}})
+
+    @app.route('/api/proxy/synthesis/landscape/<space_id>/select-umap/<parameter>', methods=['POST'])
+    def select_umap(space_id, parameter):
+        backend.requests["select_umap"] += 1
+        backend.delay()
+        error = backend.inject("select_umap")
+        if error is not None:
+            return error
+
+        space = backend.spaces.get(space_id)
+        if space is not None:
+            space["umap_selected"] = True
+        return jsonify({"success": True, "message": "UMAP parameters selected successfully"})
+
+    @app.route('/blob/<int:size>', methods=['GET'])
+    def blob(size):
+        backend.requests["blob"] += 1
+        backend.delay()
+        return Response(b"x" * size, mimetype="application/octet-stream", headers={"Cache-Control": "max-age=60"})
+
+    @app.route('/__stats__', methods=['GET'])
+    def stats():
+        return jsonify(backend.stats())
+
+    @app.route('/__reset__', methods=['POST'])
+    def reset():
+        backend.reset()
+        return jsonify({"reset": True})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="+/- seconds of random latency")
+    parser.add_argument("--build-seconds", type=float, default=20, help="upload to 100%% progress")
+    parser.add_argument("--curve", choices=sorted(CURVES), default="linear")
+    parser.add_argument("--error-404", type=float, default=0.0, help="share of requests answered 404")
+    parser.add_argument("--error-504", type=float, default=0.0, help="share of requests answered 504")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of spaces whose synthesis fails")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    backend = FakeBackend(
+        args.latency, args.jitter, args.build_seconds, args.curve,
+        args.error_404, args.error_504, args.fail_rate, args.seed,
+    )
+    create_app(backend).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import datetime
+import logging
+import os
+import time
+
+import redis
+
+from src import scheduling
+from src.extensions import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Submissions whose projected wait for a worker exceeds this many seconds are
+# turned away with 429 instead of being queued; 0 disables the check
+WAIT_BUDGET = float(os.environ.get("SPACE_ADMISSION_WAIT_BUDGET", 300))
+# Builds admitted and not yet finished, overall and per user; 0 removes the cap
+MAX_INFLIGHT = int(os.environ.get("SPACE_MAX_INFLIGHT", 0))
+USER_MAX_INFLIGHT = int(os.environ.get("SPACE_USER_MAX_INFLIGHT", 5))
+# A build still counted after this long is assumed lost (e.g. a killed worker)
+INFLIGHT_LEASE = int(os.environ.get("SPACE_INFLIGHT_LEASE", 2 * 3600))
+
+DEFAULT_BUILD_SECONDS = 600
+BUILD_SECONDS_KEY = "space_build_seconds"
+EWMA_WEIGHT = 0.2
+MIN_RETRY_AFTER = 5
+
+INFLIGHT_KEY = "space_inflight"
+
+ADMITTED = "admitted"
+QUEUE_FULL = "queue_full"
+USER_LIMIT = "user_limit"
+CAPACITY = "capacity"
+
+# Returns 0 when the task was admitted, 1 when the user is at their cap and 2
+# when the service is; members are scored by admission time
+_ADMIT = redis_client.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+if tonumber(ARGV[5]) > 0 and redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[5]) then
+    return 1
+end
+if tonumber(ARGV[4]) > 0 and redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 2
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return 0
+""")
+
+
+class Decision:
+    def __init__(self, outcome: str, queue: str, depth: int | None, wait_seconds: float, retry_after: float = 0):
+        self.outcome = outcome
+        self.queue = queue
+        self.depth = depth
+        self.wait_seconds = wait_seconds
+        self.retry_after = retry_after
+
+    @property
+    def admitted(self) -> bool:
+        return self.outcome == ADMITTED
+
+    @property
+    def start_seconds(self) -> float:
+        """
+        Seconds until a worker should pick the dataset up: now for an admitted
+        task, or if it is resubmitted after retry_after. A full queue drains to
+        the budget by then, so its start time does not move.
+        """
+        if self.outcome in (ADMITTED, QUEUE_FULL):
+            return self.wait_seconds
+        return self.retry_after + self.wait_seconds
+
+    def estimate(self) -> dict:
+        return {
+            "queue": self.queue,
+            "queue_depth": self.depth,
+            "estimated_wait_seconds": round(self.start_seconds, 1),
+            "estimated_start": _timestamp(time.time() + self.start_seconds),
+        }
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+
+def _user_key(user: str) -> str:
+    return f"{INFLIGHT_KEY}:user:{user}"
+
+
+def _record_key(task_id: str) -> str:
+    return f"space_admission:{task_id}"
+
+
+def build_seconds() -> float:
+    average = redis_client.get(BUILD_SECONDS_KEY)
+    return float(average) if average is not None else DEFAULT_BUILD_SECONDS
+
+
+def _retry_after_oldest(key: str) -> float:
+    """
+    Seconds until the oldest build in an in-flight set is expected to finish.
+    """
+    oldest = redis_client.zrange(key, 0, 0, withscores=True)
+    if not oldest:
+        return MIN_RETRY_AFTER
+    return max(oldest[0][1] + build_seconds() - time.time(), MIN_RETRY_AFTER)
+
+
+def _queue_status(queue: str) -> tuple[int | None, float]:
+    """
+    Depth and estimated wait of a queue; (None, 0) when the broker cannot be read.
+    """
+    try:
+        status = scheduling.queue_status([queue])[queue]
+    except Exception:
+        # an unreadable broker fails the enqueue itself; do not turn work away on a guess
+        logger.warning("could not read depth of %s", queue, exc_info=True)
+        return None, 0.0
+    return status["depth"], status["estimated_wait_seconds"]
+
+
+def admit(task_id: str, data: dict) -> Decision:
+    """
+    Decide whether a routed create-space submission may be queued. An admitted
+    task counts towards the in-flight caps until release is called for it.
+    """
+    queue, user = data["queue"], data["user"]
+    depth, wait = _queue_status(queue)
+
+    if WAIT_BUDGET > 0 and wait > WAIT_BUDGET:
+        # with no new arrivals the wait falls one second per second
+        return Decision(QUEUE_FULL, queue, depth, wait, max(wait - WAIT_BUDGET, MIN_RETRY_AFTER))
+
+    now = time.time()
+    outcome = _ADMIT(
+        keys=[INFLIGHT_KEY, _user_key(user)],
+        args=[now, now - INFLIGHT_LEASE, task_id, MAX_INFLIGHT, USER_MAX_INFLIGHT, INFLIGHT_LEASE],
+    )
+    if outcome == 1:
+        return Decision(USER_LIMIT, queue, depth, wait, _retry_after_oldest(_user_key(user)))
+    if outcome == 2:
+        return Decision(CAPACITY, queue, depth, wait, _retry_after_oldest(INFLIGHT_KEY))
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(_record_key(task_id), mapping={"queue": queue, "user": user, "admitted_at": now, "wait": wait})
+    pipe.expire(_record_key(task_id), INFLIGHT_LEASE)
+    pipe.execute()
+    return Decision(ADMITTED, queue, depth, wait)
+
+
+def release(task_id: str, user: str | None):
+    """
+    Stop counting a finished build. Safe to call for tasks that were never admitted.
+    """
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrem(INFLIGHT_KEY, task_id)
+        if user:
+            pipe.zrem(_user_key(user), task_id)
+        pipe.delete(_record_key(task_id))
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("could not release admission of task %s", task_id, exc_info=True)
+
+
+def observe_build(seconds: float):
+    """
+    Fold a finished build's duration into the moving average used for Retry-After.
+    """
+    try:
+        previous = redis_client.get(BUILD_SECONDS_KEY)
+        average = seconds if previous is None else (1 - EWMA_WEIGHT) * float(previous) + EWMA_WEIGHT * seconds
+        redis_client.set(BUILD_SECONDS_KEY, average)
+    except redis.RedisError:
+        logger.warning("could not record build duration", exc_info=True)
+
+
+def live_estimate(task_id: str, started: bool) -> dict | None:
+    """
+    Current estimate for an admitted task: when it should start while it is
+    queued, and when it should finish once it is building.
+    """
+    record = redis_client.hgetall(_record_key(task_id))
+    if not record:
+        return None
+
+    now = time.time()
+    elapsed = now - float(record["admitted_at"])
+
+    if started:
+        remaining = max(build_seconds() - elapsed, 0)
+        return {"estimated_remaining_seconds": round(remaining, 1), "estimated_finish": _timestamp(now + remaining)}
+
+    # Tasks queued since this one are behind it, so the wait for a new arrival is an upper bound
+    queue = record["queue"]
+    depth, current = _queue_status(queue)
+    wait = float(record["wait"]) - elapsed
+    if depth is not None:
+        wait = min(wait, current)
+    wait = max(wait, 0.0)
+    return {"queue": queue, "estimated_wait_seconds": round(wait, 1), "estimated_start": _timestamp(now + wait)}
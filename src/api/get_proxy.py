@@ -1,36 +1,141 @@
 import logging
-from flask import Blueprint, Response
+import time
+from flask import Blueprint, Response, jsonify, request
 from flask_cors import cross_origin
-from urllib.parse import unquote
-import requests
+from urllib.parse import unquote, urlsplit
+from src import metrics, tracing
+from src.api import proxy_cache, upstream
 
 logger = logging.getLogger(__name__)
 
 get_proxy = Blueprint('get_proxy', __name__)
 
+# client request headers relayed to the upstream so it can answer with 206 Partial Content
+FORWARDED_RANGE_HEADERS = ('Range', 'If-Range')
+
+def _upstream_headers():
+    headers = {name: request.headers[name] for name in FORWARDED_RANGE_HEADERS if name in request.headers}
+
+    if upstream.PASSTHROUGH:
+        # let the origin pick an encoding the client itself understands
+        headers['Accept-Encoding'] = request.headers.get('Accept-Encoding', 'identity')
+    elif 'Range' in headers:
+        # byte ranges of an encoding we would inflate are meaningless to the client
+        headers['Accept-Encoding'] = 'identity'
+
+    return headers
+
+def _cache_key(decoded_url):
+    if not upstream.PASSTHROUGH:
+        return decoded_url
+
+    # encoded bodies are stored as-is, so clients with different encodings need separate entries
+    accepted = sorted(token.strip().lower() for token in request.headers.get('Accept-Encoding', '').split(',') if token.strip())
+    return f"{','.join(accepted)}|{decoded_url}"
+
+def _cached_response(entry, cache_status):
+    if entry.matches(request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+        proxied = Response(status=304, headers={k: v for k, v in entry.headers.items() if k.lower() != 'content-length'})
+    else:
+        proxied = Response(entry.body, status=entry.status, headers=entry.headers)
+        proxied.headers['Content-Length'] = str(entry.size)
+
+    proxied.headers['Age'] = str(int(entry.age()))
+    proxied.headers['X-Cache'] = cache_status
+
+    metrics.PROXY_RESPONSES.labels(str(proxied.status_code), cache_status).inc()
+    if proxied.status_code != 304:
+        metrics.PROXY_BYTES.labels(cache_status).inc(entry.size)
+    return proxied
+
 @get_proxy.route('/get_proxy/<path:url>', methods=['GET'])
 @cross_origin()
 def proxy_request(url):
     try:
         decoded_url = unquote(url)
-        
-        response = requests.get(decoded_url, stream=True)
-        headers = dict(response.headers)
-        headers.pop('Content-Encoding', None)
-        headers.pop('Transfer-Encoding', None)
-
-        def generate():
-            for chunk in response.iter_content(chunk_size=8192, decode_unicode=False):
-                yield chunk
-
-        return Response(
-            generate(),
-            status=response.status_code,
-            headers=headers
-        )
-    
+
+        client_directives = request.headers.get('Cache-Control', '').lower()
+        forwarded = _upstream_headers()
+        # partial responses are never stored, so range requests skip the cache entirely
+        use_cache = 'Range' not in forwarded
+        cache_key = _cache_key(decoded_url)
+        entry = proxy_cache.cache.get(cache_key) if use_cache else None
+
+        if entry is not None and entry.is_fresh() and 'no-cache' not in client_directives:
+            proxy_cache.cache.record_hit()
+            return _cached_response(entry, 'HIT')
+
+        if entry is not None:
+            forwarded.update(entry.validators())
+        forwarded.update(tracing.outbound_headers())
+        start = time.perf_counter()
+        with tracing.span("proxy upstream", host=urlsplit(decoded_url).hostname) as upstream_span:
+            response = upstream.fetch(decoded_url, headers=forwarded)
+            upstream_span.set(status_code=response.status_code)
+        # until the Response owns it, anything that fails must close the upstream connection here
+        try:
+            metrics.PROXY_SECONDS.observe(time.perf_counter() - start)
+
+            if response.status_code == 304 and entry is not None:
+                response.close()
+                entry = entry.refreshed(response.headers)
+                proxy_cache.cache.put(cache_key, entry)
+                proxy_cache.cache.record_revalidated()
+                return _cached_response(entry, 'REVALIDATED')
+
+            proxy_cache.cache.record_miss()
+            metrics.PROXY_RESPONSES.labels(str(response.status_code), 'MISS').inc()
+
+            headers = upstream.relay_headers(response)
+            cacheable = use_cache and proxy_cache.is_cacheable(response.status_code, headers)
+
+            def generate():
+                body = [] if cacheable else None
+                size = 0
+                try:
+                    for chunk in upstream.iter_body(response):
+                        size += len(chunk)
+                        if body is not None:
+                            if size > proxy_cache.cache.max_entry_bytes:
+                                # too large to cache; stop buffering
+                                body = None
+                            else:
+                                body.append(chunk)
+                        yield chunk
+
+                    if body is not None:
+                        proxy_cache.cache.put(
+                            cache_key,
+                            proxy_cache.CacheEntry.from_response(response.status_code, headers, b''.join(body)),
+                        )
+                except GeneratorExit:
+                    # the client went away mid-stream; closing below drops the upstream socket
+                    upstream.stats.incr("aborted")
+                    raise
+                finally:
+                    metrics.PROXY_BYTES.labels('MISS').inc(size)
+                    response.close()
+
+            proxied = Response(
+                generate(),
+                status=response.status_code,
+                headers=headers
+            )
+            proxied.headers['X-Cache'] = 'MISS'
+            # the generator may never be started if the client disconnects early
+            proxied.call_on_close(response.close)
+            return proxied
+        except Exception:
+            response.close()
+            raise
+
     except Exception:
         # log the detail server-side; return a generic message so we don't leak
         # internal details (paths, hostnames) to the client (CWE-209).
         logger.exception("get_proxy failed to fetch upstream url")
         return {'error': 'Bad Gateway: the proxy could not reach or relay the upstream server.'}, 502
+
+@get_proxy.route('/proxy-stats', methods=['GET'])
+@cross_origin()
+def proxy_stats():
+    return jsonify({"upstream": upstream.stats.snapshot(), "cache": proxy_cache.cache.snapshot()})
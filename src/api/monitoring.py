@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from src import metrics
+
+monitoring = Blueprint('monitoring', __name__)
+
+@monitoring.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import redis
+
+from src.extensions import REDIS_URL
+from src.progress import CHANNEL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL = float(os.environ.get("SPACE_EVENTS_KEEPALIVE", 15))
+MAX_STREAM_SECONDS = float(os.environ.get("SPACE_EVENTS_MAX_SECONDS", 3600))
+RECONNECT_DELAY = 1
+
+
+class ProgressHub:
+    """
+    Fans progress events out to the SSE streams of this web process. A single
+    pattern subscription is shared by every stream, so open streams cost a
+    queue each rather than a Redis connection each.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self._redis_url = redis_url
+        self._streams = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, task_id: str) -> queue.Queue:
+        events = queue.Queue()
+        with self._lock:
+            self._streams[task_id].add(events)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name="progress-hub", daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, task_id: str, events: queue.Queue):
+        with self._lock:
+            streams = self._streams.get(task_id)
+            if streams is None:
+                return
+            streams.discard(events)
+            if not streams:
+                del self._streams[task_id]
+
+    def _dispatch(self, message: dict):
+        task_id = message["channel"][len(CHANNEL_PREFIX):]
+        with self._lock:
+            streams = list(self._streams.get(task_id, ()))
+
+        if streams:
+            event = json.loads(message["data"])
+            for events in streams:
+                events.put(event)
+
+    def _listen(self):
+        while True:
+            try:
+                client = redis.Redis.from_url(self._redis_url, decode_responses=True)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                for message in pubsub.listen():
+                    self._dispatch(message)
+            except redis.RedisError:
+                logger.warning("progress subscription lost, reconnecting", exc_info=True)
+                time.sleep(RECONNECT_DELAY)
+
+
+hub = ProgressHub()
+
+
+def format_event(event: dict, name: str = "progress") -> str:
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import redis
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_BYTES = int(os.environ.get("PROXY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_MAX_ENTRY_BYTES = int(os.environ.get("PROXY_CACHE_MAX_ENTRY_BYTES", 4 * 1024 * 1024))
+CACHE_REDIS_URL = os.environ.get("PROXY_CACHE_REDIS_URL")  # optional shared tier, e.g. redis://redis:6379/1
+CACHE_STALE_TTL = int(os.environ.get("PROXY_CACHE_STALE_TTL", 3600))  # keep stale entries this long for revalidation
+
+# headers that describe the connection or the cache hop rather than the resource
+UNCACHED_HEADERS = {"connection", "keep-alive", "transfer-encoding", "age", "date", "set-cookie"}
+
+
+def _parse_cache_control(value: str | None) -> dict:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else True
+    return directives
+
+
+def _parse_http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _int_or_none(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers) -> float | None:
+    """
+    Seconds a response may be served without revalidation, following the shared
+    cache rules: s-maxage, then max-age, then Expires relative to Date.
+    Returns None when the response must not be stored at all.
+    """
+    headers = CaseInsensitiveDict(headers)
+    directives = _parse_cache_control(headers.get("Cache-Control"))
+
+    if "no-store" in directives or "private" in directives:
+        return None
+
+    if "no-cache" in directives:
+        return 0
+
+    for directive in ("s-maxage", "max-age"):
+        seconds = _int_or_none(directives.get(directive))
+        if seconds is not None:
+            return max(seconds - (_int_or_none(headers.get("Age")) or 0), 0)
+
+    expires = _parse_http_date(headers.get("Expires"))
+    if expires is not None:
+        date = _parse_http_date(headers.get("Date")) or time.time()
+        return max(expires - date, 0)
+
+    # no explicit lifetime; still worth storing if we can revalidate it cheaply
+    if headers.get("ETag") or headers.get("Last-Modified"):
+        return 0
+
+    return None
+
+
+def is_cacheable(status_code: int, headers) -> bool:
+    if status_code != 200:
+        return False
+
+    headers = CaseInsensitiveDict(headers)
+    if headers.get("Set-Cookie"):
+        return False
+
+    vary = {v.strip().lower() for v in (headers.get("Vary") or "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return False
+
+    return freshness_lifetime(headers) is not None
+
+
+class CacheEntry:
+    def __init__(self, status: int, headers, body: bytes, stored_at: float, lifetime: float):
+        self.status = status
+        # upstreams and HTTP/2 gateways may send header names in any case
+        self.headers = CaseInsensitiveDict(headers)
+        self.body = body
+        self.stored_at = stored_at
+        self.lifetime = lifetime
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def etag(self) -> str | None:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> str | None:
+        return self.headers.get("Last-Modified")
+
+    def age(self) -> float:
+        return max(time.time() - self.stored_at, 0)
+
+    def is_fresh(self) -> bool:
+        return self.age() < self.lifetime
+
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def validators(self) -> dict:
+        """
+        Conditional request headers that let the origin answer 304 for this entry.
+        """
+        conditional = {}
+        if self.etag:
+            conditional["If-None-Match"] = self.etag
+        if self.last_modified:
+            conditional["If-Modified-Since"] = self.last_modified
+        return conditional
+
+    def refreshed(self, headers) -> "CacheEntry":
+        """
+        Build the entry that results from a 304: the stored body with the origin's updated headers.
+        """
+        merged = CaseInsensitiveDict(self.headers)
+        merged.update({k: v for k, v in headers.items() if k.lower() not in UNCACHED_HEADERS})
+        lifetime = freshness_lifetime(merged)
+        return CacheEntry(self.status, merged, self.body, time.time(), lifetime or 0)
+
+    def matches(self, if_none_match: str | None, if_modified_since: str | None) -> bool:
+        """
+        Whether a client's own conditional headers are satisfied by this entry.
+        """
+        if if_none_match:
+            candidates = {tag.strip() for tag in if_none_match.split(",")}
+            return "*" in candidates or (self.etag is not None and self.etag in candidates)
+
+        if if_modified_since and self.last_modified:
+            since = _parse_http_date(if_modified_since)
+            modified = _parse_http_date(self.last_modified)
+            return since is not None and modified is not None and modified <= since
+
+        return False
+
+    def dumps(self) -> dict:
+        meta = {
+            "status": self.status,
+            "headers": dict(self.headers),
+            "stored_at": self.stored_at,
+            "lifetime": self.lifetime,
+        }
+        return {"meta": json.dumps(meta), "body": self.body}
+
+    @classmethod
+    def loads(cls, raw: dict) -> "CacheEntry":
+        meta = json.loads(raw[b"meta"])
+        return cls(meta["status"], meta["headers"], raw[b"body"], meta["stored_at"], meta["lifetime"])
+
+    @classmethod
+    def from_response(cls, status: int, headers, body: bytes) -> "CacheEntry":
+        stored = {k: v for k, v in headers.items() if k.lower() not in UNCACHED_HEADERS}
+        return cls(status, stored, body, time.time(), freshness_lifetime(headers) or 0)
+
+
+class ProxyCache:
+    """
+    Byte-bounded in-process LRU of upstream responses, optionally backed by a
+    shared Redis tier so every web process benefits from a single origin fetch.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, redis_url: str | None = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._redis = redis.Redis.from_url(redis_url) if redis_url else None
+        self._stats = {
+            "hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    def _redis_key(self, key: str) -> str:
+        return f"proxy_cache:{key}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key: str, entry: CacheEntry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+
+            self._entries[key] = entry
+            self._bytes += entry.size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._stats["evictions"] += 1
+
+    def get(self, key: str) -> CacheEntry | None:
+        """
+        Look up a stored entry, fresh or stale. Memory is consulted before Redis.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self._redis is None:
+            return None
+
+        try:
+            raw = self._redis.hgetall(self._redis_key(key))
+        except redis.RedisError:
+            logger.warning("proxy cache redis tier unavailable", exc_info=True)
+            return None
+
+        if not raw:
+            return None
+
+        entry = CacheEntry.loads(raw)
+        self._count("redis_hits")
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        if entry.size > self.max_entry_bytes:
+            return
+
+        self._remember(key, entry)
+        self._count("stores")
+
+        if self._redis is None:
+            return
+
+        ttl = int(entry.lifetime) + (CACHE_STALE_TTL if entry.can_revalidate() else 0)
+        if ttl <= 0:
+            return
+
+        try:
+            pipe = self._redis.pipeline()
+            pipe.hset(self._redis_key(key), mapping=entry.dumps())
+            pipe.expire(self._redis_key(key), ttl)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning("proxy cache redis tier unavailable", exc_info=True)
+
+    def record_hit(self):
+        self._count("hits")
+
+    def record_miss(self):
+        self._count("misses")
+
+    def record_revalidated(self):
+        self._count("revalidated")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["revalidated"] + self._stats["misses"]
+            served = self._stats["hits"] + self._stats["revalidated"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+                "redis_tier": self._redis is not None,
+            }
+
+
+cache = ProxyCache(CACHE_MAX_BYTES, CACHE_MAX_ENTRY_BYTES, CACHE_REDIS_URL)
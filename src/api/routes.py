@@ -1,9 +1,11 @@
 from flask import Blueprint
 from src.api.space import space
 from src.api.get_proxy import get_proxy
+from src.api.monitoring import monitoring
 
 api = Blueprint('api', __name__)
 
 def init_app(app):
     app.register_blueprint(space, url_prefix='/api')
-    app.register_blueprint(get_proxy, url_prefix='/api')
\ No newline at end of file
+    app.register_blueprint(get_proxy, url_prefix='/api')
+    app.register_blueprint(monitoring)
\ No newline at end of file
@@ -1,34 +1,182 @@
+import json
+import logging
+import math
+import os
+import queue
+import time
 import traceback
-from flask import Blueprint, request, jsonify
+import uuid
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_cors import cross_origin
-from src.tasks.space_tasks import process_space_creation
-import redis
+from werkzeug.exceptions import RequestEntityTooLarge
+from celery import group, states
+from celery.result import GroupResult
+from src import admission, dedup, jobs, payloads, scheduling, validation
+from src.api.progress_stream import KEEPALIVE_INTERVAL, MAX_STREAM_SECONDS, format_event, hub
+from src.progress import TERMINAL_STAGES
+from src.extensions import celery
+from src.tasks import backend_guard, backend_pool, backend_slots
+from src.config import mantis_hosts
+from src.tasks import signatures
 
 space = Blueprint('space', __name__)
-redis_cache = redis.Redis(host='redis', port=6379, decode_responses=True)
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.environ.get("SPACE_BATCH_MAX_ITEMS", 100))
+
+# Fields given once at the top level of a batch apply to every item that does not set its own
+BATCH_SHARED_FIELDS = ("cookie", "data_types", "large_dataset_mode")
+
+# Dataset bodies accepted besides JSON, by Content-Type. They are handed to the
+# worker undecoded, through the payload store, and parsed there by src/tasks/ingest.py.
+DATASET_FORMATS = {
+    "application/vnd.apache.arrow.stream": ("arrow_stream", None),
+    "application/vnd.apache.arrow.file": ("arrow_file", None),
+    "application/vnd.apache.parquet": ("parquet", None),
+    "application/x-parquet": ("parquet", None),
+    "application/x-ndjson": ("ndjson", None),
+    "application/jsonl": ("ndjson", None),
+    "text/csv": ("csv", None),
+    "application/gzip": ("csv", "gzip"),
+}
+
+def _read_submission():
+    """
+    Create-space payload from the request. Non-JSON bodies carry the dataset,
+    and the remaining fields (name, cookie, data_types, job) come as a JSON
+    object in the X-Space-Options header.
+    """
+    if request.is_json:
+        # Rows are counted while the body streams in; the dict is only built for a valid body
+        return json.loads(validation.read_json_submission(request.stream))
+
+    if request.mimetype not in DATASET_FORMATS:
+        return None
+
+    file_format, compression = DATASET_FORMATS[request.mimetype]
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        compression = 'gzip'
+
+    data = json.loads(request.headers.get('X-Space-Options') or '{}')
+    # Encoded datasets are only counted once the worker decodes them
+    validation.check_options(data)
+    data["dataset"] = {
+        "format": file_format,
+        "compression": compression,
+        "body": request.get_data(),
+    }
+    return data
+
+def _refusal(decision) -> dict:
+    """
+    Why admission control turned a submission away, and when to retry.
+    """
+    messages = {
+        admission.QUEUE_FULL: "The space queue is too long to start this dataset soon.",
+        admission.USER_LIMIT: f"You already have {admission.USER_MAX_INFLIGHT} spaces building.",
+        admission.CAPACITY: "The service is building as many spaces as it can.",
+    }
+    retry_after = math.ceil(decision.retry_after)
+    return {
+        "error": f"{messages[decision.outcome]} Please try again in {retry_after} seconds.",
+        "error_type": decision.outcome,
+        "retry_after": retry_after,
+        **decision.estimate(),
+    }
+
+def _too_many(body: dict, retry_after: int):
+    response = jsonify(body)
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 429
+
+def _overloaded(decision):
+    """
+    429 for a submission turned away by admission control, with when to retry.
+    """
+    refusal = _refusal(decision)
+    return _too_many(refusal, refusal["retry_after"])
+
+def _enqueue(data, task_id):
+    try:
+        signatures.process_space_creation(payloads.offload(data)).apply_async(task_id=task_id)
+    except Exception:
+        admission.release(task_id, data["user"])
+        raise
 
 @space.route('/create-space', methods=['POST'])
 @cross_origin()
 def create_space():
     try:
         # Extract data from the request
-        data = request.json
-        
-        task = process_space_creation.delay(data)
-        
-        return jsonify({"task_id": task.id, "status": "processing"})
-    
+        data = _read_submission()
+        if data is None:
+            return jsonify({
+                "error": f"Unsupported Content-Type '{request.mimetype}'. Send JSON or one of: {', '.join(DATASET_FORMATS)}."
+            }), 415
+
+        if not dedup.enabled():
+            task_id = str(uuid.uuid4())
+            decision = admission.admit(task_id, scheduling.route(data))
+            if not decision.admitted:
+                return _overloaded(decision)
+            _enqueue(data, task_id)
+            return jsonify({"task_id": task_id, "status": "processing", **decision.estimate()})
+
+        # Identical submissions reuse a finished space or join the build already running
+        dedup_key = dedup.submission_key(data)
+
+        finished = dedup.completed(dedup_key)
+        if finished is not None:
+            jobs.record([data.get("job")], finished["space_id"], finished["layer_id"], backend=finished.get("backend"))
+            return jsonify({
+                "task_id": finished["task_id"],
+                "status": "completed",
+                "result": {"space_id": finished["space_id"], "layer_id": finished["layer_id"], "backend": finished.get("backend")},
+                "deduplicated": True,
+            })
+
+        task_id = str(uuid.uuid4())
+        inflight_task_id = dedup.claim(dedup_key, task_id)
+        if inflight_task_id is not None and celery.AsyncResult(inflight_task_id).state in states.PROPAGATE_STATES:
+            # The build this submission would join failed without giving up its claim
+            if dedup.take_over(dedup_key, inflight_task_id, task_id):
+                inflight_task_id = None
+        if inflight_task_id is not None:
+            dedup.attach_job(dedup_key, data.get("job"))
+            return jsonify({"task_id": inflight_task_id, "status": "processing", "deduplicated": True})
+
+        data["dedup_key"] = dedup_key
+        try:
+            decision = admission.admit(task_id, scheduling.route(data))
+            if not decision.admitted:
+                dedup.release(dedup_key)
+                return _overloaded(decision)
+            _enqueue(data, task_id)
+        except Exception:
+            dedup.release(dedup_key)
+            raise
+
+        return jsonify({"task_id": task_id, "status": "processing", **decision.estimate()})
+
+    except validation.Invalid as e:
+        return jsonify(e.response()), 400
+    except RequestEntityTooLarge:
+        return jsonify({
+            "error": f"The request body is larger than the {request.max_content_length:,} bytes accepted.",
+            "error_type": "request_too_large",
+        }), 413
     except Exception as e:
         tb = traceback.format_exc()
         return jsonify({"error": str(e), "stacktrace": tb}), 400
 
-@space.route('/space-task-status/<task_id>', methods=['GET'])
-@cross_origin()
-def task_status(task_id):
-    task = process_space_creation.AsyncResult(task_id)
+def _task_snapshot(task_id):
+    task = celery.AsyncResult(task_id)
     response = {"state": task.state}
 
-    if task.state != 'FAILURE':
+    if task.state == 'PROGRESS':
+        response["progress"] = task.info
+    elif task.state != 'FAILURE':
         if task.info and 'error' in task.info:
             response["stacktrace"] = task.info.get('stacktrace', '')
         else:
@@ -36,20 +184,253 @@ def task_status(task_id):
     else:
         response["error"] = str(task.info)
 
-    return jsonify(response)
+    if task.state in ('PENDING', 'PROGRESS'):
+        queued = task.state == 'PENDING' or (task.info or {}).get("stage") == "queued"
+        estimate = admission.live_estimate(task_id, started=not queued)
+        if estimate is not None:
+            response["estimate"] = estimate
+
+    return response
+
+@space.route('/space-task-status/<task_id>', methods=['GET'])
+@cross_origin()
+def task_status(task_id):
+    return jsonify(_task_snapshot(task_id))
+
+@space.route('/space-task-events/<task_id>', methods=['GET'])
+@cross_origin()
+def task_events(task_id):
+    """
+    Server-Sent Events stream of a task's progress: the current status first,
+    then every stage and progress change until the task finishes.
+    """
+    def stream():
+        # Subscribe only once the response is being sent, so a response that is
+        # never iterated leaves nothing registered with the hub
+        events = None
+        try:
+            events = hub.subscribe(task_id)
+            snapshot = _task_snapshot(task_id)
+            yield format_event(snapshot, "status")
+
+            deadline = time.monotonic() + MAX_STREAM_SECONDS
+            while snapshot["state"] not in ('SUCCESS', 'FAILURE') and time.monotonic() < deadline:
+                try:
+                    event = events.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # A result that landed before the subscription was live ends the stream here
+                    snapshot = _task_snapshot(task_id)
+                    yield format_event(snapshot, "status") if snapshot["state"] in ('SUCCESS', 'FAILURE') else ": keepalive\n\n"
+                    continue
+
+                yield format_event(event)
+                if event.get("stage") in TERMINAL_STAGES:
+                    break
+        finally:
+            if events is not None:
+                hub.unsubscribe(task_id, events)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@space.route('/create-spaces', methods=['POST'])
+@cross_origin()
+def create_spaces():
+    """
+    Create many spaces as one Celery group. Items build in parallel up to the
+    per-backend ceiling (SPACE_BATCH_BACKEND_CONCURRENCY). Each item goes
+    through admission control like a single submission; items that fail
+    validation or are turned away are reported and left out of the batch.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Expected a JSON body with a non-empty list of space specs under 'spaces'"}), 400
+
+        # Each spec is validated while the body streams in, like a /create-space body
+        raw, invalid = validation.read_json_batch(request.stream, BATCH_SHARED_FIELDS, BATCH_MAX_ITEMS)
+        body = json.loads(raw)
+        specs = body.get("spaces") if isinstance(body, dict) else None
+        if not isinstance(specs, list) or not specs:
+            return jsonify({"error": "Expected a JSON body with a non-empty list of space specs under 'spaces'"}), 400
+
+        shared = {field: body[field] for field in BATCH_SHARED_FIELDS if field in body}
+        items, indexes, errors, refusals = [], [], [], []
+        for index, spec in enumerate(specs):
+            if not isinstance(spec, dict) or not isinstance(spec.get("data"), dict):
+                errors.append({"index": index, "error": "Each space needs its dataset as a dict of column lists under 'data'"})
+                continue
+
+            if index in invalid:
+                errors.append({"index": index, **invalid[index].response()})
+                continue
+
+            data = {**shared, **spec, "batch": True}
+
+            task_id = str(uuid.uuid4())
+            decision = admission.admit(task_id, scheduling.route(data))
+            if not decision.admitted:
+                refusal = _refusal(decision)
+                refusals.append(refusal["retry_after"])
+                errors.append({"index": index, **refusal})
+                continue
+
+            items.append((task_id, data))
+            indexes.append(index)
+
+        if not items:
+            if refusals:
+                return _too_many({"error": "No space in the batch could be admitted", "errors": errors}, min(refusals))
+            return jsonify({"error": "No valid spaces in the batch", "errors": errors}), 400
+
+        try:
+            batch = group(
+                signatures.process_space_creation(payloads.offload(data)).set(task_id=task_id)
+                for task_id, data in items
+            ).apply_async(task_id=str(uuid.uuid4()))
+            batch.save()
+        except Exception:
+            for task_id, data in items:
+                admission.release(task_id, data["user"])
+            raise
+
+        task_ids = [None] * len(specs)
+        for index, result in zip(indexes, batch.results):
+            task_ids[index] = result.id
+
+        return jsonify({"batch_id": batch.id, "task_ids": task_ids, "errors": errors, "status": "processing"})
+
+    except validation.Invalid as e:
+        return jsonify(e.response()), 400
+    except RequestEntityTooLarge:
+        return jsonify({
+            "error": f"The request body is larger than the {request.max_content_length:,} bytes accepted.",
+            "error_type": "request_too_large",
+        }), 413
+    except Exception:
+        logger.exception("could not create a batch of spaces")
+        return jsonify({"error": "The batch could not be created because of a server error. Please try again later."}), 500
+
+def _task_metas(task_ids):
+    """
+    Result-backend records for many tasks, in one round trip when the backend
+    supports multi-get.
+    """
+    backend = celery.backend
+    if not hasattr(backend, "mget"):
+        return [backend.get_task_meta(task_id) for task_id in task_ids]
+
+    values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+    return [
+        backend.decode_result(value) if value else {"status": 'PENDING', "result": None}
+        for value in values
+    ]
+
+@space.route('/space-batch-status/<batch_id>', methods=['GET'])
+@cross_origin()
+def batch_status(batch_id):
+    try:
+        batch = GroupResult.restore(batch_id, app=celery)
+        if batch is None:
+            return jsonify({"error": "No batch found for this ID"}), 404
+
+        task_ids = [result.id for result in batch.results]
+        items, counts, progress_total = [], {"pending": 0, "running": 0, "completed": 0, "failed": 0}, 0
+        for task_id, meta in zip(task_ids, _task_metas(task_ids)):
+            status, result = meta["status"], meta.get("result")
+            item = {"task_id": task_id, "state": status}
+
+            if status == 'PROGRESS':
+                counts["running"] += 1
+                item["progress"] = result
+                progress_total += (result or {}).get("progress", 0)
+            elif status == 'SUCCESS' and isinstance(result, dict) and 'error' not in result:
+                counts["completed"] += 1
+                item["result"] = result
+                progress_total += 100
+            elif status in ('SUCCESS', 'FAILURE'):
+                counts["failed"] += 1
+                item["error"] = result.get("error") if isinstance(result, dict) else str(result)
+                progress_total += 100
+            else:
+                counts["pending"] += 1
+
+            items.append(item)
+
+        return jsonify({
+            "batch_id": batch_id,
+            "total": len(items),
+            **counts,
+            "progress": round(progress_total / len(items), 1) if items else 100,
+            "finished": counts["pending"] + counts["running"] == 0,
+            "items": items,
+        })
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        return jsonify({"error": str(e), "stacktrace": tb}), 400
+
+@space.route('/mantis-backend-status', methods=['GET'])
+@cross_origin()
+def mantis_backend_status():
+    try:
+        health = backend_pool.snapshot()
+        backends = []
+        for backend in mantis_hosts():
+            status = backend_guard.snapshot(backend)
+            status["batch_slots_in_use"] = backend_slots.in_use(backend)
+            status["health"] = health[backend]
+            backends.append(status)
+        return jsonify({"backends": backends})
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        return jsonify({"error": str(e), "stacktrace": tb}), 400
+
+@space.route('/space-queues', methods=['GET'])
+@cross_origin()
+def space_queues():
+    try:
+        return jsonify(scheduling.queue_status())
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        return jsonify({"error": str(e), "stacktrace": tb}), 400
 
 @space.route('/get-space-id/<job>', methods=['GET'])
 @cross_origin()
 def get_space_id(job):
     try:
-        space_id = redis_cache.hget(f"job_space_id:{job}", "space_id")
-        layer_id = redis_cache.hget(f"job_space_id:{job}", "layer_id")
+        space_ids = jobs.lookup(job)
 
-        if space_id is None or layer_id is None:
+        if space_ids is None:
             return jsonify({"error": "No space found for this job"}), 404
-        
-        return jsonify({"space_id": space_id, "layer_id": layer_id})
+
+        # Sharded large datasets also list every shard's space
+        return jsonify(space_ids)
     
+    except Exception as e:
+        tb = traceback.format_exc()
+        return jsonify({"error": str(e), "stacktrace": tb}), 400
+
+@space.route('/get-space-ids', methods=['POST'])
+@cross_origin()
+def get_space_ids():
+    try:
+        job_ids = (request.json or {}).get("jobs")
+        if not isinstance(job_ids, list) or not all(isinstance(job_id, str) for job_id in job_ids):
+            return jsonify({"error": "Expected a JSON body with a list of job IDs under 'jobs'"}), 400
+
+        if len(job_ids) > jobs.MAX_BATCH:
+            return jsonify({"error": f"At most {jobs.MAX_BATCH} job IDs can be resolved per request"}), 400
+
+        spaces = jobs.lookup_many(job_ids)
+        return jsonify({
+            "spaces": {job_id: space_ids for job_id, space_ids in spaces.items() if space_ids is not None},
+            "missing": [job_id for job_id, space_ids in spaces.items() if space_ids is None],
+        })
+
     except Exception as e:
         tb = traceback.format_exc()
         return jsonify({"error": str(e), "stacktrace": tb}), 400
\ No newline at end of file
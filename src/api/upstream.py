@@ -0,0 +1,170 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+POOL_CONNECTIONS = int(os.environ.get("PROXY_POOL_CONNECTIONS", 32))  # number of upstream hosts kept warm
+POOL_MAXSIZE = int(os.environ.get("PROXY_POOL_MAXSIZE", 16))  # connections per host
+POOL_BLOCK = os.environ.get("PROXY_POOL_BLOCK", "true").lower() == "true"
+POOL_WAIT = float(os.environ.get("PROXY_POOL_WAIT", 10))  # seconds to wait for a free connection when blocking
+CONNECT_TIMEOUT = float(os.environ.get("PROXY_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("PROXY_READ_TIMEOUT", 30))
+PASSTHROUGH = os.environ.get("PROXY_PASSTHROUGH", "true").lower() == "true"  # relay upstream bytes without decoding
+STREAM_BUFFER_SIZE = int(os.environ.get("PROXY_STREAM_BUFFER_SIZE", 64 * 1024))
+
+# connection-scoped headers that must not be relayed (RFC 9110 section 7.6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class PoolStats:
+    """
+    Thread-safe counters describing how well upstream connections are reused.
+    A checkout that does not open a new connection is a pool hit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.handshakes = 0
+        self.requests = 0
+        self.aborted = 0
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hits = max(self.checkouts - self.handshakes, 0)
+            return {
+                "requests": self.requests,
+                "checkouts": self.checkouts,
+                "handshakes": self.handshakes,
+                "pool_hits": hits,
+                "reuse_rate": round(hits / self.checkouts, 4) if self.checkouts else 0.0,
+                "aborted_streams": self.aborted,
+            }
+
+
+stats = PoolStats()
+
+
+class _CountingConnectionMixin:
+    # connect() runs for brand-new sockets and for pooled sockets the server dropped
+    def connect(self):
+        stats.incr("handshakes")
+        return super().connect()
+
+
+class CountingHTTPConnection(_CountingConnectionMixin, HTTPConnection):
+    pass
+
+
+class CountingHTTPSConnection(_CountingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CountingPoolMixin:
+    def _get_conn(self, timeout=None):
+        stats.incr("checkouts")
+        return super()._get_conn(timeout=POOL_WAIT if timeout is None else timeout)
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose per-host connection pools report checkouts and new connections.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide upstream session, creating it on first use.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = PooledAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE,
+                    pool_block=POOL_BLOCK,
+                    max_retries=0,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+
+    return _session
+
+
+def fetch(url: str, headers: dict | None = None) -> requests.Response:
+    """
+    Open a streaming GET against the upstream using the shared pool.
+    The caller owns the response and must close it.
+    """
+    stats.incr("requests")
+    return get_session().get(
+        url,
+        headers=headers,
+        stream=True,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    )
+
+
+def relay_headers(response: requests.Response) -> CaseInsensitiveDict:
+    """
+    Headers to send downstream. Without passthrough the body is decoded, so the
+    encoding and the encoded length no longer describe it.
+    """
+    headers = CaseInsensitiveDict({k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS})
+
+    if not PASSTHROUGH and headers.pop("Content-Encoding", None) is not None:
+        headers.pop("Content-Length", None)
+
+    return headers
+
+
+def iter_body(response: requests.Response):
+    """
+    Yield the upstream body. In passthrough mode the raw, still-encoded bytes are
+    relayed in STREAM_BUFFER_SIZE chunks instead of being inflated by requests.
+    """
+    if not PASSTHROUGH:
+        yield from response.iter_content(chunk_size=8192, decode_unicode=False)
+        return
+
+    yield from response.raw.stream(STREAM_BUFFER_SIZE, decode_content=False)
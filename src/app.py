@@ -1,6 +1,12 @@
 import logging
 from dotenv import load_dotenv
+
+# Settings are read when src modules are imported, so .env is loaded before any of them
+load_dotenv ()
+load_dotenv (".env.development", override=True) # Load dev if it exists
+
 from flask import Flask
+from src import tracing
 from src.config import get_config
 from src.extensions import cors, make_celery
 from src.api.routes import init_app
@@ -20,14 +26,12 @@ def create_app(config_class=None):
     cors.init_app(app)
     celery = make_celery(app)
     
+    tracing.init_app(app)
     init_app(app)
     
     return app, celery
 
 if __name__ == "__main__":
-    load_dotenv ()
-    load_dotenv (".env.development", override=True) # Load dev if it exists
-
     app, _ = create_app()
 
     app.run(host="0.0.0.0", port=8111, debug=app.config['DEBUG'])
\ No newline at end of file
@@ -4,6 +4,8 @@ class Config:
     DEBUG = False
     TESTING = False
     ENV = 'production'
+    # Bodies past this are refused with 413 before, or while, they are read; 0 removes the limit
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_REQUEST_BYTES", 256 * 1024 * 1024)) or None
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -18,4 +20,30 @@ def get_config():
     if debug:
         return DevelopmentConfig
     
-    return ProductionConfig
\ No newline at end of file
+    return ProductionConfig
+
+def mantis_settings() -> dict:
+    return {
+        "host": os.environ.get("MANTIS_HOST", "https://mantisdev.csail.mit.edu"),
+        "backend_host": os.environ.get("MANTIS_BACKEND_HOST", "https://mantisdev.csail.mit.edu"),
+        "timeout": int(os.environ.get("MANTIS_TIMEOUT", 300000))  # 5 minutes timeout
+    }
+
+def mantis_hosts() -> list[str]:
+    """
+    Mantis backends spaces are balanced across: MANTIS_HOSTS (comma separated),
+    or just MANTIS_HOST when it is unset. MANTIS_HOST keeps MANTIS_BACKEND_HOST
+    as its backend either way; the other hosts serve their own.
+    """
+    settings = mantis_settings()
+    hosts = []
+    for host in os.environ.get("MANTIS_HOSTS", "").split(","):
+        host = host.strip().rstrip("/")
+        if not host:
+            continue
+        # Written the same way as MANTIS_HOST, so its clients find MANTIS_BACKEND_HOST
+        if host == settings["host"].rstrip("/"):
+            host = settings["host"]
+        if host not in hosts:
+            hosts.append(host)
+    return hosts or [settings["host"]]
\ No newline at end of file
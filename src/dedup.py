@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+
+from src import jobs
+from src.extensions import redis_client as redis_cache
+
+DEDUP_WINDOW = int(os.environ.get("SPACE_DEDUP_WINDOW", 3600))  # seconds a finished space is reused; 0 disables
+INFLIGHT_TTL = int(os.environ.get("SPACE_DEDUP_INFLIGHT_TTL", 1800))  # upper bound on a single build
+
+
+# Hand an in-flight claim from a task that died to a new one, or drop it, only
+# while the dead task still holds it
+_TAKE_OVER = redis_cache.register_script("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+""")
+_RELEASE_OWN = redis_cache.register_script("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return 1
+""")
+
+
+def _inflight_key(key: str) -> str:
+    return f"space_dedup:inflight:{key}"
+
+
+def _done_key(key: str) -> str:
+    return f"space_dedup:done:{key}"
+
+
+def _jobs_key(key: str) -> str:
+    return f"space_dedup:jobs:{key}"
+
+
+def _update(digest, value):
+    digest.update(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"))
+    digest.update(b"\x00")
+
+
+def submission_key(data: dict) -> str:
+    """
+    Hash a create-space payload. JSON columns are hashed in name order so that
+    the same table serialized with a different column order maps to the same key;
+    the space name and job ID are deliberately left out.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+
+    dataset = data.get("dataset")
+    if dataset is not None:
+        # encoded bodies are hashed as sent
+        _update(digest, [dataset["format"], dataset.get("compression")])
+        body = dataset["body"]
+        digest.update(body if isinstance(body, bytes) else body.encode("ascii"))
+    else:
+        columns = data.get("data") or {}
+        for column in sorted(columns, key=str):
+            _update(digest, [column, columns[column]])
+
+    _update(digest, data.get("data_types") or {})
+    _update(digest, [
+        data.get("embedding_model") or os.environ.get("MANTIS_EMBEDDING_MODEL", "text-embedding-ada-002"),
+        data.get("chat_model") or os.environ.get("MANTIS_CHAT_MODEL", "gpt-4o-mini"),
+    ])
+    # the cookie identifies the user; only its hash enters the key
+    _update(digest, hashlib.sha256((data.get("cookie") or "").encode("utf-8")).hexdigest())
+
+    return digest.hexdigest()
+
+
+def enabled() -> bool:
+    return DEDUP_WINDOW > 0
+
+
+def completed(key: str) -> dict | None:
+    """
+    Return the finished result for this submission if it was built within the window.
+    """
+    raw = redis_cache.get(_done_key(key))
+    return json.loads(raw) if raw else None
+
+
+def claim(key: str, task_id: str) -> str | None:
+    """
+    Register task_id as the builder for this submission. Returns the ID of the
+    task already building it when another submission got there first.
+    """
+    if redis_cache.set(_inflight_key(key), task_id, nx=True, ex=INFLIGHT_TTL):
+        return None
+
+    return redis_cache.get(_inflight_key(key))
+
+
+def take_over(key: str, dead_task_id: str, task_id: str) -> bool:
+    """
+    Make task_id the builder of a submission whose in-flight task has failed.
+    Jobs that attached to the failed build are mapped to the new one. Returns
+    False when another submission took the claim first.
+    """
+    return bool(_TAKE_OVER(keys=[_inflight_key(key)], args=[dead_task_id, task_id, INFLIGHT_TTL]))
+
+
+def attach_job(key: str, job_id: str | None):
+    """
+    Remember a job that joined an in-flight build so it is mapped to the space too.
+    """
+    if job_id is None:
+        return
+
+    pipe = redis_cache.pipeline()
+    pipe.sadd(_jobs_key(key), job_id)
+    pipe.expire(_jobs_key(key), INFLIGHT_TTL)
+    pipe.execute()
+
+
+def attached_jobs(key: str) -> set[str]:
+    return redis_cache.smembers(_jobs_key(key))
+
+
+def complete(key: str, task_id: str, result: dict):
+    """
+    Publish a finished build for reuse and release the in-flight claim. Jobs that
+    attached after the space ID was announced are mapped here.
+    """
+    record = {"task_id": task_id, "space_id": result["space_id"], "layer_id": result["layer_id"], "backend": result.get("backend")}
+
+    jobs.record(attached_jobs(key), record["space_id"], record["layer_id"], backend=record["backend"])
+
+    pipe = redis_cache.pipeline()
+    pipe.set(_done_key(key), json.dumps(record), ex=DEDUP_WINDOW)
+    pipe.delete(_inflight_key(key))
+    pipe.delete(_jobs_key(key))
+    pipe.execute()
+
+
+def release(key: str, task_id: str | None = None):
+    """
+    Drop the in-flight claim after a failed build so the next submission retries.
+    With task_id, only while that task still holds it.
+    """
+    if task_id is not None:
+        _RELEASE_OWN(keys=[_inflight_key(key), _jobs_key(key)], args=[task_id])
+        return
+
+    pipe = redis_cache.pipeline()
+    pipe.delete(_inflight_key(key))
+    pipe.delete(_jobs_key(key))
+    pipe.execute()
@@ -1,20 +1,41 @@
 from flask_cors import CORS
 from celery import Celery
 import os
+import redis
+
+from src import tracing
 
 cors = CORS()
 celery = Celery()
 
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 32))
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+
+# One bounded connection pool per process, shared by every module that talks to Redis
+redis_pool = redis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    decode_responses=True,
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
 def make_celery(app):
     celery.conf.update(
         broker_url=os.environ.get('CELERY_BROKER_URL'),
-        result_backend=os.environ.get('CELERY_RESULT_BACKEND')
+        result_backend=os.environ.get('CELERY_RESULT_BACKEND'),
+        # Loaded by the worker only; the web tier enqueues by name (src.tasks.signatures)
+        imports=('src.tasks.space_tasks',),
+        # Workers reserve one task at a time so a burst of large spaces is not
+        # hoarded by one process while others sit idle
+        worker_prefetch_multiplier=int(os.environ.get('CELERY_PREFETCH_MULTIPLIER', 1)),
     )
     
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
-            with app.app_context():
+            with app.app_context(), tracing.task_span(self):
                 return self.run(*args, **kwargs)
     
     celery.Task = ContextTask
-    return celery
\ No newline at end of file
+    return celery
@@ -0,0 +1,62 @@
+import json
+import os
+
+from src.extensions import redis_client
+
+JOB_TTL = int(os.environ.get("SPACE_JOB_TTL", 7 * 24 * 3600))  # seconds a job's space mapping is kept
+MAX_BATCH = int(os.environ.get("SPACE_JOB_MAX_BATCH", 500))
+
+
+def _key(job_id: str) -> str:
+    return f"job_space_id:{job_id}"
+
+
+def _decode(mapping: dict) -> dict | None:
+    if "space_id" not in mapping or "layer_id" not in mapping:
+        return None
+
+    space = {"space_id": mapping["space_id"], "layer_id": mapping["layer_id"]}
+    if "backend" in mapping:
+        space["backend"] = mapping["backend"]
+    if "shards" in mapping:
+        space["shards"] = json.loads(mapping["shards"])
+    return space
+
+
+def record(job_ids, space_id: str, layer_id: str, shards: list | None = None, backend: str | None = None):
+    """
+    Map one or more jobs to a space in a single round trip. None entries are
+    skipped so callers can pass optional job IDs straight through. backend is
+    the Mantis host the space was built on, which clients open it from.
+    """
+    if isinstance(job_ids, str):
+        job_ids = [job_ids]
+
+    mapping = {"space_id": space_id, "layer_id": layer_id}
+    if backend is not None:
+        mapping["backend"] = backend
+    if shards is not None:
+        mapping["shards"] = json.dumps(shards)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for job_id in job_ids:
+        if job_id is None:
+            continue
+        pipe.hset(_key(job_id), mapping=mapping)
+        pipe.expire(_key(job_id), JOB_TTL)
+    pipe.execute()
+
+
+def lookup(job_id: str) -> dict | None:
+    return _decode(redis_client.hgetall(_key(job_id)))
+
+
+def lookup_many(job_ids: list[str]) -> dict[str, dict | None]:
+    """
+    Resolve many jobs with one pipelined round trip. Unknown jobs map to None.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(_key(job_id))
+
+    return {job_id: _decode(mapping) for job_id, mapping in zip(job_ids, pipe.execute())}
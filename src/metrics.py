@@ -0,0 +1,142 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from celery.signals import before_task_publish, task_prerun, worker_process_shutdown, worker_ready
+from src import tracing
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
+
+# Set PROMETHEUS_MULTIPROC_DIR (to an empty directory) for processes that fork,
+# such as the prefork Celery worker, so every child's samples are aggregated
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", 9808))
+
+# Space builds take seconds to tens of minutes
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+STAGE_SECONDS = Histogram(
+    "space_stage_seconds",
+    "Time spent in each stage of a space build",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+MANTIS_REQUESTS = Counter(
+    "mantis_requests_total",
+    "Requests to the Mantis backend by kind and outcome",
+    ["kind", "outcome"],
+)
+MANTIS_FALLBACKS = Counter(
+    "mantis_fallbacks_total",
+    "Failed Mantis requests answered with a substitute response",
+    ["endpoint"],
+)
+MANTIS_CLIENT_POOL = Counter(
+    "mantis_client_pool_total",
+    "Mantis client pool lookups: reused (hit), created (miss) or evicted",
+    ["outcome"],
+)
+SPACE_RETRIES = Counter(
+    "space_retries_total",
+    "Retries during space builds",
+    ["stage", "reason"],
+)
+PROXY_SECONDS = Histogram(
+    "proxy_upstream_seconds",
+    "get_proxy time to upstream response headers",
+    buckets=REQUEST_BUCKETS,
+)
+PROXY_RESPONSES = Counter(
+    "proxy_responses_total",
+    "get_proxy responses by status code and cache result",
+    ["status", "cache"],
+)
+PROXY_BYTES = Counter(
+    "proxy_response_bytes_total",
+    "Body bytes relayed by get_proxy",
+    ["cache"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "celery_queue_wait_seconds",
+    "Time tasks spent in the queue after they were due to run",
+    ["task"],
+    buckets=STAGE_BUCKETS,
+)
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def endpoint_label(endpoint: str) -> str:
+    """
+    Endpoint without its IDs, e.g. synthesis/progress/<id> -> synthesis/progress.
+    """
+    parts = (endpoint or "").strip("/").split("/")
+    return "/".join(parts[:2])
+
+
+def registry():
+    if not MULTIPROC_DIR:
+        from prometheus_client import REGISTRY
+        return REGISTRY
+
+    from prometheus_client import multiprocess
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+@before_task_publish.connect
+def _stamp_published(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def _observe_queue_wait(task=None, **kwargs):
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is None:
+        return
+
+    # Countdown stages are not late while they wait for their ETA
+    due = published_at
+    eta = getattr(task.request, "eta", None)
+    if eta:
+        due = max(due, datetime.fromisoformat(eta).timestamp())
+
+    QUEUE_WAIT_SECONDS.labels(task.name.rsplit(".", 1)[-1]).observe(max(time.time() - due, 0))
+
+
+@worker_ready.connect
+def _start_worker_exporter(**kwargs):
+    start_http_server(WORKER_METRICS_PORT, registry=registry())
+    logger.info("worker metrics exported on port %s", WORKER_METRICS_PORT)
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid=None, **kwargs):
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,188 @@
+import base64
+import json
+import os
+import struct
+import time
+import uuid
+import zlib
+
+import redis
+
+from src.extensions import REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_URL
+
+PAYLOAD_STORE = os.environ.get("SPACE_PAYLOAD_STORE", "redis")  # "redis", "volume" or "inline"
+PAYLOAD_TTL = int(os.environ.get("SPACE_PAYLOAD_TTL", 7200))  # backstop for payloads no task picked up
+PAYLOAD_DIR = os.environ.get("SPACE_PAYLOAD_DIR", "/app/.payloads")
+COMPRESSION_LEVEL = 1
+# Volume payloads past PAYLOAD_TTL are swept at most this often, by whichever process writes next
+VOLUME_SWEEP_INTERVAL = 60
+
+# Bodies in these formats are already compact; compressing them again only costs time
+PRECOMPRESSED_FORMATS = {"parquet"}
+
+# Fields small enough to ride along in the broker message; the stages after
+# the upload, and scheduling before it, only need these
+MESSAGE_FIELDS = ("job", "dedup_key", "batch", "queue", "user")
+
+# Blobs hold binary data, so this client does not decode responses
+redis_blobs = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+    REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+))
+
+
+class PayloadMissing(Exception):
+    pass
+
+
+def _key(ref: str) -> str:
+    return f"space_payload:{ref}"
+
+
+def _path(ref: str) -> str:
+    return os.path.join(PAYLOAD_DIR, ref)
+
+
+def _json_default(value):
+    """
+    Values the worker puts in shard payloads that plain json cannot encode,
+    encoded the way the Celery message serializer did: timestamps as ISO 8601
+    strings and numpy scalars as Python numbers. Pandas and numpy are not
+    imported, so the web tier stays free of them.
+    """
+    if hasattr(value, "isoformat"):
+        # NaT is not equal to itself
+        return value.isoformat() if value == value else None
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_last_sweep = 0.0
+
+
+def _sweep_volume():
+    """
+    Delete volume payloads older than PAYLOAD_TTL, such as those of tasks that
+    were revoked or failed before loading them, as Redis expires its blobs.
+    """
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < VOLUME_SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+
+    try:
+        entries = list(os.scandir(PAYLOAD_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < now - PAYLOAD_TTL:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            # claimed or swept by another process meanwhile
+            pass
+
+
+def _pack(data: dict) -> bytes:
+    """
+    One blob per submission: a length-prefixed, compressed JSON header with every
+    field but the dataset body, then the body itself.
+    """
+    fields = dict(data)
+    body = b""
+    dataset = fields.get("dataset")
+    if dataset is not None:
+        dataset = fields["dataset"] = dict(dataset)
+        body = dataset.pop("body")
+        if dataset.get("compression") is None and dataset["format"] not in PRECOMPRESSED_FORMATS:
+            body = zlib.compress(body, COMPRESSION_LEVEL)
+            dataset["body_encoding"] = "zlib"
+
+    header = zlib.compress(json.dumps(fields, default=_json_default).encode("utf-8"), COMPRESSION_LEVEL)
+    return struct.pack("!I", len(header)) + header + body
+
+
+def _unpack(blob: bytes) -> dict:
+    (header_size,) = struct.unpack_from("!I", blob)
+    data = json.loads(zlib.decompress(blob[4:4 + header_size]))
+
+    dataset = data.get("dataset")
+    if dataset is not None:
+        body = blob[4 + header_size:]
+        if dataset.pop("body_encoding", None) == "zlib":
+            body = zlib.decompress(body)
+        dataset["body"] = body
+
+    return data
+
+
+def offload(data: dict) -> dict:
+    """
+    Store a create-space payload and return the small message to enqueue in its
+    place. A dataset body may be raw bytes; with the inline store it is base64
+    encoded so the message stays JSON.
+    """
+    if PAYLOAD_STORE == "inline":
+        dataset = data.get("dataset")
+        if dataset is not None and isinstance(dataset["body"], bytes):
+            data = {**data, "dataset": {**dataset, "body": base64.b64encode(dataset["body"]).decode("ascii")}}
+        return data
+
+    ref = uuid.uuid4().hex
+    blob = _pack(data)
+
+    if PAYLOAD_STORE == "volume":
+        _sweep_volume()
+        os.makedirs(PAYLOAD_DIR, exist_ok=True)
+        partial = _path(ref) + ".partial"
+        with open(partial, "wb") as payload_file:
+            payload_file.write(blob)
+        os.replace(partial, _path(ref))
+    else:
+        redis_blobs.set(_key(ref), blob, ex=PAYLOAD_TTL)
+
+    message = {field: data.get(field) for field in MESSAGE_FIELDS}
+    message["payload"] = ref
+    return message
+
+
+def load(message: dict) -> dict:
+    """
+    Full payload for an enqueued message. Messages without a reference are
+    returned unchanged.
+    """
+    ref = message.get("payload")
+    if ref is None:
+        return message
+
+    if PAYLOAD_STORE == "volume":
+        try:
+            with open(_path(ref), "rb") as payload_file:
+                blob = payload_file.read()
+        except FileNotFoundError:
+            blob = None
+    else:
+        blob = redis_blobs.get(_key(ref))
+
+    if blob is None:
+        raise PayloadMissing(f"Dataset payload {ref} expired or was already consumed. Please submit the dataset again.")
+
+    return {**_unpack(blob), **message}
+
+
+def discard(message: dict):
+    """
+    Delete a message's payload once its task no longer needs it.
+    """
+    ref = message.get("payload")
+    if ref is None:
+        return
+
+    if PAYLOAD_STORE == "volume":
+        try:
+            os.unlink(_path(ref))
+        except FileNotFoundError:
+            pass
+    else:
+        redis_blobs.delete(_key(ref))
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+# Settings are read when src modules are imported, so .env is loaded before any of them
+load_dotenv ()
+load_dotenv (".env.development", override=True) # Load dev if it exists
+
+import httpx
+import redis.asyncio as aioredis
+from celery.backends.redis import RedisBackend
+
+from src import metrics, tracing
+from src.extensions import REDIS_URL
+from src.progress import channel
+from src.tasks import backend_guard, backend_pool
+from src.worker import celery
+from src.tasks.mantis_client import make_client
+from src.tasks.space_tasks import (
+    MAX_RETRIES,
+    POLLER_SPACES_KEY,
+    SYNTHESIS_DEADLINE,
+    TIMEOUT_ERROR,
+    finalize_space_creation,
+)
+
+logger = logging.getLogger(__name__)
+
+MIN_INTERVAL = float(os.environ.get("SPACE_POLLER_MIN_INTERVAL", 0.5))
+MAX_INTERVAL = float(os.environ.get("SPACE_POLLER_MAX_INTERVAL", 15))
+SCAN_INTERVAL = float(os.environ.get("SPACE_POLLER_SCAN_INTERVAL", 1))
+MAX_CONNECTIONS = int(os.environ.get("SPACE_POLLER_MAX_CONNECTIONS", 64))
+REQUEST_TIMEOUT = float(os.environ.get("SPACE_POLLER_REQUEST_TIMEOUT", 30))
+METRICS_PORT = int(os.environ.get("SPACE_POLLER_METRICS_PORT", 9809))
+UMAP_THRESHOLD = 50
+
+# weight of the newest observation in the smoothed progress rate
+RATE_SMOOTHING = 0.5
+
+
+class TrackedSpace:
+    """
+    Poll schedule for one in-flight space. The interval follows the observed
+    progress rate so checks bunch up just before the next milestone (UMAP
+    selection at 50%, completion at 100%) and thin out during long phases.
+    """
+
+    def __init__(self, task_id: str, state: dict):
+        self.task_id = task_id
+        self.state = state
+        self.client = make_client(state["cookie"], state.get("backend"))
+        self.progress = 0
+        self.rate = None  # percent per second
+        self.checked_at = None
+        self.interval = MIN_INTERVAL
+
+    def observe(self, progress: int, now: float):
+        if self.checked_at is not None and now > self.checked_at:
+            rate = max(progress - self.progress, 0) / (now - self.checked_at)
+            self.rate = rate if self.rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate
+
+        self.progress = progress
+        self.checked_at = now
+        self.interval = self._next_interval()
+
+    def _next_interval(self) -> float:
+        milestone = UMAP_THRESHOLD if not self.state["chose_umap"] and self.progress < UMAP_THRESHOLD else 100
+
+        if self.rate:
+            # aim to land about halfway to the milestone, then tighten as it approaches
+            interval = (milestone - self.progress) / self.rate / 2
+        else:
+            interval = self.interval * 1.5
+
+        return min(max(interval, MIN_INTERVAL), MAX_INTERVAL)
+
+
+def _result_store():
+    """
+    asyncio client for the Celery result backend when it is Redis, else None.
+    """
+    url = celery.conf.result_backend or ""
+    if not isinstance(celery.backend, RedisBackend) or not url.startswith(("redis://", "rediss://")):
+        return None
+    return aioredis.Redis.from_url(celery.conf.result_backend)
+
+
+class ProgressPoller:
+    """
+    Drives every in-flight space registered by the workers over a single pooled
+    HTTP client, then completes the logical Celery task through finalize_space_creation.
+    """
+
+    def __init__(self):
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=REQUEST_TIMEOUT,
+        )
+        self.redis = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+        # The guard and health scripts run on this loop's client rather than in threads
+        self.guard = backend_guard.AsyncGuard(self.redis)
+        self.health = backend_pool.AsyncHealth(self.redis)
+        self.results = _result_store()
+        self.tracked: dict[str, asyncio.Task] = {}
+
+    async def run(self):
+        try:
+            while True:
+                spaces = await self.redis.hgetall(POLLER_SPACES_KEY)
+                for task_id, raw in spaces.items():
+                    if task_id not in self.tracked:
+                        space = TrackedSpace(task_id, json.loads(raw))
+                        self.tracked[task_id] = asyncio.create_task(self.track(space))
+
+                await asyncio.sleep(SCAN_INTERVAL)
+        finally:
+            await self.http.aclose()
+            await self.redis.aclose()
+            if self.results is not None:
+                await self.results.aclose()
+
+    async def request(self, space: TrackedSpace, method: str, endpoint: str, rm_slash: bool = False, **kwargs):
+        backend = space.client.host
+        while True:
+            try:
+                await self.guard.before_request(backend, backend_guard.request_kind(method, endpoint))
+                break
+            except backend_guard.BackendBusy as e:
+                await asyncio.sleep(e.retry_after)
+
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"mantis {method.upper()} {metrics.endpoint_label(endpoint)}", backend=backend) as request_span:
+                response = await self.http.request(
+                    method,
+                    space.client.request_url(endpoint, rm_slash=rm_slash),
+                    headers=space.client.request_headers(),
+                    **kwargs,
+                )
+                request_span.set(status_code=response.status_code)
+        except httpx.TimeoutException:
+            await self.guard.record_failure(backend)
+            await self.health.record(backend, False, time.perf_counter() - start)
+            raise
+
+        if response.status_code == 504:
+            await self.guard.record_failure(backend)
+        else:
+            await self.guard.record_success(backend)
+        await self.health.record(backend, response.status_code < 500, time.perf_counter() - start)
+
+        if response.status_code not in (200, 201):
+            message = f"Request failed with status code {response.status_code}: {response.text}"
+            fallback = space.client._fallback_response(method, endpoint, response.status_code, message)
+            if fallback is not None:
+                return fallback
+            raise RuntimeError(message)
+
+        return response.json()
+
+    async def select_umap(self, space: TrackedSpace) -> bool:
+        umap_variations = await self.request(space, "GET", f"synthesis/parameters/{space.state['space_id']}")
+        parameters = (umap_variations.get("umap_variations") or {}).get("parameters")
+        if not parameters:
+            return False
+
+        chosen_parameter = space.client._default_parameter_selection(parameters)
+        await self.request(
+            space,
+            "POST",
+            f"synthesis/landscape/{space.state['space_id']}/select-umap/{chosen_parameter}",
+            rm_slash=True,
+            json={"selected_variation": chosen_parameter, "layer_id": space.state["layer_id"], "floor_number": 1},
+        )
+
+        return True
+
+    async def report(self, space: TrackedSpace, stage: str):
+        meta = {
+            "stage": stage,
+            "progress": space.progress,
+            "space_id": space.state["space_id"],
+            "layer_id": space.state["layer_id"],
+            "backend": space.client.host,
+        }
+        await self.store_progress(space.task_id, meta)
+        await self.redis.publish(channel(space.task_id), json.dumps(meta))
+
+    async def store_progress(self, task_id: str, meta: dict):
+        """
+        Record the PROGRESS state in the result backend, as Task.update_state
+        would. A Redis result backend is written from the event loop.
+        """
+        if self.results is None:
+            await asyncio.to_thread(celery.backend.store_result, task_id, meta, 'PROGRESS')
+            return
+
+        backend = celery.backend
+        key = backend.get_key_for_task(task_id)
+        value = backend.encode({
+            "status": 'PROGRESS',
+            "result": meta,
+            "traceback": None,
+            "children": [],
+            "date_done": None,
+            "task_id": task_id,
+        })
+        async with self.results.pipeline(transaction=False) as pipe:
+            if backend.expires:
+                pipe.setex(key, int(backend.expires), value)
+            else:
+                pipe.set(key, value)
+            pipe.publish(key, value)
+            await pipe.execute()
+
+    async def drive(self, space: TrackedSpace) -> dict | None:
+        """
+        Poll one space until it finishes. Returns the error that ended it, if any.
+        """
+        while True:
+            if time.time() - space.state["started_at"] > SYNTHESIS_DEADLINE:
+                return {
+                    "error": f"Space synthesis did not finish within {SYNTHESIS_DEADLINE} seconds.",
+                    "error_type": "timeout",
+                    "space_id": space.state["space_id"],
+                }
+
+            await asyncio.sleep(space.interval)
+
+            try:
+                progress = await self.request(space, "GET", f"synthesis/progress/{space.state['space_id']}")
+            except (httpx.TimeoutException, RuntimeError) as e:
+                if isinstance(e, RuntimeError) and not space.client.is_timeout_error(str(e)):
+                    raise
+
+                space.state["timeouts"] += 1
+                if space.state["timeouts"] > MAX_RETRIES:
+                    return {**TIMEOUT_ERROR, "retry_count": space.state["timeouts"]}
+
+                space.interval = min(space.interval + backend_guard.backoff_delay(space.state["timeouts"]), MAX_INTERVAL)
+                continue
+
+            if progress.get("error"):
+                return {"error": str(progress["error"])}
+
+            progress_value = progress.get("progress", 0)
+            if progress_value == 0 and space.state["chose_umap"]:
+                return {
+                    "error": "Progress reset to 0 after UMAP selection; possible backend regression or unexpected reset."
+                }
+
+            if progress_value >= UMAP_THRESHOLD and not space.state["chose_umap"]:
+                with metrics.timed("select_umap"):
+                    space.state["chose_umap"] = await self.select_umap(space)
+                if space.state["chose_umap"]:
+                    metrics.STAGE_SECONDS.labels("time_to_umap").observe(time.time() - space.state["started_at"])
+                    await self.redis.hset(POLLER_SPACES_KEY, space.task_id, json.dumps(space.state))
+
+            if progress_value >= 100:
+                return None
+
+            changed = progress_value != space.progress
+            space.observe(progress_value, time.time())
+            if changed:
+                await self.report(space, "umap_selected" if space.state["chose_umap"] else "synthesis")
+
+    async def track(self, space: TrackedSpace):
+        # finalize_space_creation is sent inside the span so it joins the same trace
+        with tracing.span("poll space", trace_id=space.state.get("trace_id"), task_id=space.task_id):
+            try:
+                error = await self.drive(space)
+            except Exception as e:
+                logger.exception("progress poller failed for task %s", space.task_id)
+                error = {"error": str(e), "stacktrace": traceback.format_exc()}
+
+            try:
+                await asyncio.to_thread(
+                    finalize_space_creation.apply_async,
+                    args=[space.state],
+                    kwargs={"error": error},
+                    task_id=space.task_id,
+                )
+                await self.redis.hdel(POLLER_SPACES_KEY, space.task_id)
+            finally:
+                self.tracked.pop(space.task_id, None)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    metrics.start_http_server(METRICS_PORT, registry=metrics.registry())
+    asyncio.run(ProgressPoller().run())
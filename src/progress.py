@@ -0,0 +1,28 @@
+import json
+import logging
+
+import redis
+
+from src.extensions import redis_client
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "space_progress:"
+
+# Stages after which no further events are published for a task
+TERMINAL_STAGES = ("done", "error")
+
+
+def channel(task_id: str) -> str:
+    return f"{CHANNEL_PREFIX}{task_id}"
+
+
+def publish(task_id: str, event: dict):
+    """
+    Push a progress event to clients streaming this task. Progress is best
+    effort and must never fail the task that reports it.
+    """
+    try:
+        redis_client.publish(channel(task_id), json.dumps(event))
+    except redis.RedisError:
+        logger.warning("could not publish progress for task %s", task_id, exc_info=True)
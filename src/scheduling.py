@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+
+import redis
+from kombu.exceptions import ChannelError
+
+from src.extensions import celery, redis_client
+from src.tasks import ingest
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SMALL = "spaces.small"
+QUEUE_MEDIUM = "spaces.medium"
+QUEUE_LARGE = "spaces.large"
+SPACE_QUEUES = (QUEUE_SMALL, QUEUE_MEDIUM, QUEUE_LARGE)
+
+# Cost is the estimated number of characters to embed: rows x semantic columns x text length
+SMALL_MAX_COST = int(os.environ.get("SPACE_QUEUE_SMALL_MAX_COST", 2_000_000))
+MEDIUM_MAX_COST = int(os.environ.get("SPACE_QUEUE_MEDIUM_MAX_COST", 20_000_000))
+
+# Upload stages one user may run at once across all workers; the rest go back in the queue
+USER_WORKER_SLOTS = int(os.environ.get("SPACE_USER_WORKER_SLOTS", 2))
+USER_SLOT_RETRY = float(os.environ.get("SPACE_USER_SLOT_RETRY", 5))
+USER_SLOT_LEASE = int(os.environ.get("SPACE_USER_SLOT_LEASE", 1800))
+
+# Worker processes consuming each queue, e.g. "spaces.small=4,spaces.medium=4,spaces.large=1"
+QUEUE_CONCURRENCY = {
+    queue: int(count)
+    for queue, _, count in (
+        item.strip().partition("=") for item in os.environ.get("SPACE_QUEUE_CONCURRENCY", "").split(",") if "=" in item
+    )
+}
+
+# Upload-stage seconds assumed per queue until durations have been observed
+DEFAULT_STAGE_SECONDS = {QUEUE_SMALL: 15, QUEUE_MEDIUM: 60, QUEUE_LARGE: 300}
+STAGE_SECONDS_KEY = "space_queue_seconds"
+EWMA_WEIGHT = 0.2
+
+# DataType.Semantic and DataType.CustomModel; the web tier does not import the SDK
+SEMANTIC_TYPES = {"semantic", "custommodel"}
+TEXT_SAMPLE_SIZE = 200
+# Binary bodies are costed by size; compressed formats hold several times their size in text
+COMPRESSED_SIZE_FACTOR = 4
+COMPRESSED_FORMATS = {ingest.PARQUET, ingest.ARROW_STREAM, ingest.ARROW_FILE}
+
+
+def _is_semantic(data_type) -> bool:
+    name = str(getattr(data_type, "value", data_type)).rsplit(".", 1)[-1]
+    return name.lower().replace("_", "") in SEMANTIC_TYPES
+
+
+def estimate_cost(data: dict) -> int:
+    """
+    Rough embedding cost of a create-space payload, computed without parsing
+    binary datasets.
+    """
+    dataset = data.get("dataset")
+    if dataset is not None:
+        body = dataset.get("body") or b""
+        compressed = dataset.get("compression") is not None or dataset.get("format") in COMPRESSED_FORMATS
+        return len(body) * (COMPRESSED_SIZE_FACTOR if compressed else 1)
+
+    columns = data.get("data")
+    if not isinstance(columns, dict) or not columns:
+        return 0
+
+    rows = max((len(values) for values in columns.values() if isinstance(values, list)), default=0)
+    data_types = data.get("data_types") or {}
+
+    text_length = 0
+    for column, values in columns.items():
+        if not _is_semantic(data_types.get(column)) or not isinstance(values, list):
+            continue
+        sample = [str(value) for value in values[:TEXT_SAMPLE_SIZE] if value is not None]
+        if sample:
+            text_length += sum(len(value) for value in sample) / len(sample)
+
+    return int(rows * max(text_length, 1))
+
+
+def queue_for(cost: int) -> str:
+    if cost <= SMALL_MAX_COST:
+        return QUEUE_SMALL
+    if cost <= MEDIUM_MAX_COST:
+        return QUEUE_MEDIUM
+    return QUEUE_LARGE
+
+
+def user_key(cookie: str | None) -> str:
+    """
+    Stable, non-reversible identity for fair scheduling; the cookie is the only
+    notion of a user the service has.
+    """
+    return hashlib.sha256((cookie or "").encode("utf-8")).hexdigest()[:16]
+
+
+def route(data: dict) -> dict:
+    """
+    Stamp a create-space payload with its queue and user before it is offloaded.
+    """
+    data["queue"] = queue_for(estimate_cost(data))
+    data["user"] = user_key(data.get("cookie"))
+    return data
+
+
+def observe(queue: str | None, seconds: float):
+    """
+    Fold an upload stage's duration into its queue's moving average.
+    """
+    if queue not in SPACE_QUEUES:
+        return
+
+    try:
+        previous = redis_client.hget(STAGE_SECONDS_KEY, queue)
+        average = seconds if previous is None else (1 - EWMA_WEIGHT) * float(previous) + EWMA_WEIGHT * seconds
+        redis_client.hset(STAGE_SECONDS_KEY, queue, average)
+    except redis.RedisError:
+        logger.warning("could not record stage duration for %s", queue, exc_info=True)
+
+
+def _depths(queues) -> dict:
+    depths = {}
+    # Status is read on every create-space and status poll, so it reuses the app's broker pool
+    with celery.pool.acquire(block=True) as connection:
+        channel = connection.default_channel
+        for queue in queues:
+            try:
+                depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+            except ChannelError:
+                # the broker has not seen the queue yet, or dropped it while empty
+                depths[queue] = 0
+    return depths
+
+
+def queue_status(queues=SPACE_QUEUES) -> dict:
+    """
+    Depth and estimated wait of each space queue. The wait assumes the queue's
+    workers (SPACE_QUEUE_CONCURRENCY) work through it at the recent average
+    upload-stage duration.
+    """
+    queues = list(queues)
+    depths = _depths(queues)
+    averages = redis_client.hmget(STAGE_SECONDS_KEY, queues)
+
+    status = {}
+    for queue, average in zip(queues, averages):
+        seconds = float(average) if average is not None else DEFAULT_STAGE_SECONDS[queue]
+        status[queue] = {
+            "depth": depths[queue],
+            "average_stage_seconds": round(seconds, 1),
+            "estimated_wait_seconds": round(depths[queue] * seconds / max(QUEUE_CONCURRENCY.get(queue, 1), 1), 1),
+        }
+    return status
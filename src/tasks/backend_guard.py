@@ -0,0 +1,269 @@
+import logging
+import os
+import random
+import time
+
+import redis
+
+from src.extensions import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Token buckets shared by every worker, per backend and kind of call: landscape
+# creations are expensive for the backend, progress polls are cheap but frequent
+LANDSCAPE_RATE = float(os.environ.get("MANTIS_LANDSCAPE_RATE", 0.5))  # tokens per second
+LANDSCAPE_BURST = float(os.environ.get("MANTIS_LANDSCAPE_BURST", 5))
+POLL_RATE = float(os.environ.get("MANTIS_POLL_RATE", 20))
+POLL_BURST = float(os.environ.get("MANTIS_POLL_BURST", 40))
+
+# The breaker opens after BREAKER_THRESHOLD timeouts/504s within BREAKER_WINDOW
+# seconds, rejects calls for BREAKER_COOLDOWN seconds, then lets one probe through
+BREAKER_THRESHOLD = int(os.environ.get("MANTIS_BREAKER_THRESHOLD", 5))
+BREAKER_WINDOW = int(os.environ.get("MANTIS_BREAKER_WINDOW", 60))
+BREAKER_COOLDOWN = float(os.environ.get("MANTIS_BREAKER_COOLDOWN", 30))
+PROBE_TIMEOUT = 300
+
+BACKOFF_BASE = float(os.environ.get("MANTIS_BACKOFF_BASE", 1))
+BACKOFF_CAP = float(os.environ.get("MANTIS_BACKOFF_CAP", 60))
+
+LANDSCAPE = "landscape"
+POLL = "poll"
+
+BUCKETS = {
+    LANDSCAPE: (LANDSCAPE_RATE, LANDSCAPE_BURST),
+    POLL: (POLL_RATE, POLL_BURST),
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BackendBusy(Exception):
+    """
+    The backend is rate limited or its circuit is open. Callers re-enqueue the
+    work after retry_after seconds instead of calling it now.
+    """
+
+    def __init__(self, backend: str, reason: str, retry_after: float):
+        super().__init__(f"Mantis backend {backend} is {reason}; retry in {retry_after:.1f}s")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Returns the wait in seconds until a token is available, 0 when one was taken.
+# Floats are returned as strings since Redis truncates Lua numbers to integers.
+_TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated'))
+if tokens == nil then
+    tokens = capacity
+    updated = now
+end
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# Returns the seconds to wait, 0 when the call may go ahead
+_ALLOW_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return '0'
+end
+local now = tonumber(ARGV[1])
+local cooldown = tonumber(ARGV[2])
+if state == 'open' then
+    local remaining = tonumber(redis.call('HGET', KEYS[1], 'opened_at')) + cooldown - now
+    if remaining > 0 then
+        return tostring(remaining)
+    end
+end
+if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'state', 'half_open')
+    return '0'
+end
+-- another worker's probe is in flight
+return tostring(math.max(cooldown, 1))
+"""
+
+_FAILURE_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state')
+redis.call('HSET', KEYS[1], 'last_failure_at', ARGV[1])
+local failures = redis.call('INCR', KEYS[3])
+if failures == 1 then
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+end
+if state == 'half_open' or (state ~= 'open' and failures >= tonumber(ARGV[3])) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    redis.call('HINCRBY', KEYS[1], 'times_opened', 1)
+    redis.call('DEL', KEYS[2], KEYS[3])
+end
+"""
+
+_SUCCESS_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if state and state ~= 'closed' then
+    redis.call('HSET', KEYS[1], 'state', 'closed')
+    redis.call('DEL', KEYS[2])
+end
+redis.call('DEL', KEYS[3])
+"""
+
+# AsyncGuard registers the same scripts on an asyncio client
+_TAKE_TOKEN = redis_client.register_script(_TAKE_TOKEN_SCRIPT)
+_ALLOW = redis_client.register_script(_ALLOW_SCRIPT)
+_FAILURE = redis_client.register_script(_FAILURE_SCRIPT)
+_SUCCESS = redis_client.register_script(_SUCCESS_SCRIPT)
+
+
+def _bucket_key(backend: str, kind: str) -> str:
+    return f"mantis_rate:{backend}:{kind}"
+
+
+def _breaker_keys(backend: str) -> list[str]:
+    return [f"mantis_breaker:{backend}", f"mantis_breaker:{backend}:probe", f"mantis_breaker:{backend}:failures"]
+
+
+def request_kind(method: str, endpoint: str) -> str:
+    normalized_endpoint = (endpoint or "").strip("/")
+    if method.upper() == "POST" and normalized_endpoint == "synthesis/landscape":
+        return LANDSCAPE
+    return POLL
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """
+    Full-jitter exponential backoff, so workers that failed together do not
+    retry together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def before_request(backend: str, kind: str):
+    """
+    Check the backend's circuit and rate limit. Any wait raises BackendBusy, so
+    the worker hands the stage back to the queue instead of sleeping on it. The
+    guard fails open when Redis is unavailable.
+    """
+    try:
+        retry_after = float(_ALLOW(keys=_breaker_keys(backend), args=[time.time(), BREAKER_COOLDOWN, PROBE_TIMEOUT]))
+        if retry_after > 0:
+            raise BackendBusy(backend, "unavailable (circuit open)", retry_after)
+
+        rate, burst = BUCKETS[kind]
+        wait = float(_TAKE_TOKEN(keys=[_bucket_key(backend, kind)], args=[rate, burst, time.time()]))
+        if wait > 0:
+            raise BackendBusy(backend, f"rate limited ({kind})", wait)
+    except redis.RedisError:
+        logger.warning("backend guard unavailable, calling %s unguarded", backend, exc_info=True)
+
+
+def record_success(backend: str):
+    try:
+        _SUCCESS(keys=_breaker_keys(backend))
+    except redis.RedisError:
+        pass
+
+
+def record_failure(backend: str):
+    """
+    Count a timeout or 504 towards opening the backend's circuit.
+    """
+    try:
+        _FAILURE(keys=_breaker_keys(backend), args=[time.time(), BREAKER_WINDOW, BREAKER_THRESHOLD])
+    except redis.RedisError:
+        pass
+
+
+class AsyncGuard:
+    """
+    The guard for asyncio callers such as the progress poller, running the same
+    scripts on their redis.asyncio client so no call needs a thread. BackendBusy
+    is raised as in before_request; the caller sleeps on its event loop.
+    """
+
+    def __init__(self, client):
+        self._take_token = client.register_script(_TAKE_TOKEN_SCRIPT)
+        self._allow = client.register_script(_ALLOW_SCRIPT)
+        self._failure = client.register_script(_FAILURE_SCRIPT)
+        self._success = client.register_script(_SUCCESS_SCRIPT)
+
+    async def before_request(self, backend: str, kind: str):
+        try:
+            retry_after = float(await self._allow(keys=_breaker_keys(backend), args=[time.time(), BREAKER_COOLDOWN, PROBE_TIMEOUT]))
+            if retry_after > 0:
+                raise BackendBusy(backend, "unavailable (circuit open)", retry_after)
+
+            rate, burst = BUCKETS[kind]
+            wait = float(await self._take_token(keys=[_bucket_key(backend, kind)], args=[rate, burst, time.time()]))
+            if wait > 0:
+                raise BackendBusy(backend, f"rate limited ({kind})", wait)
+        except redis.RedisError:
+            logger.warning("backend guard unavailable, calling %s unguarded", backend, exc_info=True)
+
+    async def record_success(self, backend: str):
+        try:
+            await self._success(keys=_breaker_keys(backend))
+        except redis.RedisError:
+            pass
+
+    async def record_failure(self, backend: str):
+        try:
+            await self._failure(keys=_breaker_keys(backend), args=[time.time(), BREAKER_WINDOW, BREAKER_THRESHOLD])
+        except redis.RedisError:
+            pass
+
+
+def circuit_states(backends: list[str]) -> list[str]:
+    pipe = redis_client.pipeline(transaction=False)
+    for backend in backends:
+        pipe.hget(_breaker_keys(backend)[0], "state")
+    return [state or CLOSED for state in pipe.execute()]
+
+
+def snapshot(backend: str) -> dict:
+    """
+    Breaker and rate limiter state of a backend, for monitoring.
+    """
+    breaker_key, _, failures_key = _breaker_keys(backend)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(breaker_key)
+    pipe.get(failures_key)
+    for kind in BUCKETS:
+        pipe.hgetall(_bucket_key(backend, kind))
+    breaker, failures, *buckets = pipe.execute()
+
+    now = time.time()
+    state = breaker.get("state", CLOSED)
+    report = {
+        "backend": backend,
+        "circuit": {
+            "state": state,
+            "recent_failures": int(failures or 0),
+            "times_opened": int(breaker.get("times_opened", 0)),
+            "last_failure_at": float(breaker["last_failure_at"]) if "last_failure_at" in breaker else None,
+            "retry_after": max(float(breaker["opened_at"]) + BREAKER_COOLDOWN - now, 0) if state == OPEN else 0,
+        },
+        "rate_limits": {},
+    }
+
+    for kind, bucket in zip(BUCKETS, buckets):
+        rate, burst = BUCKETS[kind]
+        tokens = burst
+        if bucket:
+            tokens = min(burst, float(bucket["tokens"]) + max(now - float(bucket["updated"]), 0) * rate)
+        report["rate_limits"][kind] = {"rate": rate, "burst": burst, "tokens": round(tokens, 2)}
+
+    return report
@@ -0,0 +1,172 @@
+import logging
+import os
+import random
+import time
+
+import redis
+
+from src.config import mantis_hosts
+from src.extensions import redis_client
+from src.tasks import backend_guard
+
+logger = logging.getLogger(__name__)
+
+# Health is a moving average of call outcomes and progress-poll latency per backend
+HEALTH_WEIGHT = float(os.environ.get("MANTIS_HEALTH_WEIGHT", 0.2))
+HEALTH_TTL = 24 * 3600
+
+# A backend whose success rate falls below EJECT_SUCCESS_RATE (after at least
+# EJECT_MIN_REQUESTS calls) gets no new spaces for EJECT_SECONDS, doubling on
+# each repeat up to EJECT_MAX_SECONDS. Spaces already on it stay there.
+EJECT_SUCCESS_RATE = float(os.environ.get("MANTIS_EJECT_SUCCESS_RATE", 0.5))
+EJECT_MIN_REQUESTS = int(os.environ.get("MANTIS_EJECT_MIN_REQUESTS", 5))
+EJECT_SECONDS = float(os.environ.get("MANTIS_EJECT_SECONDS", 60))
+EJECT_MAX_SECONDS = float(os.environ.get("MANTIS_EJECT_MAX_SECONDS", 600))
+RECOVERED_SUCCESS_RATE = 0.9
+
+# Success rates below this are treated as this, so the score stays finite
+MIN_SUCCESS_RATE = 0.05
+
+# Returns 1 when this outcome ejected the backend. Re-admitted backends start
+# over at full success with no latency, so they are tried again, and are
+# judged again after EJECT_MIN_REQUESTS calls.
+_RECORD_SCRIPT = """
+local weight = tonumber(ARGV[4])
+local success = tonumber(redis.call('HGET', KEYS[1], 'success') or '1')
+local samples = tonumber(redis.call('HGET', KEYS[1], 'samples') or '0') + 1
+success = (1 - weight) * success + weight * tonumber(ARGV[1])
+redis.call('HSET', KEYS[1], 'success', tostring(success), 'samples', samples)
+if ARGV[2] ~= '' then
+    local latency = tonumber(redis.call('HGET', KEYS[1], 'latency') or ARGV[2])
+    latency = (1 - weight) * latency + weight * tonumber(ARGV[2])
+    redis.call('HSET', KEYS[1], 'latency', tostring(latency))
+end
+local strikes = tonumber(redis.call('HGET', KEYS[1], 'strikes') or '0')
+local ejected = 0
+if samples >= tonumber(ARGV[6]) and success < tonumber(ARGV[5]) then
+    local duration = math.min(tonumber(ARGV[7]) * 2 ^ strikes, tonumber(ARGV[8]))
+    redis.call('HSET', KEYS[1], 'ejected_until', tostring(tonumber(ARGV[3]) + duration),
+        'strikes', strikes + 1, 'success', '1', 'samples', 0)
+    redis.call('HINCRBY', KEYS[1], 'times_ejected', 1)
+    redis.call('HDEL', KEYS[1], 'latency')
+    ejected = 1
+elseif strikes > 0 and success >= tonumber(ARGV[9]) then
+    redis.call('HSET', KEYS[1], 'strikes', 0)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[10])
+return ejected
+"""
+# AsyncHealth registers the same script on an asyncio client
+_RECORD = redis_client.register_script(_RECORD_SCRIPT)
+
+
+def _key(backend: str) -> str:
+    return f"mantis_health:{backend}"
+
+
+def record(backend: str, ok: bool, seconds: float | None = None):
+    """
+    Fold one call outcome, and for progress polls its latency, into the
+    backend's health. Timeouts and 5xx responses count as failures.
+    """
+    try:
+        ejected = _RECORD(keys=[_key(backend)], args=_record_args(ok, seconds))
+    except redis.RedisError:
+        return
+
+    if ejected:
+        logger.warning("ejected Mantis backend %s after repeated failures", backend)
+
+
+def _record_args(ok: bool, seconds: float | None) -> list:
+    return [
+        1 if ok else 0, "" if seconds is None else seconds, time.time(), HEALTH_WEIGHT,
+        EJECT_SUCCESS_RATE, EJECT_MIN_REQUESTS, EJECT_SECONDS, EJECT_MAX_SECONDS,
+        RECOVERED_SUCCESS_RATE, HEALTH_TTL,
+    ]
+
+
+class AsyncHealth:
+    """
+    record for asyncio callers such as the progress poller, running the same
+    script on their redis.asyncio client.
+    """
+
+    def __init__(self, client):
+        self._record = client.register_script(_RECORD_SCRIPT)
+
+    async def record(self, backend: str, ok: bool, seconds: float | None = None):
+        try:
+            ejected = await self._record(keys=[_key(backend)], args=_record_args(ok, seconds))
+        except redis.RedisError:
+            return
+
+        if ejected:
+            logger.warning("ejected Mantis backend %s after repeated failures", backend)
+
+
+def _health(backends: list[str]) -> list[dict]:
+    pipe = redis_client.pipeline(transaction=False)
+    for backend in backends:
+        pipe.hgetall(_key(backend))
+    return pipe.execute()
+
+
+def score(health: dict) -> float:
+    """
+    Expected cost of sending a space to a backend; lower is better. Backends
+    with no latency samples yet score 0 so they are tried and measured.
+    """
+    latency = float(health.get("latency", 0))
+    success = max(float(health.get("success", 1)), MIN_SUCCESS_RATE)
+    return latency / success
+
+
+def choose() -> str:
+    """
+    Backend for a new space: the better-scoring of two admitted backends picked
+    at random, so workers choosing at the same moment do not all pile onto the
+    single best one. Falls back to the backend whose ejection ends first when
+    none is admitted.
+    """
+    backends = mantis_hosts()
+    if len(backends) == 1:
+        return backends[0]
+
+    try:
+        healths = _health(backends)
+        circuits = backend_guard.circuit_states(backends)
+    except redis.RedisError:
+        return random.choice(backends)
+
+    now = time.time()
+    admitted = [
+        (backend, health) for backend, health, circuit in zip(backends, healths, circuits)
+        if float(health.get("ejected_until", 0)) <= now and circuit != backend_guard.OPEN
+    ]
+    if not admitted:
+        return min(zip(backends, healths), key=lambda item: float(item[1].get("ejected_until", 0)))[0]
+
+    candidates = random.sample(admitted, min(2, len(admitted)))
+    return min(candidates, key=lambda item: score(item[1]))[0]
+
+
+def snapshot() -> dict:
+    """
+    Health, score and ejection state of every configured backend, for monitoring.
+    """
+    backends = mantis_hosts()
+    now = time.time()
+
+    report = {}
+    for backend, health in zip(backends, _health(backends)):
+        ejected_until = float(health.get("ejected_until", 0))
+        report[backend] = {
+            "success_rate": round(float(health.get("success", 1)), 3),
+            "poll_latency_seconds": round(float(health["latency"]), 3) if "latency" in health else None,
+            "score": round(score(health), 3),
+            "ejected": ejected_until > now,
+            "readmitted_in": round(max(ejected_until - now, 0), 1),
+            "times_ejected": int(health.get("times_ejected", 0)),
+        }
+    return report
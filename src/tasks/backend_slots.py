@@ -0,0 +1,48 @@
+import os
+import time
+
+from src.extensions import redis_client
+
+# Spaces from batch submissions building at once against one Mantis backend
+BATCH_BACKEND_CONCURRENCY = int(os.environ.get("SPACE_BATCH_BACKEND_CONCURRENCY", 4))
+# A slot is reclaimed after this long even if its holder never released it (e.g. a killed worker)
+SLOT_LEASE = int(os.environ.get("SPACE_BATCH_SLOT_LEASE", 2 * 3600))
+
+# Holders are kept in a sorted set scored by lease expiry, so expired leases
+# are dropped and the free-slot check and claim happen in one atomic step.
+_ACQUIRE = redis_client.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[4]) then
+    return 1
+end
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+""")
+
+
+def _key(backend: str) -> str:
+    return f"space_slots:{backend}"
+
+
+def acquire(backend: str, holder: str, limit: int = BATCH_BACKEND_CONCURRENCY, lease: int = SLOT_LEASE) -> bool:
+    """
+    Claim one of the backend's build slots for holder (a logical task ID).
+    Claiming a slot the holder already has succeeds.
+    """
+    if limit <= 0:
+        return True
+
+    now = time.time()
+    return bool(_ACQUIRE(keys=[_key(backend)], args=[now, now + lease, limit, holder, lease]))
+
+
+def release(backend: str, holder: str):
+    redis_client.zrem(_key(backend), holder)
+
+
+def in_use(backend: str) -> int:
+    return redis_client.zcount(_key(backend), time.time(), "+inf")
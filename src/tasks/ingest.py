@@ -0,0 +1,80 @@
+import base64
+import gzip
+import io
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# The web tier reads the format names (src.scheduling costs bodies by them), so
+# pandas and pyarrow are only imported by the readers, which run in the worker
+ARROW_STREAM = "arrow_stream"
+ARROW_FILE = "arrow_file"
+PARQUET = "parquet"
+NDJSON = "ndjson"
+CSV = "csv"
+
+FORMATS = (ARROW_STREAM, ARROW_FILE, PARQUET, NDJSON, CSV)
+
+
+def _read_arrow(raw: bytes, file_format: str) -> "pd.DataFrame":
+    import pyarrow as pa
+
+    # py_buffer wraps the bytes without copying; the IPC reader maps columns onto it
+    buffer = pa.py_buffer(raw)
+    if file_format == ARROW_STREAM:
+        table = pa.ipc.open_stream(buffer).read_all()
+    else:
+        table = pa.ipc.open_file(buffer).read_all()
+
+    return table.to_pandas()
+
+
+def _read_parquet(raw: bytes) -> "pd.DataFrame":
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    return pq.read_table(pa.BufferReader(raw)).to_pandas()
+
+
+def decode_dataset(file_format: str, raw: bytes, compression: str | None = None) -> "pd.DataFrame":
+    """
+    Build a DataFrame from an uploaded dataset body with the vectorized reader
+    for its format.
+    """
+    import pandas as pd
+
+    if file_format == CSV:
+        return pd.read_csv(io.BytesIO(raw), compression=compression)
+
+    if file_format == NDJSON:
+        return pd.read_json(io.BytesIO(raw), lines=True, compression=compression)
+
+    if compression == "gzip":
+        raw = gzip.decompress(raw)
+
+    if file_format in (ARROW_STREAM, ARROW_FILE):
+        return _read_arrow(raw, file_format)
+
+    if file_format == PARQUET:
+        return _read_parquet(raw)
+
+    raise ValueError(f"Unsupported dataset format: {file_format}")
+
+
+def read_dataset(data: dict) -> "pd.DataFrame":
+    """
+    DataFrame for a create-space payload: either the JSON dict-of-lists under
+    "data" or an encoded body under "dataset".
+    """
+    import pandas as pd
+
+    dataset = data.get('dataset')
+    if dataset is None:
+        return pd.DataFrame(data.get('data', {}))
+
+    # bodies fetched from the payload store are bytes; inline messages carry base64
+    raw = dataset["body"]
+    if isinstance(raw, str):
+        raw = base64.b64decode(raw)
+    return decode_dataset(dataset["format"], raw, dataset.get("compression"))
@@ -0,0 +1,629 @@
+import functools
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+
+import pandas as pd
+import requests
+from celery.signals import worker_process_init
+from requests.adapters import HTTPAdapter
+from mantis_sdk.client import (
+    AIProvider,
+    DataType,
+    MantisClient,
+    ReducerModels,
+    SpaceCreationError,
+    SpacePrivacy,
+)
+
+from src import metrics, tracing
+from src.config import mantis_settings
+from src.tasks import backend_guard, backend_pool
+from src.tasks.upload import CsvPayload, MultipartBody
+
+CLIENT_POOL_SIZE = int(os.environ.get("MANTIS_CLIENT_POOL_SIZE", 32))  # (host, cookie) clients kept per process
+SESSION_POOL_MAXSIZE = int(os.environ.get("MANTIS_SESSION_POOL_MAXSIZE", 4))  # connections per client
+PROXY_PREFIX = "api/proxy"  # base URLs the frontend forwards to the backend
+
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def mantis_configuration():
+    """
+    SDK configuration, built once per worker process and shared by every
+    client instead of once per task.
+    """
+    from mantis_sdk.config import ConfigurationManager
+    config = ConfigurationManager()
+    config.update(mantis_settings())
+    return config
+
+
+def make_client(cookie: str, host: str | None = None) -> "ResilientMantisClient":
+    """
+    Client for this cookie and backend (MANTIS_HOST by default) from the
+    per-process pool, so consecutive stages and progress polls for the same
+    user reuse its warm connections. The least recently used client is closed
+    once more than CLIENT_POOL_SIZE are held.
+    """
+    host = host or mantis_settings()["host"]
+    key = (host, cookie)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            metrics.MANTIS_CLIENT_POOL.labels("hit").inc()
+            return client
+
+        # Create mantis client with configuration for better timeout handling
+        client = _clients[key] = ResilientMantisClient("/api/proxy/", cookie, mantis_configuration(), host=host)
+        metrics.MANTIS_CLIENT_POOL.labels("miss").inc()
+
+        evicted = []
+        while len(_clients) > CLIENT_POOL_SIZE:
+            evicted.append(_clients.popitem(last=False)[1])
+
+    for old_client in evicted:
+        metrics.MANTIS_CLIENT_POOL.labels("evicted").inc()
+        old_client.close()
+
+    return client
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    # Sockets of clients created before the fork belong to the parent process
+    with _clients_lock:
+        _clients.clear()
+    mantis_configuration()
+
+
+class ResilientMantisClient(MantisClient):
+    """
+    Wrapper around MantisClient that keeps the SDK untouched while
+    providing guarded requests and sensible fallbacks for space creation.
+    """
+
+    def __init__(self, base_url: str, cookie: str, config=None, host: str | None = None):
+        super().__init__(base_url, cookie, config)
+        settings = mantis_settings()
+        self.proxy_base_url = base_url
+        self.auth_cookie = cookie
+        self.host = host or settings["host"]
+        # Another pooled backend serves its own API; MANTIS_BACKEND_HOST belongs to MANTIS_HOST
+        self.backend_host = settings["backend_host"] if self.host == settings["host"] else self.host
+        self.session = self._make_session()
+
+    def _make_session(self) -> requests.Session:
+        session = requests.Session()
+        # The auth cookie is sent explicitly; cookies set by responses are not kept
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SESSION_POOL_MAXSIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def _is_not_found(self, message: str) -> bool:
+        lowered = message.lower()
+        return "404" in lowered or "not found" in lowered or "synthesisprogress not found" in lowered
+
+    def _extract_status_code(self, message: str) -> int | None:
+        """
+        Try to extract an HTTP status code from a structured error message.
+        Looks for patterns like 'status code 404', 'HTTP 404', or 'response 504'.
+        """
+        if not message:
+            return None
+
+        pattern = re.compile(
+            r"\b(?:status(?: code)?|http|response)[^\d]{0,6}([1-5]\d{2})\b",
+            re.IGNORECASE,
+        )
+        match = pattern.search(message)
+        if not match:
+            return None
+
+        try:
+            return int(match.group(1))
+        except (TypeError, ValueError):
+            return None
+
+    def _is_timeout_error(self, message: str) -> bool:
+        """
+        Detect timeout-like errors from the request layer.
+        """
+        if not message:
+            return False
+
+        # Look for explicit status codes like 504 or keywords bounded by word boundaries.
+        status_code = self._extract_status_code(message)
+        if status_code == 504:
+            return True
+
+        return bool(re.search(r"\btimeout\b", message, re.IGNORECASE))
+
+    def is_timeout_error(self, message: str) -> bool:
+        """
+        Expose timeout detection for callers that need to classify retryable errors.
+        """
+        return self._is_timeout_error(message)
+
+    def _default_umap_parameters(self) -> dict:
+        return {
+            "umap_variations": {
+                "parameters": {
+                    "default": {
+                        "n_neighbors": 15,
+                        "min_dist": 0.1,
+                        "metric": "euclidean",
+                    }
+                }
+            }
+        }
+
+    def _fallback_response(self, method: str, endpoint: str, status_code: int | None, message: str):
+        """
+        Substitute result for request failures that are expected during space creation,
+        or None when the failure should propagate.
+        """
+        normalized_endpoint = (endpoint or "").lstrip("/")
+        method_upper = method.upper()
+        not_found = status_code == 404 or self._is_not_found(message)
+
+        if (
+            method_upper == "GET"
+            and normalized_endpoint.startswith("synthesis/progress/")
+            and not_found
+        ):
+            return {
+                "progress": 100,
+                "error": False,
+                "status": "completed",
+                "message": "Space creation completed (progress not tracked)",
+            }
+
+        if (
+            method_upper == "GET"
+            and normalized_endpoint.startswith("synthesis/parameters/")
+            and not_found
+        ):
+            return self._default_umap_parameters()
+
+        if (
+            method_upper == "POST"
+            and normalized_endpoint.startswith("synthesis/landscape/")
+            and "/select-umap/" in normalized_endpoint
+            and not_found
+        ):
+            return {"success": True, "message": "UMAP parameters selected successfully"}
+
+        return None
+
+    def _guarded(self, method: str, endpoint: str, send):
+        """
+        Run a backend call behind the shared rate limiter and circuit breaker.
+        Timeouts, 504s and 200s that are not JSON (a gateway or error page
+        served in place of the API) count towards opening the circuit; any
+        other answer from the backend shows it is up.
+        """
+        kind = backend_guard.request_kind(method, endpoint)
+        try:
+            backend_guard.before_request(self.host, kind)
+        except backend_guard.BackendBusy:
+            metrics.MANTIS_REQUESTS.labels(kind, "throttled").inc()
+            raise
+
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"mantis {method.upper()} {metrics.endpoint_label(endpoint)}", backend=self.host):
+                response = send()
+        except RuntimeError as e:
+            message = str(e)
+            timed_out = self._is_timeout_error(message)
+            if timed_out:
+                metrics.MANTIS_REQUESTS.labels(kind, "timeout").inc()
+                backend_guard.record_failure(self.host)
+            else:
+                metrics.MANTIS_REQUESTS.labels(kind, "error").inc()
+                backend_guard.record_success(self.host)
+            # 404s are expected while a space is created; only timeouts and 5xx count against its health
+            status_code = self._extract_status_code(message)
+            self._record_health(kind, not timed_out and (status_code is None or status_code < 500), start)
+            raise
+        except ValueError:
+            metrics.MANTIS_REQUESTS.labels(kind, "error").inc()
+            backend_guard.record_failure(self.host)
+            self._record_health(kind, False, start)
+            raise
+
+        metrics.MANTIS_REQUESTS.labels(kind, "ok").inc()
+        backend_guard.record_success(self.host)
+        self._record_health(kind, True, start)
+        return response
+
+    def _record_health(self, kind: str, ok: bool, start: float):
+        # Upload times depend on the dataset, so only progress polls feed the latency score
+        seconds = time.perf_counter() - start if kind == backend_guard.POLL else None
+        backend_pool.record(self.host, ok, seconds)
+
+    def _request(self, method: str, endpoint: str, rm_slash: bool = False, **kwargs):
+        """
+        MantisClient._request sent through this client's session, so requests
+        reuse its pooled connections instead of opening a new one each time.
+        """
+        kwargs.setdefault("timeout", mantis_settings()["timeout"] / 1000)
+        try:
+            response = self.session.request(
+                method,
+                self.request_url(endpoint, rm_slash=rm_slash),
+                headers={**self.request_headers(), **kwargs.pop("headers", {})},
+                **kwargs,
+            )
+        except requests.exceptions.Timeout as e:
+            raise RuntimeError(f"Request timeout: {e}") from e
+
+        if response.status_code not in (200, 201):
+            raise RuntimeError(f"Request failed with status code {response.status_code}: {response.text}")
+
+        return response.json()
+
+    def _safe_request(self, method: str, endpoint: str, **kwargs):
+        try:
+            return self._guarded(method, endpoint, lambda: self._request(method, endpoint, **kwargs))
+        except RuntimeError as e:
+            message = str(e)
+            fallback = self._fallback_response(method, endpoint, self._extract_status_code(message), message)
+            if fallback is not None:
+                metrics.MANTIS_FALLBACKS.labels(metrics.endpoint_label(endpoint)).inc()
+                return fallback
+
+            raise
+        except json.JSONDecodeError:
+            raise RuntimeError(
+                "Authentication failed. The cookie may be expired or invalid. Please log in again to Mantis."
+            )
+
+    def request_url(self, endpoint: str, rm_slash: bool = False) -> str:
+        """
+        Absolute URL for an endpoint, following the MantisClient convention:
+        a base URL under the frontend proxy is served by host, any other by
+        backend_host, with a trailing slash unless rm_slash.
+        """
+        base_host = self.host if self.proxy_base_url.strip("/").startswith(PROXY_PREFIX) else self.backend_host
+        url = f"{base_host.rstrip('/')}/{self.proxy_base_url.strip('/')}/{endpoint.lstrip('/')}"
+        if not rm_slash and not url.endswith("/"):
+            url += "/"
+        return url
+
+    def request_headers(self) -> dict:
+        return {"cookie": self.auth_cookie, **tracing.outbound_headers()}
+
+    def _stream_request(self, method: str, endpoint: str, body: MultipartBody):
+        """
+        Send a generated request body, which MantisClient._request cannot do since
+        it would encode the multipart body in memory. Errors are raised in the same
+        shape as MantisClient so timeout detection keeps working.
+        """
+        try:
+            return self._guarded(method, endpoint, lambda: self._send_stream(method, endpoint, body))
+        except ValueError:
+            raise RuntimeError(
+                "Authentication failed. The cookie may be expired or invalid. Please log in again to Mantis."
+            )
+
+    def _send_stream(self, method: str, endpoint: str, body: MultipartBody):
+        headers = {**self.request_headers(), "Content-Type": body.content_type}
+
+        try:
+            response = self.session.request(
+                method,
+                self.request_url(endpoint),
+                data=body,
+                headers=headers,
+                timeout=mantis_settings()["timeout"] / 1000,
+            )
+        except requests.exceptions.Timeout as e:
+            raise RuntimeError(f"Request timeout: {e}") from e
+
+        if response.status_code not in (200, 201):
+            raise RuntimeError(f"Request failed with status code {response.status_code}: {response.text}")
+
+        return response.json()
+
+    def create_space(
+        self,
+        space_name: str,
+        data: pd.DataFrame | str,
+        data_types: dict[str, DataType],
+        custom_models: list[str | None] | None = None,
+        reducer: ReducerModels = ReducerModels.UMAP,
+        privacy_level: SpacePrivacy = SpacePrivacy.PRIVATE,
+        ai_provider: AIProvider = AIProvider.OpenAI,
+        choose_variation=None,
+        on_recieve_id=None,
+        embedding_model: str | None = None,
+        chat_model: str | None = None,
+    ):
+        ids = self.start_space(
+            space_name,
+            data,
+            data_types,
+            custom_models=custom_models,
+            reducer=reducer,
+            privacy_level=privacy_level,
+            ai_provider=ai_provider,
+            on_recieve_id=on_recieve_id,
+            embedding_model=embedding_model,
+            chat_model=chat_model,
+        )
+        self._poll_progress(ids["space_id"], ids["layer_id"], choose_variation)
+
+        return ids
+
+    def start_space(
+        self,
+        space_name: str,
+        data: pd.DataFrame | str | CsvPayload,
+        data_types: dict[str, DataType],
+        custom_models: list[str | None] | None = None,
+        reducer: ReducerModels = ReducerModels.UMAP,
+        privacy_level: SpacePrivacy = SpacePrivacy.PRIVATE,
+        ai_provider: AIProvider = AIProvider.OpenAI,
+        on_recieve_id=None,
+        embedding_model: str | None = None,
+        chat_model: str | None = None,
+        space_id: str | None = None,
+    ) -> dict:
+        """
+        Upload the dataset and start synthesis without waiting for it to finish.
+        Progress is then driven with poll_once. A CsvPayload is streamed into the
+        multipart body instead of being serialized into memory first. Passing
+        space_id lets the caller record it before the upload can time out.
+        """
+        buffer = None
+        try:
+            buffer, columns, file_extension = self._prepare_data_buffer(data)
+            data_types_sanitized, custom_models = self._build_data_types(
+                columns, data_types, custom_models
+            )
+            form_data, files, space_id, layer_id = self._build_form_and_files(
+                space_name,
+                file_extension,
+                buffer,
+                data_types_sanitized,
+                custom_models,
+                reducer,
+                privacy_level,
+                ai_provider,
+                embedding_model,
+                chat_model,
+                space_id,
+            )
+
+            with metrics.timed("landscape_post"):
+                if isinstance(data, CsvPayload):
+                    body = MultipartBody(form_data, "file", f"data.{file_extension}", data)
+                    landscape_response = self._stream_request("POST", "/synthesis/landscape", body)
+                else:
+                    landscape_response = self._safe_request("POST", "/synthesis/landscape", data=form_data, files=files)
+
+            if isinstance(landscape_response, dict) and landscape_response.get("error"):
+                raise RuntimeError(landscape_response["error"])
+
+            if isinstance(landscape_response, dict):
+                layer_id = landscape_response.get("layer_id", space_id)
+
+            if on_recieve_id is not None:
+                on_recieve_id(space_id, layer_id or space_id)
+
+            return {"space_id": space_id, "layer_id": layer_id or space_id}
+        finally:
+            try:
+                buffer.close()
+            except (AttributeError, ValueError):
+                pass
+
+    def _prepare_data_buffer(self, data: pd.DataFrame | str | CsvPayload) -> tuple[io.BytesIO | io.BufferedReader | None, list, str]:
+        if isinstance(data, CsvPayload):
+            # the payload is streamed by start_space; nothing to buffer here
+            return None, data.columns, data.file_extension
+
+        file_extension = "csv"
+
+        if isinstance(data, str):
+            file_extension = os.path.splitext(data)[1].lstrip('.')
+
+        buffer = None
+        columns = None
+
+        if isinstance(data, pd.DataFrame):
+            columns = data.columns
+
+            buffer = io.BytesIO()
+            with metrics.timed("csv_serialize"):
+                data.to_csv(buffer, index=False)
+            buffer.seek(0)
+
+        elif isinstance(data, str):
+            columns = pd.read_csv(data, nrows=1).columns
+            buffer = open(data, "rb")
+
+        if buffer is None:
+            raise ValueError("Data must be a pandas DataFrame or a file path.")
+
+        return buffer, columns, file_extension
+
+    def _build_data_types(
+        self,
+        columns: list,
+        data_types: dict[str, DataType],
+        custom_models: list[str | None] | None,
+    ) -> tuple[list[dict], list[str | None]]:
+        data_types_array = []
+        data_types_sanitized = []
+
+        for column in columns:
+            if column in data_types:
+                data_types_array.append(data_types[column])
+            else:
+                data_types_array.append(DataType.Delete)
+
+        for data_type in data_types_array:
+            data_input = {possible: possible == data_type for possible in DataType.All}
+            data_types_sanitized.append(data_input)
+
+        if custom_models is None:
+            custom_models = [None for _ in range(len(data_types_sanitized))]
+
+        assert len(custom_models) == len(
+            data_types_sanitized
+        ), "Custom models must align with the sanitized data_types ordering"
+
+        return data_types_sanitized, custom_models
+
+    def _build_form_and_files(
+        self,
+        space_name: str,
+        file_extension: str,
+        buffer,
+        data_types_sanitized: list[dict],
+        custom_models: list[str | None],
+        reducer: ReducerModels,
+        privacy_level: SpacePrivacy,
+        ai_provider: AIProvider,
+        embedding_model: str | None,
+        chat_model: str | None,
+        space_id: str | None = None,
+    ) -> tuple[dict, dict, str, str | None]:
+        space_id = space_id or str(uuid.uuid4())
+        file_key = f"{space_name}-{space_id}.{file_extension}"
+
+        resolved_embedding_model = embedding_model or os.environ.get(
+            "MANTIS_EMBEDDING_MODEL", "text-embedding-ada-002"
+        )
+        resolved_chat_model = chat_model or os.environ.get("MANTIS_CHAT_MODEL", "gpt-4o-mini")
+
+        form_data = {
+            "space_id": space_id,
+            "space_name": space_name,
+            "is_public": str(privacy_level == SpacePrivacy.PUBLIC).lower(),
+            "red_model": reducer,
+            "custom_models": json.dumps(custom_models),
+            "data_types": json.dumps(data_types_sanitized),
+            "ai_provider": ai_provider,
+            "file_key": file_key,
+            "chat_model": resolved_chat_model,
+            "embedding_model": resolved_embedding_model,
+        }
+
+        files = {"file": (f"data.{file_extension}", buffer, f"text/{file_extension}")}
+        return form_data, files, space_id, None
+
+    def poll_once(self, space_id: str, layer_id: str | None, chose_umap: bool, choose_variation=None) -> tuple[int, bool]:
+        """
+        Run a single progress check, selecting the UMAP variation once synthesis
+        passes 50%. Returns the progress value and whether a variation has been chosen.
+        """
+        progress_value = self.get_progress(space_id)
+
+        if progress_value >= 50 and not chose_umap:
+            chose_umap = self.select_umap_variation(space_id, layer_id, choose_variation)
+
+        if progress_value == 0 and chose_umap:
+            raise RuntimeError(
+                "Progress reset to 0 after UMAP selection; possible backend regression or unexpected reset."
+            )
+
+        return progress_value, chose_umap
+
+    def probe_space(self, space_id: str) -> str:
+        """
+        What the backend knows about a space whose creation may have been cut
+        short: "running", "completed", "failed", "missing", or "unknown" when
+        the backend did not answer. Unlike get_progress, a missing space is
+        reported as such rather than as finished.
+        """
+        endpoint = f"synthesis/progress/{space_id}"
+
+        try:
+            progress = self._guarded("GET", endpoint, lambda: self._request("GET", endpoint))
+        except RuntimeError as e:
+            message = str(e)
+            if self._extract_status_code(message) == 404 or self._is_not_found(message):
+                return "missing"
+            return "unknown"
+        except json.JSONDecodeError:
+            return "unknown"
+
+        if not isinstance(progress, dict):
+            return "unknown"
+
+        if progress.get("error"):
+            return "failed"
+
+        return "completed" if progress.get("progress", 0) >= 100 else "running"
+
+    def get_progress(self, space_id: str) -> int:
+        progress = self._safe_request("GET", f"synthesis/progress/{space_id}")
+        if not isinstance(progress, dict):
+            raise RuntimeError("Unexpected progress response format.")
+
+        if progress.get("error"):
+            raise SpaceCreationError(progress["error"])
+
+        return progress.get("progress", 0)
+
+    def select_umap_variation(self, space_id: str, layer_id: str | None, choose_variation=None) -> bool:
+        """
+        Pick one of the UMAP variations offered for the space. Returns False when
+        the backend has not published any parameters yet.
+        """
+        parameters = None
+
+        umap_variations = self._safe_request("GET", f"synthesis/parameters/{space_id}")
+        if isinstance(umap_variations, dict):
+            parameters = (
+                umap_variations.get("umap_variations", {}).get("parameters")
+                if umap_variations.get("umap_variations")
+                else None
+            )
+
+        if not parameters:
+            return False
+
+        if choose_variation is None:
+            chosen_parameter = super()._default_parameter_selection(parameters)
+        else:
+            chosen_parameter = choose_variation(parameters)
+
+        self._safe_request(
+            "POST",
+            f"synthesis/landscape/{space_id}/select-umap/{chosen_parameter}",
+            rm_slash=True,
+            json={"selected_variation": chosen_parameter, "layer_id": layer_id, "floor_number": 1},
+        )
+
+        return True
+
+    def _poll_progress(self, space_id: str, layer_id: str | None, choose_variation):
+        chose_umap = False
+
+        while True:
+            progress_value, chose_umap = self.poll_once(space_id, layer_id, chose_umap, choose_variation)
+
+            if progress_value >= 100:
+                break
+
+            time.sleep(1)
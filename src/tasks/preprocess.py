@@ -0,0 +1,107 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from mantis_sdk.client import DataType
+
+MAX_TEXT_LENGTH = int(os.environ.get("SPACE_MAX_TEXT_LENGTH", 1000))
+
+logger = logging.getLogger(__name__)
+
+
+def project_columns(df: pd.DataFrame, data_types: dict) -> pd.DataFrame:
+    """
+    Keep only the columns that will be used; anything without a data type is
+    sent as DataType.Delete and would be uploaded for nothing.
+    """
+    keep = [column for column in df.columns if data_types.get(column, DataType.Delete) != DataType.Delete]
+    return df[keep]
+
+
+def drop_empty_columns(df: pd.DataFrame, data_types: dict) -> pd.DataFrame:
+    return df.dropna(axis=1, how='all')
+
+
+def truncate_text(df: pd.DataFrame, data_types: dict) -> pd.DataFrame:
+    """
+    Cap text fields at MAX_TEXT_LENGTH characters. Missing values stay missing
+    instead of becoming the string "nan".
+    """
+    text_columns = df.columns[df.dtypes == object]
+    if len(text_columns) == 0:
+        return df
+
+    df = df.copy()
+    for column in text_columns:
+        values = df[column]
+        df[column] = values.astype(str).str.slice(0, MAX_TEXT_LENGTH).where(values.notna())
+    return df
+
+
+def drop_empty_rows(df: pd.DataFrame, data_types: dict) -> pd.DataFrame:
+    return df.dropna(how='all')
+
+
+def drop_duplicate_rows(df: pd.DataFrame, data_types: dict) -> pd.DataFrame:
+    return df.drop_duplicates(ignore_index=True)
+
+
+def downcast_numeric(df: pd.DataFrame, data_types: dict) -> pd.DataFrame:
+    """
+    Shrink integer columns to the smallest type that holds them, and float
+    columns to float32 only where that loses nothing.
+    """
+    df = df.copy()
+    for column in df.columns[df.dtypes.map(pd.api.types.is_integer_dtype)]:
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+
+    for column in df.columns[df.dtypes.map(pd.api.types.is_float_dtype)]:
+        narrowed = df[column].astype(np.float32)
+        if np.array_equal(narrowed.to_numpy(dtype=np.float64), df[column].to_numpy(), equal_nan=True):
+            df[column] = narrowed
+    return df
+
+
+STAGES = (
+    ("project_columns", project_columns),
+    ("drop_empty_columns", drop_empty_columns),
+    ("truncate_text", truncate_text),
+    ("drop_empty_rows", drop_empty_rows),
+    ("drop_duplicate_rows", drop_duplicate_rows),
+    ("downcast_numeric", downcast_numeric),
+)
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def preprocess(df: pd.DataFrame, data_types: dict, stages=STAGES) -> tuple[pd.DataFrame, dict]:
+    """
+    Run the preprocessing stages in order. Returns the cleaned frame and a
+    report with each stage's timing, resulting shape and bytes saved.
+    """
+    report = {"bytes_before": _frame_bytes(df), "stages": []}
+
+    for name, stage in stages:
+        bytes_before = _frame_bytes(df)
+        start = time.perf_counter()
+        df = stage(df, data_types)
+        elapsed = time.perf_counter() - start
+        bytes_after = _frame_bytes(df)
+
+        report["stages"].append({
+            "stage": name,
+            "seconds": round(elapsed, 6),
+            "rows": len(df),
+            "columns": len(df.columns),
+            "bytes_saved": bytes_before - bytes_after,
+        })
+
+    report["bytes_after"] = _frame_bytes(df)
+    report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+
+    logger.info("Preprocessing report: %s", report)
+    return df, report
@@ -0,0 +1,37 @@
+import json
+import os
+
+from src.extensions import redis_client
+
+# Kept a little past the synthesis deadline so any retry of the task can still find its space
+RESUME_TTL = int(os.environ.get("SPACE_RESUME_TTL", 2 * 3600))
+
+# Backend answers to a progress probe after which the space will not finish by itself
+GONE = ("missing", "failed")
+
+
+def _key(task_id: str) -> str:
+    return f"space_resume:{task_id}"
+
+
+def save(task_id: str, state: dict, stage: str):
+    """
+    Remember the space a logical task is building, and how far it got, so a
+    retried task can pick it up instead of uploading the dataset again.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(_key(task_id), mapping={"state": json.dumps(state), "stage": stage})
+    pipe.expire(_key(task_id), RESUME_TTL)
+    pipe.execute()
+
+
+def load(task_id: str) -> tuple[dict, str] | None:
+    record = redis_client.hgetall(_key(task_id))
+    if "state" not in record:
+        return None
+
+    return json.loads(record["state"]), record["stage"]
+
+
+def clear(task_id: str):
+    redis_client.delete(_key(task_id))
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+from mantis_sdk.client import DataType
+
+SAMPLE_METHOD = os.environ.get("SPACE_SAMPLE_METHOD", "stratified")  # "stratified" or "cluster"
+SAMPLE_CLUSTERS = int(os.environ.get("SPACE_SAMPLE_CLUSTERS", 20))
+MAX_STRATA = 50
+KMEANS_ITERATIONS = 10
+
+
+def _allocate(sizes: pd.Series, n: int) -> pd.Series:
+    """
+    Split n rows across strata in proportion to their sizes (largest remainder).
+    """
+    exact = sizes * (n / sizes.sum())
+    quotas = np.floor(exact).astype(int)
+    shortfall = n - int(quotas.sum())
+    if shortfall > 0:
+        remainders = (exact - quotas).sort_values(ascending=False)
+        quotas.loc[remainders.index[:shortfall]] += 1
+    return quotas.clip(upper=sizes)
+
+
+def sample_by_strata(df: pd.DataFrame, strata: pd.Series, n: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Keep n rows so every stratum keeps its share of the dataset. Rows are ranked
+    by a random key within their stratum and kept while under its quota, so the
+    whole draw is a handful of vectorized operations.
+    """
+    if len(df) <= n:
+        return df
+
+    strata = pd.Series(np.asarray(strata), index=df.index)
+    quotas = _allocate(strata.value_counts(), n)
+
+    keys = pd.Series(np.random.default_rng(seed).random(len(df)), index=df.index)
+    rank = keys.groupby(strata).rank(method="first")
+    keep = (rank <= strata.map(quotas)).to_numpy()
+
+    return df[keep].reset_index(drop=True)
+
+
+def _strata(df: pd.DataFrame, data_types: dict) -> pd.Series:
+    """
+    Stratify on the categoric column with the most levels (up to MAX_STRATA),
+    else on deciles of the first numeric column, else not at all.
+    """
+    candidates = [
+        (df[column].nunique(), column)
+        for column in df.columns
+        if data_types.get(column) == DataType.Categoric
+    ]
+    candidates = [(levels, column) for levels, column in candidates if 1 < levels <= MAX_STRATA]
+    if candidates:
+        _, column = max(candidates)
+        return df[column].astype(str)
+
+    numeric = df.select_dtypes("number").columns
+    if len(numeric):
+        return pd.qcut(df[numeric[0]].rank(method="first"), q=min(10, len(df)), labels=False)
+
+    return pd.Series(0, index=df.index)
+
+
+def _features(df: pd.DataFrame, data_types: dict) -> np.ndarray | None:
+    """
+    Standardized numeric columns plus text lengths of semantic columns.
+    """
+    columns = [df[column].astype(float) for column in df.select_dtypes("number").columns]
+    columns += [
+        df[column].astype(str).str.len().astype(float)
+        for column in df.columns
+        if data_types.get(column) == DataType.Semantic
+    ]
+    if not columns:
+        return None
+
+    features = np.column_stack([column.to_numpy() for column in columns])
+    features = np.nan_to_num(features)
+    std = features.std(axis=0)
+    return (features - features.mean(axis=0)) / np.where(std == 0, 1, std)
+
+
+def _kmeans(features: np.ndarray, k: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = features[rng.choice(len(features), size=k, replace=False)]
+
+    for _ in range(KMEANS_ITERATIONS):
+        # squared distances without materializing an (n, k, d) array
+        distances = (
+            (features ** 2).sum(axis=1)[:, None]
+            - 2 * features @ centers.T
+            + (centers ** 2).sum(axis=1)[None, :]
+        )
+        labels = distances.argmin(axis=1)
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, features)
+        occupied = counts > 0
+        centers[occupied] = sums[occupied] / counts[occupied, None]
+
+    return labels
+
+
+def reduce_rows(df: pd.DataFrame, n: int, data_types: dict, method: str = SAMPLE_METHOD, seed: int = 42) -> pd.DataFrame:
+    """
+    Representative sample of n rows. "cluster" stratifies on k-means clusters of
+    the numeric and text-length features; "stratified" on a categoric column or
+    numeric deciles.
+    """
+    if len(df) <= n:
+        return df
+
+    if method == "cluster":
+        features = _features(df, data_types)
+        if features is not None:
+            labels = _kmeans(features, min(SAMPLE_CLUSTERS, n), seed)
+            return sample_by_strata(df, pd.Series(labels, index=df.index), n, seed)
+
+    return sample_by_strata(df, _strata(df, data_types), n, seed)
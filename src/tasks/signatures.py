@@ -0,0 +1,16 @@
+from src.extensions import celery
+
+# The web tier enqueues tasks by name so it never imports their implementations
+# (and with them pandas and mantis_sdk); only the worker loads src.tasks.space_tasks
+PROCESS_SPACE_CREATION = "src.tasks.space_tasks.process_space_creation"
+
+
+def process_space_creation(message: dict):
+    """
+    Signature for building a space from an offloaded create-space message,
+    routed to the queue src.scheduling chose for it.
+    """
+    signature = celery.signature(PROCESS_SPACE_CREATION, args=(message,))
+    if message.get("queue"):
+        signature.set(queue=message["queue"])
+    return signature
@@ -1,413 +1,510 @@
-import io
 import json
+import logging
+import math
 import os
-import re
 import time
 import traceback
 import uuid
 
-import pandas as pd
-import redis
+from celery.exceptions import Ignore
+from celery.signals import task_failure
 from mantis_sdk.client import (
     AIProvider,
     DataType,
-    MantisClient,
     ReducerModels,
-    SpaceCreationError,
     SpacePrivacy,
 )
 
-from src.extensions import celery
+from src import admission, dedup, jobs, metrics, payloads, progress, scheduling, tracing, validation
+from src.extensions import celery, redis_client as redis_cache
+from src.tasks.ingest import read_dataset
+from src.tasks import backend_pool, backend_slots, resume, signatures
+from src.tasks.backend_guard import BackendBusy, backoff_delay
+from src.tasks.mantis_client import make_client, mantis_settings
+from src.tasks.preprocess import preprocess
+from src.tasks.sampling import reduce_rows
+from src.tasks.upload import UPLOAD_STREAMING, CsvPayload
+
+logger = logging.getLogger(__name__)
+
+# Progress checks are re-enqueued with a countdown instead of sleeping in the worker
+POLL_INTERVAL = float(os.environ.get("SPACE_POLL_INTERVAL", 1))
+SYNTHESIS_DEADLINE = int(os.environ.get("SPACE_SYNTHESIS_DEADLINE", 3600))
+MAX_RETRIES = 2
+
+# Datasets above MAX_ROWS are handled by SPACE_LARGE_DATASET_MODE (or the request's
+# large_dataset_mode): "sample" keeps a representative sample, "shard" builds one
+# space per MAX_ROWS-row shard under the same task, "reject" refuses over 2,000 rows.
+MAX_ROWS = int(os.environ.get("SPACE_MAX_ROWS", 1000))
+MAX_SHARDS = int(os.environ.get("SPACE_MAX_SHARDS", 10))
+MAX_TOTAL_ROWS_SHARDED = MAX_ROWS * MAX_SHARDS
+SHARD_POLL_INTERVAL = float(os.environ.get("SPACE_SHARD_POLL_INTERVAL", 5))
+
+# Batch items wait this long between attempts to get a build slot on their backend
+SLOT_RETRY_INTERVAL = float(os.environ.get("SPACE_BATCH_SLOT_RETRY", 10))
+
+# "celery" drives progress with re-enqueued check tasks; "sidecar" hands in-flight
+# spaces to the asyncio poller in src/poller.py
+POLLER_MODE = os.environ.get("SPACE_POLLER_MODE", "celery")
+POLLER_SPACES_KEY = "space_poller:spaces"
+
+TIMEOUT_ERROR = {
+    "error": "Request timed out after multiple retries. The dataset may be too large or the server is under heavy load. Please try again later or with a smaller dataset.",
+    "error_type": "timeout",
+}
+
+
+def _progress(task, meta: dict):
+    """
+    Record the stage of the logical space-creation task and push it to clients
+    streaming its events. Every stage shares the original task ID, so
+    space-task-status sees a single task moving forward.
+    """
+    task.update_state(state='PROGRESS', meta=meta)
+    progress.publish(task.request.id, meta)
+
+
+def _report(task, stage: str, state: dict, progress_value: int = 0):
+    resume.save(task.request.id, state, stage)
+    _progress(task, {
+        "stage": stage,
+        "progress": progress_value,
+        "space_id": state["space_id"],
+        "layer_id": state["layer_id"],
+        "backend": _backend(state),
+    })
+
+
+def _finish(task, data_or_state: dict, result: dict) -> dict:
+    dedup_key = data_or_state.get('dedup_key')
+    if dedup_key:
+        if 'error' in result:
+            dedup.release(dedup_key)
+        else:
+            dedup.complete(dedup_key, task.request.id, result)
+
+    if data_or_state.get('batch'):
+        backend_slots.release(_backend(data_or_state), task.request.id)
+
+    resume.clear(task.request.id)
+
+    admission.release(task.request.id, data_or_state.get('user'))
+    if 'error' not in result and 'started_at' in data_or_state:
+        admission.observe_build(time.time() - data_or_state['started_at'])
+
+    if 'error' in result:
+        progress.publish(task.request.id, {"stage": "error", "error": result["error"], "error_type": result.get("error_type")})
+    else:
+        progress.publish(task.request.id, {"stage": "done", "progress": 100, "result": result})
+
+    return result
 
-# Create a redis connection
-redis_cache = redis.Redis(host='redis', port=6379, decode_responses=True)
 
+def _backend(data_or_state: dict) -> str:
+    return data_or_state.get('backend') or mantis_settings()["host"]
 
-class ResilientMantisClient(MantisClient):
+
+def _user_slots(user: str) -> str:
+    return f"user:{user}"
+
+
+@task_failure.connect
+def _publish_failure(sender=None, task_id=None, exception=None, args=None, **kwargs):
+    # Unhandled exceptions skip _finish; still end the client's event stream, free any batch or user slot
+    # and the task's admission, and let identical submissions build again instead of joining a dead task
+    progress.publish(task_id, {"stage": "error", "error": str(exception)})
+
+    message = args[0] if args and isinstance(args[0], dict) else {}
+    if message.get("dedup_key"):
+        dedup.release(message["dedup_key"], task_id)
+    backend_slots.release(_backend(message), task_id)
+    if message.get("user"):
+        backend_slots.release(_user_slots(message["user"]), task_id)
+    admission.release(task_id, message.get("user"))
+
+
+def _next_check(state: dict, countdown: float = POLL_INTERVAL):
+    return check_space_progress.s(state).set(countdown=countdown)
+
+
+@celery.task(bind=True, name=signatures.PROCESS_SPACE_CREATION)
+def process_space_creation(self, data):
     """
-    Wrapper around MantisClient that keeps the SDK untouched while
-    providing guarded requests and sensible fallbacks for space creation.
+    Upload stage: validate and upload the dataset, then hand the space over to
+    progress checks that run as separate, short task executions.
     """
+    if not data.get('backend'):
+        # The space sticks to this backend for its whole build; a redelivered
+        # task keeps the backend its earlier attempt started the space on
+        record = resume.load(self.request.id)
+        started_on = record[0].get('backend') if record else None
+        data['backend'] = started_on or backend_pool.choose()
+
+    if data.get('batch') and not backend_slots.acquire(data['backend'], self.request.id):
+        # The backend is at its batch ceiling; wait for a slot without holding a worker
+        _progress(self, {"stage": "queued", "progress": 0})
+        return self.replace(signatures.process_space_creation(data).set(countdown=SLOT_RETRY_INTERVAL))
+
+    user = data.get('user')
+    if user and not backend_slots.acquire(_user_slots(user), self.request.id, scheduling.USER_WORKER_SLOTS, scheduling.USER_SLOT_LEASE):
+        # This user already has their share of workers busy; let other users' spaces go first
+        metrics.SPACE_RETRIES.labels("upload", "user_slots").inc()
+        _progress(self, {"stage": "queued", "progress": 0})
+        return self.replace(signatures.process_space_creation(data).set(countdown=scheduling.USER_SLOT_RETRY))
 
-    def _is_not_found(self, message: str) -> bool:
-        lowered = message.lower()
-        return "404" in lowered or "not found" in lowered or "synthesisprogress not found" in lowered
-
-    def _extract_status_code(self, message: str) -> int | None:
-        """
-        Try to extract an HTTP status code from a structured error message.
-        Looks for patterns like 'status code 404', 'HTTP 404', or 'response 504'.
-        """
-        if not message:
-            return None
-
-        pattern = re.compile(
-            r"\b(?:status(?: code)?|http|response)[^\d]{0,6}([1-5]\d{2})\b",
-            re.IGNORECASE,
-        )
-        match = pattern.search(message)
-        if not match:
-            return None
+    try:
+        # A retry of this task picks up the space an earlier attempt started
+        state = _resume_space(self.request.id, data.get('upload_attempts', 0))
 
+        if state is None:
+            _progress(self, {"stage": "upload", "progress": 0})
+            started = time.perf_counter()
+
+            try:
+                state = _upload_space(data, self.request.id)
+            finally:
+                # The dataset is not needed past the upload, unless the upload is put back in the queue
+                if state is None or 'retry_after' not in state:
+                    payloads.discard(data)
+
+            if 'retry_after' not in state:
+                scheduling.observe(data.get('queue'), time.perf_counter() - started)
+        elif 'retry_after' not in state:
+            payloads.discard(data)
+    finally:
+        if user:
+            backend_slots.release(_user_slots(user), self.request.id)
+
+    if 'retry_after' in state:
+        if 'upload_attempts' in state:
+            # The upload timed out and the backend cannot yet say whether it has the space
+            data['upload_attempts'] = state['upload_attempts']
+        else:
+            # The backend is throttled or its circuit is open; try again once it should take calls
+            metrics.SPACE_RETRIES.labels("upload", "throttled").inc()
+        _progress(self, {"stage": "queued", "progress": 0})
+        return self.replace(signatures.process_space_creation(data).set(countdown=state['retry_after']))
+
+    if 'error' in state:
+        return _finish(self, data, state)
+
+    if 'shards' in state:
+        shard_task_ids = []
         try:
-            return int(match.group(1))
-        except (TypeError, ValueError):
-            return None
-
-    def _is_timeout_error(self, message: str) -> bool:
-        """
-        Detect timeout-like errors from the request layer.
-        """
-        if not message:
-            return False
-
-        # Look for explicit status codes like 504 or keywords bounded by word boundaries.
-        status_code = self._extract_status_code(message)
-        if status_code == 504:
-            return True
-
-        return bool(re.search(r"\btimeout\b", message, re.IGNORECASE))
-
-    def is_timeout_error(self, message: str) -> bool:
-        """
-        Expose timeout detection for callers that need to classify retryable errors.
-        """
-        return self._is_timeout_error(message)
-
-    def _default_umap_parameters(self) -> dict:
-        return {
-            "umap_variations": {
-                "parameters": {
-                    "default": {
-                        "n_neighbors": 15,
-                        "min_dist": 0.1,
-                        "metric": "euclidean",
-                    }
-                }
-            }
+            for shard in state['shards']:
+                shard_task_ids.append(signatures.process_space_creation(payloads.offload(scheduling.route(shard))).delay().id)
+        except Exception as e:
+            # Shards already sent would build spaces nobody collects
+            if shard_task_ids:
+                celery.control.revoke(shard_task_ids)
+            return _finish(self, data, {"error": f"Could not split the dataset into shards: {e}", "stacktrace": traceback.format_exc()})
+        shard_state = {
+            "shard_task_ids": shard_task_ids,
+            "job": data.get("job"),
+            "dedup_key": data.get("dedup_key"),
+            "batch": data.get("batch"),
+            "user": data.get("user"),
         }
+        _progress(self, {"stage": "shards", "completed": 0, "total": len(shard_task_ids)})
+        return self.replace(collect_space_shards.s(shard_state).set(countdown=SHARD_POLL_INTERVAL))
 
-    def _safe_request(self, method: str, endpoint: str, **kwargs):
-        try:
-            return super()._request(method, endpoint, **kwargs)
-        except RuntimeError as e:
-            message = str(e)
-            status_code = self._extract_status_code(message)
-            normalized_endpoint = (endpoint or "").lstrip("/")
-            method_upper = method.upper()
-
-            if (
-                method_upper == "GET"
-                and normalized_endpoint.startswith("synthesis/progress/")
-                and (status_code == 404 or self._is_not_found(message))
-            ):
-                return {
-                    "progress": 100,
-                    "error": False,
-                    "status": "completed",
-                    "message": "Space creation completed (progress not tracked)",
-                }
-
-            if (
-                method_upper == "GET"
-                and normalized_endpoint.startswith("synthesis/parameters/")
-                and (status_code == 404 or self._is_not_found(message))
-            ):
-                return self._default_umap_parameters()
-
-            if (
-                method_upper == "POST"
-                and normalized_endpoint.startswith("synthesis/landscape/")
-                and "/select-umap/" in normalized_endpoint
-                and (status_code == 404 or self._is_not_found(message))
-            ):
-                return {"success": True, "message": "UMAP parameters selected successfully"}
-
-            raise
-        except json.JSONDecodeError:
-            raise RuntimeError(
-                "Authentication failed. The cookie may be expired or invalid. Please log in again to Mantis."
-            )
+    _report(self, "umap_selected" if state["chose_umap"] else "synthesis", state)
 
-    def create_space(
-        self,
-        space_name: str,
-        data: pd.DataFrame | str,
-        data_types: dict[str, DataType],
-        custom_models: list[str | None] | None = None,
-        reducer: ReducerModels = ReducerModels.UMAP,
-        privacy_level: SpacePrivacy = SpacePrivacy.PRIVATE,
-        ai_provider: AIProvider = AIProvider.OpenAI,
-        choose_variation=None,
-        on_recieve_id=None,
-        embedding_model: str | None = None,
-        chat_model: str | None = None,
-    ):
-        buffer = None
-        try:
-            buffer, columns, file_extension = self._prepare_data_buffer(data)
-            data_types_sanitized, custom_models = self._build_data_types(
-                columns, data_types, custom_models
-            )
-            form_data, files, space_id, layer_id = self._build_form_and_files(
-                space_name,
-                file_extension,
-                buffer,
-                data_types_sanitized,
-                custom_models,
-                reducer,
-                privacy_level,
-                ai_provider,
-                embedding_model,
-                chat_model,
-            )
+    if POLLER_MODE == "sidecar":
+        # The poller finishes the logical task by sending finalize_space_creation with this task ID
+        redis_cache.hset(POLLER_SPACES_KEY, self.request.id, json.dumps(state))
+        raise Ignore()
 
-            landscape_response = self._safe_request("POST", "/synthesis/landscape", data=form_data, files=files)
-            if isinstance(landscape_response, dict) and landscape_response.get("error"):
-                raise RuntimeError(landscape_response["error"])
+    return self.replace(_next_check(state))
 
-            if isinstance(landscape_response, dict):
-                layer_id = landscape_response.get("layer_id", space_id)
 
-            if on_recieve_id is not None:
-                on_recieve_id(space_id, layer_id or space_id)
+@celery.task(bind=True)
+def check_space_progress(self, state):
+    """
+    Progress stage: one progress request, then either select a UMAP variation,
+    finalize, or schedule the next check.
+    """
+    if time.time() - state["started_at"] > SYNTHESIS_DEADLINE:
+        return _finish(self, state, {
+            "error": f"Space synthesis did not finish within {SYNTHESIS_DEADLINE} seconds.",
+            "error_type": "timeout",
+            "space_id": state["space_id"],
+        })
 
-            self._poll_progress(space_id, layer_id, choose_variation)
-            if layer_id is None:
-                layer_id = space_id
+    mantis = make_client(state["cookie"], state.get("backend"))
 
-            return {"space_id": space_id, "layer_id": layer_id}
-        finally:
-            try:
-                buffer.close()
-            except (AttributeError, ValueError):
-                pass
+    try:
+        progress_value = mantis.get_progress(state["space_id"])
+    except BackendBusy as e:
+        metrics.SPACE_RETRIES.labels("progress", "throttled").inc()
+        return self.replace(_next_check(state, countdown=e.retry_after))
+    except RuntimeError as e:
+        if not mantis.is_timeout_error(str(e)):
+            return _finish(self, state, {"error": str(e), "stacktrace": traceback.format_exc()})
+
+        # The backend is usually still working on the space; check again later
+        state["timeouts"] += 1
+        metrics.SPACE_RETRIES.labels("progress", "timeout").inc()
+        if state["timeouts"] > MAX_RETRIES:
+            return _finish(self, state, {**TIMEOUT_ERROR, "retry_count": state["timeouts"], "stacktrace": traceback.format_exc()})
+
+        logger.warning(f"Progress check timed out, retrying... (attempt {state['timeouts']}/{MAX_RETRIES})")
+        return self.replace(_next_check(state, countdown=POLL_INTERVAL + backoff_delay(state["timeouts"])))
+    except Exception as e:
+        return _finish(self, state, {"error": str(e), "stacktrace": traceback.format_exc()})
 
-    def _prepare_data_buffer(self, data: pd.DataFrame | str) -> tuple[io.BytesIO | io.BufferedReader, list, str]:
-        file_extension = "csv"
+    if progress_value == 0 and state["chose_umap"]:
+        return _finish(self, state, {
+            "error": "Progress reset to 0 after UMAP selection; possible backend regression or unexpected reset."
+        })
 
-        if isinstance(data, str):
-            file_extension = os.path.splitext(data)[1].lstrip('.')
+    _report(self, "synthesis", state, progress_value)
 
-        buffer = None
-        columns = None
+    if progress_value >= 50 and not state["chose_umap"]:
+        return self.replace(select_space_umap.s(state, progress_value))
 
-        if isinstance(data, pd.DataFrame):
-            columns = data.columns
+    if progress_value >= 100:
+        return self.replace(finalize_space_creation.s(state))
 
-            buffer = io.BytesIO()
-            data.to_csv(buffer, index=False)
-            buffer.seek(0)
+    return self.replace(_next_check(state))
 
-        elif isinstance(data, str):
-            columns = pd.read_csv(data, nrows=1).columns
-            buffer = open(data, "rb")
 
-        if buffer is None:
-            raise ValueError("Data must be a pandas DataFrame or a file path.")
+@celery.task(bind=True)
+def select_space_umap(self, state, progress_value):
+    """
+    UMAP stage: choose a variation once the backend has published them.
+    """
+    mantis = make_client(state["cookie"], state.get("backend"))
 
-        return buffer, columns, file_extension
+    try:
+        with metrics.timed("select_umap"):
+            state["chose_umap"] = mantis.select_umap_variation(state["space_id"], state["layer_id"])
+    except BackendBusy as e:
+        metrics.SPACE_RETRIES.labels("select_umap", "throttled").inc()
+        return self.replace(select_space_umap.s(state, progress_value).set(countdown=e.retry_after))
+    except Exception as e:
+        return _finish(self, state, {"error": str(e), "stacktrace": traceback.format_exc()})
 
-    def _build_data_types(
-        self,
-        columns: list,
-        data_types: dict[str, DataType],
-        custom_models: list[str | None] | None,
-    ) -> tuple[list[dict], list[str | None]]:
-        data_types_array = []
-        data_types_sanitized = []
+    if state["chose_umap"]:
+        metrics.STAGE_SECONDS.labels("time_to_umap").observe(time.time() - state["started_at"])
 
-        for column in columns:
-            if column in data_types:
-                data_types_array.append(data_types[column])
-            else:
-                data_types_array.append(DataType.Delete)
-
-        for data_type in data_types_array:
-            data_input = {possible: possible == data_type for possible in DataType.All}
-            data_types_sanitized.append(data_input)
-
-        if custom_models is None:
-            custom_models = [None for _ in range(len(data_types_sanitized))]
-
-        assert len(custom_models) == len(
-            data_types_sanitized
-        ), "Custom models must align with the sanitized data_types ordering"
-
-        return data_types_sanitized, custom_models
-
-    def _build_form_and_files(
-        self,
-        space_name: str,
-        file_extension: str,
-        buffer,
-        data_types_sanitized: list[dict],
-        custom_models: list[str | None],
-        reducer: ReducerModels,
-        privacy_level: SpacePrivacy,
-        ai_provider: AIProvider,
-        embedding_model: str | None,
-        chat_model: str | None,
-    ) -> tuple[dict, dict, str, str | None]:
-        space_id = str(uuid.uuid4())
-        file_key = f"{space_name}-{space_id}.{file_extension}"
-
-        resolved_embedding_model = embedding_model or os.environ.get(
-            "MANTIS_EMBEDDING_MODEL", "text-embedding-ada-002"
-        )
-        resolved_chat_model = chat_model or os.environ.get("MANTIS_CHAT_MODEL", "gpt-4o-mini")
-
-        form_data = {
-            "space_id": space_id,
-            "space_name": space_name,
-            "is_public": str(privacy_level == SpacePrivacy.PUBLIC).lower(),
-            "red_model": reducer,
-            "custom_models": json.dumps(custom_models),
-            "data_types": json.dumps(data_types_sanitized),
-            "ai_provider": ai_provider,
-            "file_key": file_key,
-            "chat_model": resolved_chat_model,
-            "embedding_model": resolved_embedding_model,
-        }
+    if progress_value >= 100:
+        return self.replace(finalize_space_creation.s(state))
 
-        files = {"file": (f"data.{file_extension}", buffer, f"text/{file_extension}")}
-        return form_data, files, space_id, None
+    _report(self, "umap_selected" if state["chose_umap"] else "synthesis", state, progress_value)
+    return self.replace(_next_check(state))
 
-    def _poll_progress(self, space_id: str, layer_id: str | None, choose_variation):
-        choseUMAPvariations = False
-        previous_progress = -1
 
-        while True:
-            progress = self._safe_request("GET", f"synthesis/progress/{space_id}")
-            if not isinstance(progress, dict):
-                raise RuntimeError("Unexpected progress response format.")
+@celery.task(bind=True)
+def finalize_space_creation(self, state, error=None):
+    """
+    Finalize stage: publish the finished space, or the error that ended its
+    synthesis, as the logical task's result.
+    """
+    if error is not None:
+        return _finish(self, state, error)
 
-            if progress.get("error"):
-                raise SpaceCreationError(progress["error"])
+    metrics.STAGE_SECONDS.labels("time_to_complete").observe(time.time() - state["started_at"])
 
-            progress_value = progress.get("progress", 0)
+    # Return a simplified response; the space opens from the backend that built it
+    space_response = {
+        "space_id": state["space_id"],
+        "layer_id": state["layer_id"],
+        "backend": _backend(state),
+    }
 
-            if progress_value != previous_progress:
-                previous_progress = progress_value
+    return _finish(self, state, space_response)
 
-            if progress_value >= 50 and not choseUMAPvariations:
-                parameters = None
 
-                umap_variations = self._safe_request("GET", f"synthesis/parameters/{space_id}")
-                if isinstance(umap_variations, dict):
-                    parameters = (
-                        umap_variations.get("umap_variations", {}).get("parameters")
-                        if umap_variations.get("umap_variations")
-                        else None
-                    )
+@celery.task(bind=True)
+def collect_space_shards(self, shard_state):
+    """
+    Shard stage: wait for every shard's space, then report them as one result
+    whose space_id/layer_id are the first finished shard's.
+    """
+    results = [process_space_creation.AsyncResult(task_id) for task_id in shard_state["shard_task_ids"]]
+    completed = sum(result.ready() for result in results)
+
+    if completed < len(results):
+        _progress(self, {"stage": "shards", "completed": completed, "total": len(results)})
+        return self.replace(collect_space_shards.s(shard_state).set(countdown=SHARD_POLL_INTERVAL))
+
+    shards = []
+    for index, result in enumerate(results):
+        outcome = result.result if result.successful() else {"error": str(result.result)}
+        if isinstance(outcome, dict) and 'error' not in outcome:
+            shards.append({"index": index, "space_id": outcome["space_id"], "layer_id": outcome["layer_id"], "backend": outcome.get("backend")})
+        else:
+            shards.append({"index": index, "error": outcome.get("error") if isinstance(outcome, dict) else str(outcome)})
+
+    built = [shard for shard in shards if 'error' not in shard]
+    if not built:
+        return _finish(self, shard_state, {"error": "Every shard of the dataset failed to build.", "shards": shards})
+
+    first = built[0]
+    jobs.record([shard_state.get("job")], first["space_id"], first["layer_id"], shards=shards, backend=first["backend"])
+
+    return _finish(self, shard_state, {"space_id": first["space_id"], "layer_id": first["layer_id"], "backend": first["backend"], "shards": shards})
+
+
+def _space_state(data: dict, cookie: str, space_id: str, layer_id: str) -> dict:
+    return {
+        "space_id": space_id,
+        "layer_id": layer_id,
+        "cookie": cookie,
+        "job": data.get("job"),
+        "dedup_key": data.get("dedup_key"),
+        "batch": data.get("batch"),
+        "user": data.get("user"),
+        "chose_umap": False,
+        "timeouts": 0,
+        "started_at": time.time(),
+        "backend": data.get("backend"),
+        # lets the progress poller attach its requests to the submission's trace
+        "trace_id": tracing.current_trace_id(),
+    }
+
+
+def _resume_space(task_id, attempts: int = 0):
+    """
+    State of the space an earlier attempt of this task started, unless the
+    backend confirms it is gone. Returns None when a fresh upload is needed.
+    attempts counts the probes that already found the space's status unknown.
+    """
+    record = resume.load(task_id)
+    if record is None:
+        return None
 
-                if parameters:
-                    if choose_variation is None:
-                        chosen_parameter = super()._default_parameter_selection(parameters)
-                    else:
-                        chosen_parameter = choose_variation(parameters)
+    state, stage = record
+    if time.time() - state["started_at"] > SYNTHESIS_DEADLINE:
+        resume.clear(task_id)
+        return {
+            "error": f"Space synthesis did not finish within {SYNTHESIS_DEADLINE} seconds.",
+            "error_type": "timeout",
+            "space_id": state["space_id"],
+        }
 
-                    self._safe_request(
-                        "POST",
-                        f"synthesis/landscape/{space_id}/select-umap/{chosen_parameter}",
-                        rm_slash=True,
-                        json={"selected_variation": chosen_parameter, "layer_id": layer_id, "floor_number": 1},
-                    )
+    try:
+        status = make_client(state["cookie"], state.get("backend")).probe_space(state["space_id"])
+    except BackendBusy as e:
+        return {"retry_after": e.retry_after}
 
-                    choseUMAPvariations = True
+    if status in resume.GONE:
+        logger.info(f"Space {state['space_id']} from an earlier attempt is {status}; uploading again")
+        resume.clear(task_id)
+        return None
 
-            if progress_value >= 100:
-                break
+    if status == "unknown" and stage == "uploading":
+        # The upload may never have reached the backend; ask again before deciding
+        attempts += 1
+        if attempts > MAX_RETRIES:
+            resume.clear(task_id)
+            return {**TIMEOUT_ERROR, "retry_count": attempts, "space_id": state["space_id"]}
+        return {"retry_after": POLL_INTERVAL + backoff_delay(attempts), "upload_attempts": attempts}
 
-            if progress_value == 0 and choseUMAPvariations:
-                raise RuntimeError(
-                    "Progress reset to 0 after UMAP selection; possible backend regression or unexpected reset."
-                )
+    logger.info(f"Resuming space {state['space_id']} at stage {stage} (backend reports {status})")
+    return state
 
-            time.sleep(1)
 
-@celery.task
-def process_space_creation(data):
+def _upload_space(data, task_id):
+    """
+    Build and upload the dataset. Returns the state carried through the
+    remaining stages, or an error payload. The space ID is recorded before
+    the upload, so a timed out upload whose space the backend is still
+    building is resumed instead of uploaded again.
+    """
     try:
-        df = pd.DataFrame(data.get('data', {}))
-
-        # Create mantis client with configuration for better timeout handling
-        from mantis_sdk.config import ConfigurationManager
-        config = ConfigurationManager()
-        config.update({
-            "host": os.environ.get("MANTIS_HOST", "https://mantisdev.csail.mit.edu"),
-            "backend_host": os.environ.get("MANTIS_BACKEND_HOST", "https://mantisdev.csail.mit.edu"),
-            "timeout": int(os.environ.get("MANTIS_TIMEOUT", 300000))  # 5 minutes timeout
-        })
-        
+        # Fetch the dataset from the payload store; the message only carries a reference
+        with metrics.timed("read_dataset"):
+            data = payloads.load(data)
+            df = read_dataset(data)
+
         cookie = data.get('cookie', '')
-        
+
         if not cookie:
             return {
                 "error": "No authentication cookie provided. Please ensure you are logged in to Mantis.",
                 "error_type": "authentication_missing"
             }
-        
-        mantis = ResilientMantisClient("/api/proxy/", cookie, config)
+
+        mantis = make_client(cookie, data.get("backend"))
 
         # Name of connection to create
         name = data.get('name', "Connection") or "Connection"
 
         def on_recieve_id(space_id, layer_id):
-            # Get job ID, exit if not found
-            job_id = data.get("job")
-            if job_id is None:
-                return
-            
-            # Update the cache with the specific job as a unique dict and store the space_id and layer_id
-            redis_cache.hset(f"job_space_id:{job_id}", "space_id", space_id)
-            redis_cache.hset(f"job_space_id:{job_id}", "layer_id", layer_id)
+            resume.save(task_id, _space_state(data, cookie, space_id, layer_id), "uploaded")
+
+            # Map the job, and duplicate submissions that joined this build, to the space
+            job_ids = [data.get("job")]
+            if data.get('dedup_key'):
+                job_ids.extend(dedup.attached_jobs(data['dedup_key']))
+
+            jobs.record(job_ids, space_id, layer_id, backend=_backend(data))
 
         # Prepare custom models for each data type
         data_types = data.get('data_types', {})
-        
-        # Check data size to prevent timeout issues
-        if len(df) < 100:
+
+        # Check data size to prevent timeout issues. JSON submissions were already
+        # checked by the web tier; encoded datasets are only counted here.
+        large_dataset_mode = data.get('large_dataset_mode') or validation.LARGE_DATASET_MODE
+        try:
+            validation.check_rows(len(df), large_dataset_mode)
+        except validation.Invalid as e:
+            return e.response()
+
+        if large_dataset_mode == "reject":
+            if len(df) > MAX_ROWS:
+                logger.info(f"Dataset has {len(df)} rows. Sampling to {MAX_ROWS} rows to prevent timeouts.")
+                df = df.sample(n=MAX_ROWS, random_state=42).reset_index(drop=True)
+
+        elif large_dataset_mode == "sample" and len(df) > MAX_ROWS:
+            logger.info(f"Dataset has {len(df)} rows. Keeping a representative sample of {MAX_ROWS} rows.")
+            with metrics.timed("sample"):
+                df = reduce_rows(df, MAX_ROWS, data_types)
+
+        elif large_dataset_mode == "shard" and len(df) > MAX_TOTAL_ROWS_SHARDED:
+            logger.info(f"Dataset has {len(df)} rows. Keeping a representative sample of {MAX_TOTAL_ROWS_SHARDED} rows to shard.")
+            with metrics.timed("sample"):
+                df = reduce_rows(df, MAX_TOTAL_ROWS_SHARDED, data_types)
+
+        # Use Mantis SDK for centralized space creation
+        space_name = name + " - " + str(uuid.uuid4())
+
+        # Drop unused columns, empty and duplicate rows, truncate text and downcast numbers
+        with metrics.timed("preprocess"):
+            df, preprocess_report = preprocess(df, data_types)
+        if len(df.columns) == 0:
             return {
-                "error": f"Dataset too small. Only {len(df)} rows provided, but minimum 100 rows are required for meaningful visualization.",
-                "error_type": "insufficient_data",
-                "row_count": len(df)
+                "error": "None of the dataset's columns have a data type. Assign a data type to at least one column.",
+                "error_type": "no_columns"
             }
-        
-        # If dataset is too large, sample it to prevent timeouts
-        # Use very aggressive sampling to prevent timeouts
-        if len(df) > 2000:
+
+        if large_dataset_mode == "shard" and len(df) > MAX_ROWS:
+            # Each shard becomes its own space; collect_space_shards stitches them together.
+            # Shards split the rows evenly, so each has more than MAX_ROWS / 2 and at most
+            # MAX_ROWS rows. They are already preprocessed, and preprocessing only drops rows,
+            # so "reject" mode never refuses or samples a shard. Shards carry the parent's job,
+            # so it resolves to a shard's space as soon as the backend accepts one, until
+            # collect_space_shards records the stitched result over it.
+            shard_count = math.ceil(len(df) / MAX_ROWS)
+            bounds = [index * len(df) // shard_count for index in range(shard_count + 1)]
+            shards = [df.iloc[start:end] for start, end in zip(bounds, bounds[1:])]
             return {
-                "error": f"Dataset too large. {len(df)} rows provided, but maximum 2,000 rows are recommended to prevent timeouts.",
-                "error_type": "dataset_too_large", 
-                "row_count": len(df)
+                "shards": [
+                    {
+                        "name": f"{name} (part {index + 1}/{shard_count})",
+                        "job": data.get("job"),
+                        "cookie": cookie,
+                        "data_types": data_types,
+                        "data": shard.to_dict(orient='list'),
+                        "large_dataset_mode": "reject",
+                    }
+                    for index, shard in enumerate(shards)
+                ]
             }
 
-        if len(df) > 1000:
-            logging.info(f"Dataset has {len(df)} rows. Sampling to 1000 rows to prevent timeouts.")
-            df = df.sample(n=1000, random_state=42).reset_index(drop=True)
-        
-        # Use Mantis SDK for centralized space creation
-        space_name = name + " - " + str(uuid.uuid4())
-        
-        # Convert data_types dict to the format expected by SDK
-        # data_types_dict = {}
-        # for column, data_type in data_types.items():
-        #     data_types_dict[column] = data_type
-        
-        # Additional optimization: remove any completely empty columns
-        df = df.dropna(axis=1, how='all')
-        
-        # Additional optimization: truncate very long text fields to reduce processing time
-        for column in df.columns:
-            if df[column].dtype == 'object':  # Text columns
-                df[column] = df[column].astype(str).str[:1000]  # Truncate to 1000 characters
-        
-        # Additional optimization: remove rows with all NaN values
-        df = df.dropna(how='all')
-        
-        # Log the final dataset size
-        print(f"Final dataset size: {len(df)} rows, {len(df.columns)} columns")
+        logger.info(f"Final dataset size: {len(df)} rows, {len(df.columns)} columns, {preprocess_report['bytes_saved']} bytes saved by preprocessing")
         embedding_model_default = os.environ.get("MANTIS_EMBEDDING_MODEL", "text-embedding-ada-002")
         custom_models = []
         for column in df.columns:
@@ -416,58 +513,57 @@ def process_space_creation(data):
                 custom_models.append(embedding_model_default)
             else:
                 custom_models.append(None)
-        
-        # Create space using SDK with timeout handling and retry mechanism
-        max_retries = 2
-        retry_count = 0
-        
-        while retry_count <= max_retries:
-            try:
-                space_result = mantis.create_space(
-                    space_name=space_name,
-                    data=df,
-                    data_types=data_types,
-                    custom_models=custom_models,
-                    reducer=ReducerModels.UMAP,
-                    privacy_level=SpacePrivacy.PRIVATE,
-                    ai_provider=AIProvider.OpenAI,
-                    on_recieve_id=on_recieve_id
-                )
-                break  # Success, exit retry loop
-            except RuntimeError as e:
-                if mantis.is_timeout_error(str(e)):
-                    retry_count += 1
-                    if retry_count <= max_retries:
-                        print(f"Timeout error occurred, retrying... (attempt {retry_count}/{max_retries})")
-                        # Reduce dataset size for retry - use very small samples
-                        if len(df) > 500:
-                            df = df.sample(n=500, random_state=42).reset_index(drop=True)
-                            print(f"Reduced dataset to {len(df)} rows for retry")
-                        continue
-                    else:
-                        return {
-                            "error": "Request timed out after multiple retries. The dataset may be too large or the server is under heavy load. Please try again later or with a smaller dataset.",
-                            "error_type": "timeout",
-                            "retry_count": retry_count,
-                            "stacktrace": traceback.format_exc()
-                        }
-                else:
-                    raise e
-        
-        # Extract space_id from result
-        space_id = space_result["space_id"]
-        
-        # For compatibility, we need to get the layer_id from the result
-        # The SDK's create_space method should return both space_id and layer_id
-        layer_id = space_result.get("layer_id", space_id)
-        
-        # Return a simplified response
-        # Return a simplified response
-        space_response = {
-            "space_id": space_id,
-            "layer_id": layer_id
-        }
-            
-        return space_response
+
+        # Retries after a timeout upload a small sample, which the backend is more likely to finish in time
+        attempts = data.get('upload_attempts', 0)
+        if attempts and len(df) > 500:
+            df = reduce_rows(df, 500, data_types)
+            logger.info(f"Reduced dataset to {len(df)} rows for retry")
+
+        # Upload with timeout handling, streaming the CSV into the request body
+        payload = CsvPayload(df) if UPLOAD_STREAMING else None
+        space_id = str(uuid.uuid4())
+
+        resume.save(task_id, _space_state(data, cookie, space_id, space_id), "uploading")
+        try:
+            space_result = mantis.start_space(
+                space_name=space_name,
+                data=payload if payload is not None else df,
+                data_types=data_types,
+                custom_models=custom_models,
+                reducer=ReducerModels.UMAP,
+                privacy_level=SpacePrivacy.PRIVATE,
+                ai_provider=AIProvider.OpenAI,
+                on_recieve_id=on_recieve_id,
+                space_id=space_id
+            )
+        except RuntimeError as e:
+            if not mantis.is_timeout_error(str(e)):
+                raise
+            attempts += 1
+            metrics.SPACE_RETRIES.labels("upload", "timeout").inc()
+
+            # The backend often keeps building the space after the upload request times out
+            status = mantis.probe_space(space_id)
+            if status in ("running", "completed"):
+                logger.warning(f"Upload timed out but space {space_id} is {status} on the backend; resuming it")
+                on_recieve_id(space_id, space_id)
+                return _space_state(data, cookie, space_id, space_id)
+
+            if attempts > MAX_RETRIES:
+                resume.clear(task_id)
+                return {**TIMEOUT_ERROR, "retry_count": attempts, "stacktrace": traceback.format_exc()}
+
+            if status in resume.GONE:
+                logger.warning(f"Upload of space {space_id} timed out, retrying... (attempt {attempts}/{MAX_RETRIES})")
+                resume.clear(task_id)
+            # Re-enqueued with a jittered backoff, so workers that timed out together do not
+            # resubmit together and no worker sleeps. A space in an unknown state is probed
+            # again through its resume record before anything is uploaded.
+            return {"retry_after": backoff_delay(attempts), "upload_attempts": attempts}
+
+        return _space_state(data, cookie, space_result["space_id"], space_result["layer_id"])
+    except BackendBusy as e:
+        return {"retry_after": e.retry_after}
     except Exception as e:
         return {"error": str(e), "stacktrace": traceback.format_exc()}
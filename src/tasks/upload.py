@@ -0,0 +1,103 @@
+import os
+import time
+import uuid
+import zlib
+
+import pandas as pd
+
+from src import metrics
+
+UPLOAD_STREAMING = os.environ.get("MANTIS_UPLOAD_STREAMING", "true").lower() == "true"
+UPLOAD_GZIP = os.environ.get("MANTIS_UPLOAD_GZIP", "false").lower() == "true"  # only if the backend reads .csv.gz
+UPLOAD_CHUNK_ROWS = int(os.environ.get("MANTIS_UPLOAD_CHUNK_ROWS", 500))
+
+
+def iter_csv(df: pd.DataFrame, chunk_rows: int = UPLOAD_CHUNK_ROWS):
+    """
+    Serialize a DataFrame to CSV a slice of rows at a time, so only one slice's
+    text is alive at once.
+    """
+    if df.empty:
+        yield df.to_csv(index=False).encode("utf-8")
+        return
+
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class CsvPayload:
+    """
+    Dataset to upload as the landscape file, streamed straight from the DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, compress: bool = UPLOAD_GZIP):
+        self.columns = df.columns
+        self.compress = compress
+        self._df = df
+
+    @property
+    def file_extension(self) -> str:
+        return "csv.gz" if self.compress else "csv"
+
+    @property
+    def content_type(self) -> str:
+        return "application/gzip" if self.compress else "text/csv"
+
+    def chunks(self):
+        chunks = iter_csv(self._df)
+        chunks = gzip_chunks(chunks) if self.compress else chunks
+
+        # Encoding is interleaved with sending, so only the time spent producing chunks is counted
+        elapsed = 0.0
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - start
+            if chunk is None:
+                break
+            yield chunk
+
+        metrics.STAGE_SECONDS.labels("csv_serialize").observe(elapsed)
+
+
+class MultipartBody:
+    """
+    multipart/form-data request body generated part by part, sent with chunked
+    encoding.
+    """
+
+    def __init__(self, fields: dict, file_field: str, filename: str, payload: CsvPayload):
+        self.boundary = uuid.uuid4().hex
+        self.payload = payload
+
+        head = b"".join(
+            self._part_header(f'name="{name}"') + str(value).encode("utf-8") + b"\r\n"
+            for name, value in fields.items()
+        )
+        head += self._part_header(f'name="{file_field}"; filename="{filename}"', payload.content_type)
+        self._head = head
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+
+    def _part_header(self, disposition: str, content_type: str | None = None) -> bytes:
+        header = f"--{self.boundary}\r\nContent-Disposition: form-data; {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode("utf-8")
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __iter__(self):
+        yield self._head
+        yield from self.payload.chunks()
+        yield self._tail
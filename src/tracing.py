@@ -0,0 +1,251 @@
+import cProfile
+import importlib
+import json
+import logging
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from celery.exceptions import TaskPredicate
+from celery.signals import before_task_publish
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = os.environ.get("TRACE_HEADER", "X-Trace-Id")
+# "none", "stdout", "file" or "package.module:factory" for a custom exporter
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none")
+TRACE_FILE = os.environ.get("TRACE_FILE", "/app/.traces/spans.jsonl")
+TRACE_SERVICE = os.environ.get("TRACE_SERVICE", "mantis-extensions")
+
+# Profile 1 in PROFILE_SAMPLE_RATE task executions with cProfile; 0 disables profiling
+PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/app/.profiles")
+
+# Incoming trace IDs are only accepted in this shape, so they are safe in file names and headers
+TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+_trace_id = ContextVar("trace_id", default=None)
+_span_id = ContextVar("span_id", default=None)
+
+
+class NullExporter:
+    def export(self, record: dict):
+        pass
+
+
+class StdoutExporter:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def export(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class FileExporter:
+    """
+    Appends one JSON span per line. Each process opens the file in append
+    mode, so web and worker processes can share it.
+    """
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as spans_file:
+                spans_file.write(line)
+
+
+def load_exporter(name: str):
+    """
+    Exporter for a TRACE_EXPORTER value. Custom exporters are given as
+    "package.module:factory"; the factory is called with no arguments and
+    must return an object with an export(record) method.
+    """
+    if name in ("", "none"):
+        return NullExporter()
+    if name == "stdout":
+        return StdoutExporter()
+    if name == "file":
+        return FileExporter()
+
+    module_name, _, attribute = name.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+exporter = load_exporter(TRACE_EXPORTER)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> str | None:
+    return _trace_id.get()
+
+
+class Span:
+    """
+    One timed hop of a trace. Entering it makes it the parent of spans opened
+    in the same context; a span opened outside any trace starts a new one.
+    """
+
+    def __init__(self, name: str, trace_id: str | None = None, parent_id: str | None = None, **attributes):
+        self.name = name
+        self.trace_id = trace_id or _trace_id.get() or new_trace_id()
+        self.parent_id = parent_id if trace_id else _span_id.get()
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = attributes
+        self._tokens = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._tokens = (_trace_id.set(self.trace_id), _span_id.set(self.span_id))
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        trace_token, span_token = self._tokens
+        try:
+            _span_id.reset(span_token)
+            _trace_id.reset(trace_token)
+        except ValueError:
+            # ended from another context, e.g. after a streamed response
+            pass
+
+        # Task.replace and retries unwind through the task as exceptions
+        failed = exc is not None and not isinstance(exc, (TaskPredicate, GeneratorExit))
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": TRACE_SERVICE,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "start": self._started_at,
+            "duration_ms": round(duration * 1000, 3),
+            "status": "error" if failed else "ok",
+            "attributes": self.attributes,
+        }
+        if failed:
+            record["error"] = f"{type(exc).__name__}: {exc}"
+
+        try:
+            exporter.export(record)
+        except Exception:
+            logger.warning("could not export span %s", self.name, exc_info=True)
+
+        return False
+
+
+def span(name: str, **attributes) -> Span:
+    return Span(name, **attributes)
+
+
+def outbound_headers() -> dict:
+    """
+    Headers that carry the current trace to a downstream service.
+    """
+    trace_id = _trace_id.get()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+
+@contextmanager
+def profiled(name: str, task_id: str | None):
+    """
+    Profile a sampled share of task executions. Stats are written under
+    PROFILE_DIR/<trace ID>/ in pstats format, which snakeviz and flameprof
+    render as flame graphs.
+    """
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= 1 / PROFILE_SAMPLE_RATE:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already active in this thread
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        directory = os.path.join(PROFILE_DIR, _trace_id.get() or "untraced")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f"{name}-{task_id or uuid.uuid4().hex}.prof"))
+        except OSError:
+            logger.warning("could not write profile for %s", name, exc_info=True)
+
+
+@contextmanager
+def task_span(task):
+    """
+    Span for one execution of a Celery task, joined to the trace it was
+    published under, with sampled profiling.
+    """
+    name = task.name.rsplit(".", 1)[-1]
+    trace_id = getattr(task.request, "trace_id", None)
+    parent_id = getattr(task.request, "parent_span_id", None)
+
+    with Span(f"task {name}", trace_id=trace_id, parent_id=parent_id, task_id=task.request.id), profiled(name, task.request.id):
+        yield
+
+
+@before_task_publish.connect
+def _propagate_trace(headers=None, **kwargs):
+    trace_id = _trace_id.get()
+    if headers is not None and trace_id:
+        headers["trace_id"] = trace_id
+        headers["parent_span_id"] = _span_id.get()
+
+
+def init_app(app):
+    """
+    Open a span for every request, continuing the caller's trace when it sends
+    a valid TRACE_HEADER, and return the trace ID in the same header.
+    """
+
+    @app.before_request
+    def _start_request_span():
+        incoming = request.headers.get(TRACE_HEADER)
+        trace_id = incoming if incoming and TRACE_ID_PATTERN.match(incoming) else new_trace_id()
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g.trace_span = Span(f"{request.method} {route}", trace_id=trace_id).__enter__()
+
+    @app.after_request
+    def _add_trace_header(response):
+        trace_span = g.get("trace_span")
+        if trace_span is not None:
+            response.headers[TRACE_HEADER] = trace_span.trace_id
+            trace_span.set(status_code=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _end_request_span(error=None):
+        trace_span = g.pop("trace_span", None)
+        if trace_span is not None:
+            trace_span.__exit__(type(error) if error else None, error, None)
@@ -0,0 +1,341 @@
+import itertools
+import os
+
+import ijson
+
+# Row limits shared by the web tier, which checks JSON submissions before they
+# are queued, and the worker, which checks every dataset once it is decoded
+MIN_ROWS = 100
+MAX_TOTAL_ROWS = int(os.environ.get("SPACE_MAX_TOTAL_ROWS", 100000))
+REJECT_MAX_ROWS = 2000
+LARGE_DATASET_MODE = os.environ.get("SPACE_LARGE_DATASET_MODE", "sample")
+
+# Longest single text value accepted; the worker truncates text to
+# SPACE_MAX_TEXT_LENGTH anyway, so anything far past it is a malformed upload
+MAX_VALUE_LENGTH = int(os.environ.get("SPACE_MAX_VALUE_LENGTH", 100_000))
+
+READ_CHUNK_SIZE = 64 * 1024
+
+_ARRAY = object()
+
+
+class Invalid(Exception):
+    def __init__(self, message: str, error_type: str, **details):
+        super().__init__(message)
+        self.error_type = error_type
+        self.details = details
+
+    def response(self) -> dict:
+        return {"error": str(self), "error_type": self.error_type, **self.details}
+
+
+class _Recorder:
+    """
+    File-like view of the request stream that keeps what the parser has read,
+    so a valid body does not have to be read twice.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunks = []
+
+    def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            # werkzeug's LimitedStream reports an empty read as a client disconnect
+            return b""
+        chunk = self.stream.read(size)
+        self.chunks.append(chunk)
+        return chunk
+
+    def body(self) -> bytes:
+        return b"".join(self.chunks) + self.stream.read()
+
+
+def _type_name(data_type) -> str:
+    return str(data_type).rsplit(".", 1)[-1].lower()
+
+
+def check_rows(row_count: int, large_dataset_mode: str | None):
+    if row_count < MIN_ROWS:
+        raise Invalid(
+            f"Dataset too small. Only {row_count} rows provided, but minimum {MIN_ROWS} rows are required for meaningful visualization.",
+            "insufficient_data", row_count=row_count,
+        )
+    if row_count > MAX_TOTAL_ROWS:
+        raise Invalid(
+            f"Dataset too large. {row_count} rows provided, but at most {MAX_TOTAL_ROWS:,} rows are supported.",
+            "dataset_too_large", row_count=row_count,
+        )
+    if (large_dataset_mode or LARGE_DATASET_MODE) == "reject" and row_count > REJECT_MAX_ROWS:
+        raise Invalid(
+            f"Dataset too large. {row_count} rows provided, but maximum {REJECT_MAX_ROWS:,} rows are recommended to prevent timeouts.",
+            "dataset_too_large", row_count=row_count,
+        )
+
+
+def _check_cookie(cookie):
+    if not cookie:
+        raise Invalid("No authentication cookie provided. Please ensure you are logged in to Mantis.", "authentication_missing")
+
+
+def _invalid_data_types():
+    raise Invalid("data_types must be an object mapping column names to data types.", "invalid_data_types")
+
+
+def check_options(options: dict, columns=None):
+    """
+    Checks that need no dataset rows: the cookie, and that data_types gives at
+    least one of the dataset's columns (any column, when they are not known
+    before decoding) a type other than delete.
+    """
+    _check_cookie(options.get("cookie"))
+
+    data_types = options.get("data_types") or {}
+    if not isinstance(data_types, dict):
+        _invalid_data_types()
+
+    typed = [column for column, data_type in data_types.items() if _type_name(data_type) != "delete"]
+    if columns is not None:
+        typed = [column for column in typed if column in columns]
+    if not typed:
+        raise Invalid("None of the dataset's columns have a data type. Assign a data type to at least one column.", "no_columns")
+
+
+def _too_long():
+    raise Invalid(f"A text value is longer than {MAX_VALUE_LENGTH:,} characters.", "value_too_large")
+
+
+def _count_rows(events) -> int:
+    """
+    Consume one column's array from the event stream and return its length.
+    This loop sees every value of the dataset, so it does as little as possible.
+    """
+    count, nested = 0, 0
+    for event, value in events:
+        if nested == 0:
+            if event == "end_array":
+                return count
+            count += 1
+            if count > MAX_TOTAL_ROWS:
+                raise Invalid(f"Dataset too large. More than {MAX_TOTAL_ROWS:,} rows provided.", "dataset_too_large")
+
+        if event == "string":
+            if len(value) > MAX_VALUE_LENGTH:
+                _too_long()
+        elif event == "start_map" or event == "start_array":
+            nested += 1
+        elif event == "end_map" or event == "end_array":
+            nested -= 1
+    return count
+
+
+def _scan(events) -> tuple[dict, dict]:
+    """
+    Top-level scalars and data_types of a create-space body, and the row count
+    of each column under "data", from ijson basic_parse events. Only the
+    column lengths are kept, never the rows themselves; a dataset past
+    MAX_TOTAL_ROWS, or a text value past MAX_VALUE_LENGTH, stops the scan, as
+    does an empty cookie or a data_types that is not an object. The scan ends
+    with the body's object; data_types is None when the body has none.
+    """
+    events = iter(events)
+    options, data_types, rows = {}, None, {}
+    # one entry per open container: the current key of a map, _ARRAY for an array
+    path = []
+
+    for event, value in events:
+        if event == "map_key":
+            path[-1] = value
+            if len(path) == 2 and path[0] == "data":
+                rows[value] = None
+            continue
+
+        if event == "end_map" or event == "end_array":
+            path.pop()
+            if not path:
+                break
+            continue
+
+        depth = len(path)
+        if depth == 2 and path[0] == "data" and event == "start_array":
+            rows[path[1]] = _count_rows(events)
+            continue
+        if depth == 2 and path[0] == "data_types":
+            data_types[path[1]] = value
+        elif depth == 1:
+            key = path[0]
+            # Reject bad options when they are seen rather than after the dataset
+            if key == "data_types":
+                if event != "start_map" and event != "null":
+                    _invalid_data_types()
+                data_types = {}
+            if event != "start_map" and event != "start_array":
+                options[key] = value
+                if key == "cookie":
+                    _check_cookie(value)
+
+        if event == "string" and len(value) > MAX_VALUE_LENGTH:
+            _too_long()
+        elif event == "start_map":
+            path.append(None)
+        elif event == "start_array":
+            path.append(_ARRAY)
+
+    return options, {"data_types": data_types, "rows": rows}
+
+
+def read_json_submission(stream) -> bytes:
+    """
+    Validate a JSON create-space body while it is read from the request
+    stream, and return the body once it is known to be worth queueing.
+    Raises Invalid as soon as the body cannot succeed.
+    """
+    recorder = _Recorder(stream)
+    events = ijson.basic_parse(recorder, buf_size=READ_CHUNK_SIZE, use_float=True)
+    try:
+        options, dataset = _scan(events)
+        # Anything after the object still has to parse
+        for _ in events:
+            pass
+    except ijson.JSONError as e:
+        raise Invalid(f"The request body is not valid JSON: {e}", "invalid_json")
+
+    _check_scanned(options, dataset["data_types"], dataset["rows"])
+    return recorder.body()
+
+
+def _check_scanned(options: dict, data_types: dict | None, columns: dict):
+    # An absent cookie is only known once the body ends; it is still checked
+    # before the columns, which take a pass over every row count
+    check_options({**options, "data_types": data_types}, columns)
+
+    lengths = {count for count in columns.values() if count is not None}
+    if len(lengths) > 1:
+        raise Invalid("Every column under data must have the same number of rows.", "invalid_dataset")
+    if lengths:
+        check_rows(lengths.pop(), options.get("large_dataset_mode"))
+
+
+class _Nesting:
+    """
+    Event stream that tracks how deeply the parser is nested, so the rest of a
+    rejected batch item can be skipped.
+    """
+
+    def __init__(self, events):
+        self.events = iter(events)
+        self.depth = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event, value = next(self.events)
+        if event == "start_map" or event == "start_array":
+            self.depth += 1
+        elif event == "end_map" or event == "end_array":
+            self.depth -= 1
+        return event, value
+
+    def skip_to(self, depth: int):
+        while self.depth > depth:
+            next(self)
+
+
+def _scan_specs(events: _Nesting, specs: list, max_items: int):
+    for event, value in events:
+        if events.depth == 1:
+            # the end of the list
+            return
+        if len(specs) == max_items:
+            raise Invalid(f"At most {max_items} spaces can be created per batch", "batch_too_large")
+
+        if event == "start_map":
+            try:
+                specs.append(_scan(itertools.chain([(event, value)], events)))
+            except Invalid as e:
+                specs.append(e)
+        else:
+            specs.append(None)
+        events.skip_to(2)
+
+
+def _scan_data_types(events: _Nesting, event: str, value) -> dict:
+    if event == "null":
+        return {}
+    if event != "start_map":
+        _invalid_data_types()
+
+    data_types, column = {}, None
+    for event, value in events:
+        if events.depth == 1:
+            return data_types
+        if event == "map_key":
+            column = value
+            continue
+        data_types[column] = value
+        events.skip_to(2)
+    return data_types
+
+
+def _scan_batch(events, max_items: int) -> tuple[dict, dict | None, list]:
+    """
+    Top-level scalars and data_types of a create-spaces body, and for each
+    spec under "spaces" its _scan, the Invalid that stopped it, or None when
+    the spec is not an object. More than max_items specs stop the scan.
+    """
+    events = _Nesting(events)
+    shared, data_types, specs = {}, None, []
+
+    for event, key in events:
+        if event != "map_key" or events.depth != 1:
+            continue
+
+        event, value = next(events)
+        if key == "spaces" and event == "start_array":
+            _scan_specs(events, specs, max_items)
+        elif key == "data_types":
+            data_types = _scan_data_types(events, event, value)
+        elif event != "start_map" and event != "start_array":
+            shared[key] = value
+        events.skip_to(1)
+
+    return shared, data_types, specs
+
+
+def read_json_batch(stream, shared_fields, max_items: int) -> tuple[bytes, dict[int, Invalid]]:
+    """
+    Validate a JSON create-spaces body while it is read from the request
+    stream. Each spec is checked like a create-space body, with the
+    shared_fields given at the top level filling in what it leaves out.
+    Returns the body and the error of every spec that cannot succeed, by
+    index; raises Invalid when the body as a whole is unusable.
+    """
+    recorder = _Recorder(stream)
+    try:
+        shared, data_types, specs = _scan_batch(
+            ijson.basic_parse(recorder, buf_size=READ_CHUNK_SIZE, use_float=True), max_items
+        )
+    except ijson.JSONError as e:
+        raise Invalid(f"The request body is not valid JSON: {e}", "invalid_json")
+
+    shared = {field: value for field, value in shared.items() if field in shared_fields}
+    if "data_types" not in shared_fields:
+        data_types = None
+
+    errors = {}
+    for index, spec in enumerate(specs):
+        if isinstance(spec, Invalid):
+            errors[index] = spec
+        elif spec is not None:
+            options, dataset = spec
+            try:
+                _check_scanned(
+                    {**shared, **options},
+                    data_types if dataset["data_types"] is None else dataset["data_types"],
+                    dataset["rows"],
+                )
+            except Invalid as e:
+                errors[index] = e
+
+    return recorder.body(), errors
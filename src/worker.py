@@ -1,7 +1,9 @@
 from dotenv import load_dotenv
-from src.app import create_app
 
+# Settings are read when src modules are imported, so .env is loaded before any of them
 load_dotenv ()
 load_dotenv (".env.development", override=True) # Load dev if it exists
 
+from src.app import create_app
+
 app, celery = create_app ()
\ No newline at end of file
@@ -0,0 +1,23 @@
+import fakeredis
+import pytest
+
+from src import extensions
+
+server = fakeredis.FakeServer()
+
+# Modules bind redis_client when they are imported, so it is swapped before any of them are
+extensions.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+@pytest.fixture(autouse=True)
+def redis_client():
+    extensions.redis_client.flushall()
+    yield extensions.redis_client
+
+
+@pytest.fixture
+def async_redis():
+    """
+    asyncio client on the same fake server, for code that runs in the progress poller.
+    """
+    return fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
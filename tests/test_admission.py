@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from src import admission, scheduling
+
+
+@pytest.fixture(autouse=True)
+def queue_wait(monkeypatch):
+    """
+    Broker reads are replaced by a wait the test sets; (None, 0) is an unreadable broker.
+    """
+    status = {"depth": 0, "wait": 0.0}
+    monkeypatch.setattr(admission, "_queue_status", lambda queue: (status["depth"], status["wait"]))
+    return status
+
+
+def submission(user: str = "user") -> dict:
+    return {"queue": scheduling.QUEUE_SMALL, "user": user}
+
+
+def test_admitted_task_counts_until_released(monkeypatch):
+    monkeypatch.setattr(admission, "USER_MAX_INFLIGHT", 2)
+    assert admission.admit("t1", submission()).admitted
+    assert admission.admit("t2", submission()).admitted
+
+    refused = admission.admit("t3", submission())
+    assert refused.outcome == admission.USER_LIMIT
+    assert refused.retry_after == pytest.approx(admission.DEFAULT_BUILD_SECONDS, abs=5)
+    assert admission.admit("t3", submission("other")).admitted
+
+    admission.release("t1", "user")
+    assert admission.admit("t4", submission()).admitted
+
+
+def test_service_capacity(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_INFLIGHT", 1)
+    assert admission.admit("t1", submission("a")).admitted
+    assert admission.admit("t2", submission("b")).outcome == admission.CAPACITY
+
+
+def test_long_queue_is_refused_until_it_drains_to_the_budget(monkeypatch, queue_wait):
+    monkeypatch.setattr(admission, "WAIT_BUDGET", 300)
+    queue_wait.update(depth=40, wait=420.0)
+
+    decision = admission.admit("t1", submission())
+    assert decision.outcome == admission.QUEUE_FULL
+    assert decision.retry_after == 120
+    assert decision.estimate()["estimated_wait_seconds"] == 420
+    # a refused task holds no in-flight slot
+    assert admission.live_estimate("t1", started=False) is None
+
+
+def test_unreadable_broker_does_not_turn_work_away(queue_wait):
+    queue_wait.update(depth=None, wait=0.0)
+    assert admission.admit("t1", submission()).admitted
+
+
+def test_expired_leases_stop_counting(monkeypatch, redis_client):
+    monkeypatch.setattr(admission, "USER_MAX_INFLIGHT", 1)
+    assert admission.admit("t1", submission()).admitted
+    # a worker killed mid-build never releases its task
+    redis_client.zadd(admission._user_key("user"), {"t1": time.time() - admission.INFLIGHT_LEASE - 1})
+    assert admission.admit("t2", submission()).admitted
+
+
+def test_live_estimate_follows_observed_build_times(queue_wait):
+    queue_wait.update(depth=2, wait=30.0)
+    admission.admit("t1", submission())
+    queued = admission.live_estimate("t1", started=False)
+    assert queued["queue"] == scheduling.QUEUE_SMALL and 0 < queued["estimated_wait_seconds"] <= 30
+
+    admission.observe_build(100)
+    assert admission.live_estimate("t1", started=True)["estimated_remaining_seconds"] == pytest.approx(100, abs=1)
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from src.tasks import backend_guard
+
+BACKEND = "https://frontend.test"
+
+
+def open_circuit(record_failure=backend_guard.record_failure):
+    for _ in range(backend_guard.BREAKER_THRESHOLD):
+        record_failure(BACKEND)
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backend_guard.backoff_delay(attempt, base=1, cap=8) <= 8 for attempt in range(10))
+
+
+def test_request_kind():
+    assert backend_guard.request_kind("post", "/synthesis/landscape/") == backend_guard.LANDSCAPE
+    assert backend_guard.request_kind("GET", "synthesis/progress/1") == backend_guard.POLL
+
+
+def test_circuit_opens_after_threshold_and_half_opens_after_cooldown(monkeypatch):
+    open_circuit()
+    assert backend_guard.circuit_states([BACKEND]) == [backend_guard.OPEN]
+    with pytest.raises(backend_guard.BackendBusy) as excinfo:
+        backend_guard.before_request(BACKEND, backend_guard.POLL)
+    assert excinfo.value.retry_after > 0
+
+    # after the cooldown one probe goes through; a second caller waits for it
+    monkeypatch.setattr(backend_guard, "BREAKER_COOLDOWN", 0)
+    backend_guard.before_request(BACKEND, backend_guard.POLL)
+    assert backend_guard.circuit_states([BACKEND]) == [backend_guard.HALF_OPEN]
+    with pytest.raises(backend_guard.BackendBusy):
+        backend_guard.before_request(BACKEND, backend_guard.POLL)
+
+    backend_guard.record_success(BACKEND)
+    assert backend_guard.circuit_states([BACKEND]) == [backend_guard.CLOSED]
+
+
+def test_failed_probe_opens_the_circuit_again(monkeypatch):
+    open_circuit()
+    monkeypatch.setattr(backend_guard, "BREAKER_COOLDOWN", 0)
+    backend_guard.before_request(BACKEND, backend_guard.POLL)
+    backend_guard.record_failure(BACKEND)
+    assert backend_guard.snapshot(BACKEND)["circuit"]["times_opened"] == 2
+
+
+def test_success_resets_the_failure_count():
+    for _ in range(backend_guard.BREAKER_THRESHOLD - 1):
+        backend_guard.record_failure(BACKEND)
+    backend_guard.record_success(BACKEND)
+    backend_guard.record_failure(BACKEND)
+    assert backend_guard.circuit_states([BACKEND]) == [backend_guard.CLOSED]
+
+
+def test_async_guard_shares_state_with_workers(async_redis):
+    guard = backend_guard.AsyncGuard(async_redis)
+
+    async def failures():
+        for _ in range(backend_guard.BREAKER_THRESHOLD):
+            await guard.record_failure(BACKEND)
+
+    asyncio.run(failures())
+    with pytest.raises(backend_guard.BackendBusy):
+        backend_guard.before_request(BACKEND, backend_guard.POLL)
+    with pytest.raises(backend_guard.BackendBusy):
+        asyncio.run(guard.before_request(BACKEND, backend_guard.POLL))
+
+
+def test_async_guard_raises_instead_of_waiting_for_a_token(async_redis, monkeypatch):
+    monkeypatch.setitem(backend_guard.BUCKETS, backend_guard.POLL, (1, 1))
+    guard = backend_guard.AsyncGuard(async_redis)
+    asyncio.run(guard.before_request(BACKEND, backend_guard.POLL))
+    with pytest.raises(backend_guard.BackendBusy) as excinfo:
+        asyncio.run(guard.before_request(BACKEND, backend_guard.POLL))
+    assert 0 < excinfo.value.retry_after <= 1
+
+
+def test_worker_raises_instead_of_sleeping_for_a_token(monkeypatch):
+    monkeypatch.setitem(backend_guard.BUCKETS, backend_guard.LANDSCAPE, (0.01, 1))
+    monkeypatch.setattr(backend_guard.time, "sleep", lambda seconds: pytest.fail("the guard slept"))
+    backend_guard.before_request(BACKEND, backend_guard.LANDSCAPE)
+    with pytest.raises(backend_guard.BackendBusy) as excinfo:
+        backend_guard.before_request(BACKEND, backend_guard.LANDSCAPE)
+    assert excinfo.value.reason == "rate limited (landscape)"
+    assert 0 < excinfo.value.retry_after <= 100
@@ -0,0 +1,77 @@
+import asyncio
+
+from src.tasks import backend_guard, backend_pool
+
+FIRST, SECOND, THIRD = "https://a.test", "https://b.test", "https://c.test"
+
+
+def use_hosts(monkeypatch, *hosts):
+    monkeypatch.setenv("MANTIS_HOSTS", ",".join(hosts))
+
+
+def fail(backend, times=backend_pool.EJECT_MIN_REQUESTS):
+    for _ in range(times):
+        backend_pool.record(backend, False)
+
+
+def test_single_backend_is_always_chosen(monkeypatch):
+    use_hosts(monkeypatch, FIRST)
+    fail(FIRST)
+    assert backend_pool.choose() == FIRST
+
+
+def test_failing_backend_is_ejected_then_readmitted(monkeypatch):
+    use_hosts(monkeypatch, FIRST, SECOND)
+    fail(FIRST)
+    report = backend_pool.snapshot()
+    assert report[FIRST]["ejected"] and report[FIRST]["times_ejected"] == 1
+    assert {backend_pool.choose() for _ in range(20)} == {SECOND}
+
+    monkeypatch.setattr(backend_pool, "EJECT_SECONDS", 0)
+    fail(FIRST)
+    assert not backend_pool.snapshot()[FIRST]["ejected"]
+    assert backend_pool.snapshot()[FIRST]["success_rate"] == 1
+
+
+def test_open_circuit_is_skipped(monkeypatch):
+    use_hosts(monkeypatch, FIRST, SECOND)
+    for _ in range(backend_guard.BREAKER_THRESHOLD):
+        backend_guard.record_failure(SECOND)
+    assert {backend_pool.choose() for _ in range(20)} == {FIRST}
+
+
+def test_every_backend_ejected_picks_the_one_back_soonest(monkeypatch):
+    use_hosts(monkeypatch, FIRST, SECOND)
+    fail(FIRST)
+    fail(FIRST, backend_pool.EJECT_MIN_REQUESTS)
+    fail(SECOND)
+    assert backend_pool.choose() == SECOND
+
+
+def test_two_choices_prefer_the_lower_score(monkeypatch):
+    use_hosts(monkeypatch, FIRST, SECOND)
+    backend_pool.record(FIRST, True, 5.0)
+    backend_pool.record(SECOND, True, 0.1)
+    assert {backend_pool.choose() for _ in range(20)} == {SECOND}
+
+    use_hosts(monkeypatch, FIRST, SECOND, THIRD)
+    # the slowest backend only loses when it is one of the two picked
+    assert FIRST not in {backend_pool.choose() for _ in range(50)}
+
+
+def test_score():
+    assert backend_pool.score({}) == 0
+    assert backend_pool.score({"latency": "2", "success": "0.5"}) == 4
+    assert backend_pool.score({"latency": "1", "success": "0"}) == 1 / backend_pool.MIN_SUCCESS_RATE
+
+
+def test_async_health_records_like_record(async_redis, monkeypatch):
+    use_hosts(monkeypatch, FIRST, SECOND)
+    health = backend_pool.AsyncHealth(async_redis)
+
+    async def failures():
+        for _ in range(backend_pool.EJECT_MIN_REQUESTS):
+            await health.record(FIRST, False, 1.0)
+
+    asyncio.run(failures())
+    assert backend_pool.snapshot()[FIRST]["ejected"]
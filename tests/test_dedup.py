@@ -0,0 +1,46 @@
+from src import dedup, jobs
+
+
+def submission(**fields) -> dict:
+    return {"cookie": "cookie", "data": {"title": ["a", "b"]}, "data_types": {"title": "title"}, **fields}
+
+
+def test_key_ignores_column_order_name_and_job():
+    first = submission(name="one", job="a")
+    second = {**submission(name="two", job="b"), "data": {"title": ["a", "b"]}}
+    assert dedup.submission_key(first) == dedup.submission_key(second)
+    assert dedup.submission_key(submission()) != dedup.submission_key(submission(cookie="other"))
+    assert dedup.submission_key(submission()) != dedup.submission_key(submission(data={"title": ["a"]}))
+
+
+def test_claim_attach_and_complete():
+    key = dedup.submission_key(submission())
+    assert dedup.claim(key, "task-1") is None
+    assert dedup.claim(key, "task-2") == "task-1"
+
+    dedup.attach_job(key, "late-job")
+    dedup.complete(key, "task-1", {"space_id": "space", "layer_id": "layer", "backend": "https://frontend.test"})
+
+    assert dedup.completed(key) == {"task_id": "task-1", "space_id": "space", "layer_id": "layer", "backend": "https://frontend.test"}
+    assert jobs.lookup("late-job")["space_id"] == "space"
+    # the build is finished, so the next submission is free to claim again
+    assert dedup.claim(key, "task-3") is None
+
+
+def test_failed_build_can_be_taken_over_once():
+    key = dedup.submission_key(submission())
+    dedup.claim(key, "dead")
+    assert dedup.take_over(key, "dead", "task-1")
+    assert not dedup.take_over(key, "dead", "task-2")
+    assert dedup.claim(key, "task-2") == "task-1"
+
+
+def test_release_by_task_keeps_a_newer_claim():
+    key = dedup.submission_key(submission())
+    dedup.claim(key, "dead")
+    dedup.take_over(key, "dead", "task-1")
+    dedup.release(key, "dead")
+    assert dedup.claim(key, "task-2") == "task-1"
+
+    dedup.release(key, "task-1")
+    assert dedup.claim(key, "task-2") is None
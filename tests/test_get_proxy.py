@@ -0,0 +1,116 @@
+import io
+
+import pytest
+import requests
+from flask import Flask
+from urllib3.response import HTTPResponse
+
+from src.api import get_proxy, proxy_cache, upstream
+
+URL = "https://tiles.example.com/layer/0/0/0.png"
+
+
+class Upstream:
+    """
+    Stands in for upstream.fetch, answering from a queue of responses and
+    keeping the headers each request was sent with.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, url, headers=None):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+def response(body: bytes = b"tile", status: int = 200, **headers) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status
+    result.raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status, preload_content=False)
+    result.headers = requests.structures.CaseInsensitiveDict(headers)
+    return result
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(proxy_cache, "cache", proxy_cache.ProxyCache(1024 * 1024, 64 * 1024))
+    monkeypatch.setattr(upstream, "PASSTHROUGH", False)
+    app = Flask(__name__)
+    app.register_blueprint(get_proxy.get_proxy)
+    return app.test_client()
+
+
+def test_upstream_response_is_closed_when_relaying_fails(client, monkeypatch):
+    fetched = response()
+    closed = []
+    monkeypatch.setattr(fetched, "close", lambda: closed.append(True))
+    monkeypatch.setattr(upstream, "fetch", Upstream(fetched))
+
+    def broken_headers(response):
+        raise ValueError("bad header")
+    monkeypatch.setattr(upstream, "relay_headers", broken_headers)
+
+    answer = client.get(f"/get_proxy/{URL}")
+    assert answer.status_code == 502
+    assert "bad header" not in answer.get_data(as_text=True)
+    assert closed
+
+
+def test_fresh_entry_is_served_without_calling_upstream(client, monkeypatch):
+    fetch = Upstream(response(b"tile", **{"Cache-Control": "max-age=60", "ETag": '"v1"'}))
+    monkeypatch.setattr(upstream, "fetch", fetch)
+
+    first = client.get(f"/get_proxy/{URL}")
+    assert first.headers["X-Cache"] == "MISS" and first.data == b"tile"
+    second = client.get(f"/get_proxy/{URL}")
+    assert second.headers["X-Cache"] == "HIT" and second.data == b"tile"
+    assert len(fetch.requests) == 1
+
+    conditional = client.get(f"/get_proxy/{URL}", headers={"If-None-Match": '"v1"'})
+    assert conditional.status_code == 304 and conditional.data == b""
+
+
+def test_stale_entry_is_revalidated(client, monkeypatch):
+    fetch = Upstream(
+        response(b"tile", **{"Cache-Control": "max-age=0", "ETag": '"v1"'}),
+        response(b"", status=304, **{"Cache-Control": "max-age=60", "ETag": '"v1"'}),
+    )
+    monkeypatch.setattr(upstream, "fetch", fetch)
+
+    # the entry is stored once the body has been streamed to the client
+    assert client.get(f"/get_proxy/{URL}").data == b"tile"
+    revalidated = client.get(f"/get_proxy/{URL}")
+    assert revalidated.headers["X-Cache"] == "REVALIDATED"
+    assert revalidated.status_code == 200 and revalidated.data == b"tile"
+    assert fetch.requests[1]["If-None-Match"] == '"v1"'
+    assert client.get(f"/get_proxy/{URL}").headers["X-Cache"] == "HIT"
+
+
+def test_range_requests_bypass_the_cache(client, monkeypatch):
+    fetch = Upstream(
+        response(b"ti", status=206, **{"Content-Range": "bytes 0-1/4", "Cache-Control": "max-age=60"}),
+        response(b"tile", **{"Cache-Control": "max-age=60"}),
+    )
+    monkeypatch.setattr(upstream, "fetch", fetch)
+
+    partial = client.get(f"/get_proxy/{URL}", headers={"Range": "bytes=0-1", "Accept-Encoding": "gzip"})
+    assert partial.status_code == 206 and partial.data == b"ti"
+    # a byte range of an encoding the proxy would inflate is meaningless, so identity is asked for
+    assert fetch.requests[0]["Range"] == "bytes=0-1"
+    assert fetch.requests[0]["Accept-Encoding"] == "identity"
+
+    full = client.get(f"/get_proxy/{URL}")
+    assert full.headers["X-Cache"] == "MISS" and full.data == b"tile"
+    assert len(fetch.requests) == 2
+
+
+def test_passthrough_forwards_the_clients_encoding(client, monkeypatch):
+    monkeypatch.setattr(upstream, "PASSTHROUGH", True)
+    fetch = Upstream(response(b"encoded", **{"Content-Encoding": "br"}))
+    monkeypatch.setattr(upstream, "fetch", fetch)
+
+    relayed = client.get(f"/get_proxy/{URL}", headers={"Accept-Encoding": "br", "Range": "bytes=0-"})
+    assert fetch.requests[0]["Accept-Encoding"] == "br"
+    assert relayed.headers["Content-Encoding"] == "br" and relayed.data == b"encoded"
@@ -0,0 +1,16 @@
+from src import jobs
+
+
+def test_record_keeps_the_backend_that_built_the_space():
+    jobs.record(["job-1", None, "job-2"], "space", "layer", backend="https://other.test")
+    assert jobs.lookup("job-1") == {"space_id": "space", "layer_id": "layer", "backend": "https://other.test"}
+    assert jobs.lookup_many(["job-2", "job-3"]) == {
+        "job-2": {"space_id": "space", "layer_id": "layer", "backend": "https://other.test"},
+        "job-3": None,
+    }
+
+
+def test_shards_are_listed():
+    shards = [{"index": 0, "space_id": "a", "layer_id": "a", "backend": "https://frontend.test"}]
+    jobs.record("job", "a", "a", shards=shards)
+    assert jobs.lookup("job") == {"space_id": "a", "layer_id": "a", "shards": shards}
@@ -0,0 +1,102 @@
+import pytest
+import requests
+
+pytest.importorskip("mantis_sdk")
+
+from src.tasks import backend_guard, backend_pool, mantis_client
+
+
+@pytest.fixture(autouse=True)
+def hosts(monkeypatch):
+    monkeypatch.setenv("MANTIS_HOST", "https://frontend.test")
+    monkeypatch.setenv("MANTIS_BACKEND_HOST", "https://backend.test")
+
+
+def test_proxied_requests_go_to_the_frontend():
+    client = mantis_client.ResilientMantisClient("/api/proxy/", "cookie")
+    assert client.request_url("synthesis/progress/1") == "https://frontend.test/api/proxy/synthesis/progress/1/"
+
+
+def test_other_base_urls_go_to_the_backend_host():
+    client = mantis_client.ResilientMantisClient("/api/", "cookie")
+    assert client.request_url("/synthesis/landscape/1/select-umap/2", rm_slash=True) == "https://backend.test/api/synthesis/landscape/1/select-umap/2"
+
+
+def test_pooled_backend_serves_its_own_api():
+    client = mantis_client.ResilientMantisClient("/api/", "cookie", host="https://other.test")
+    assert client.backend_host == "https://other.test"
+    assert client.request_url("synthesis/progress/1") == "https://other.test/api/synthesis/progress/1/"
+
+
+def answer(status: int, body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    return response
+
+
+class Backend:
+    """
+    Stands in for requests.Session.request, which both the SDK and the pooled
+    client send through, recording each request's method, URL and cookie.
+    """
+
+    def __init__(self, monkeypatch, reply):
+        self.reply = reply
+        self.sent = []
+        monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: self.send(*args, **kwargs))
+
+    def send(self, method, url, headers=None, **kwargs):
+        self.sent.append((method, url, (headers or {}).get("cookie")))
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+def outcome(send):
+    try:
+        return send()
+    except RuntimeError as e:
+        return e
+
+
+@pytest.mark.parametrize("base_url, endpoint, rm_slash", [
+    ("/api/proxy/", "synthesis/progress/1", False),
+    ("/api/proxy/", "/synthesis/landscape/1/select-umap/2", True),
+    ("/api/", "synthesis/parameters/1", False),
+])
+@pytest.mark.parametrize("reply", [
+    answer(200, b'{"progress": 50}'),
+    answer(500, b"boom"),
+    answer(404, b"SynthesisProgress not found"),
+    requests.exceptions.Timeout("read timed out"),
+])
+def test_request_path_matches_the_sdk(monkeypatch, base_url, endpoint, rm_slash, reply):
+    if "_request" not in vars(mantis_client.MantisClient):
+        pytest.skip("the installed mantis_sdk does not define MantisClient._request")
+    backend = Backend(monkeypatch, reply)
+    client = mantis_client.ResilientMantisClient(base_url, "cookie", mantis_client.mantis_configuration())
+
+    expected = outcome(lambda: mantis_client.MantisClient._request(client, "GET", endpoint, rm_slash=rm_slash))
+    result = outcome(lambda: client._request("GET", endpoint, rm_slash=rm_slash))
+
+    assert backend.sent[0] == backend.sent[1]
+    if isinstance(expected, RuntimeError):
+        assert isinstance(result, RuntimeError)
+        assert client._extract_status_code(str(result)) == client._extract_status_code(str(expected))
+        assert client.is_timeout_error(str(result)) == client.is_timeout_error(str(expected))
+        assert client._is_not_found(str(result)) == client._is_not_found(str(expected))
+    else:
+        assert result == expected
+
+
+def test_non_json_200_counts_against_the_backend(monkeypatch):
+    monkeypatch.setenv("MANTIS_HOSTS", "https://frontend.test")
+    Backend(monkeypatch, answer(200, b"<html>Bad gateway</html>"))
+    client = mantis_client.ResilientMantisClient("/api/proxy/", "cookie")
+
+    with pytest.raises(RuntimeError, match="Authentication failed"):
+        client._safe_request("GET", "synthesis/progress/1")
+
+    assert backend_guard.snapshot(client.host)["circuit"]["recent_failures"] == 1
+    assert backend_pool.snapshot()[client.host]["success_rate"] < 1
@@ -0,0 +1,75 @@
+import os
+import time
+
+import fakeredis
+import pytest
+
+from src import payloads
+
+
+@pytest.fixture(autouse=True)
+def blobs(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(payloads, "redis_blobs", client)
+    return client
+
+
+def submission(**fields) -> dict:
+    return {
+        "name": "space",
+        "cookie": "cookie",
+        "job": "job-1",
+        "queue": "spaces.small",
+        "user": "user",
+        "dataset": {"format": "csv", "compression": None, "body": b"title,value\n" + b"a,1\n" * 100},
+        **fields,
+    }
+
+
+def test_message_carries_only_a_reference_and_the_small_fields(blobs):
+    message = payloads.offload(submission())
+    assert set(message) == {"payload", *payloads.MESSAGE_FIELDS}
+    assert message["job"] == "job-1" and message["user"] == "user"
+    assert payloads.load(message) == {**submission(), **message}
+
+
+def test_redis_payload_expires_and_is_discarded(blobs):
+    message = payloads.offload(submission())
+    key = payloads._key(message["payload"])
+    assert 0 < blobs.ttl(key) <= payloads.PAYLOAD_TTL
+
+    payloads.discard(message)
+    with pytest.raises(payloads.PayloadMissing):
+        payloads.load(message)
+
+
+def test_text_bodies_are_compressed_and_parquet_is_not():
+    body = submission()["dataset"]["body"]
+    assert len(payloads._pack(submission())) < len(body)
+
+    parquet = submission(dataset={"format": "parquet", "compression": None, "body": body})
+    assert payloads._pack(parquet).endswith(body)
+    assert payloads._unpack(payloads._pack(parquet))["dataset"]["body"] == body
+
+
+def test_inline_store_base64_encodes_binary_bodies(monkeypatch):
+    monkeypatch.setattr(payloads, "PAYLOAD_STORE", "inline")
+    message = payloads.offload(submission())
+    assert "payload" not in message
+    assert isinstance(message["dataset"]["body"], str)
+
+
+def test_volume_payloads_past_the_ttl_are_swept(monkeypatch, tmp_path):
+    monkeypatch.setattr(payloads, "PAYLOAD_STORE", "volume")
+    monkeypatch.setattr(payloads, "PAYLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(payloads, "_last_sweep", 0.0)
+
+    stale = payloads.offload(submission())
+    expired = time.time() - payloads.PAYLOAD_TTL - 1
+    os.utime(payloads._path(stale["payload"]), (expired, expired))
+
+    monkeypatch.setattr(payloads, "_last_sweep", 0.0)
+    fresh = payloads.offload(submission())
+    assert payloads.load(fresh)["name"] == "space"
+    with pytest.raises(payloads.PayloadMissing):
+        payloads.load(stale)
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("mantis_sdk")
+
+from mantis_sdk.client import DataType
+
+from src.tasks import preprocess
+
+DATA_TYPES = {"title": DataType.Title, "count": DataType.Numeric, "score": DataType.Numeric, "empty": DataType.Categoric}
+
+
+def frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "title": ["a", "b", "b", None, "x" * (preprocess.MAX_TEXT_LENGTH + 10)],
+        "count": [1, 2, 2, None, 5],
+        "score": [0.5, 1.5, 1.5, None, 2.5],
+        "empty": [None] * 5,
+        "unused": ["u"] * 5,
+    })
+
+
+def test_preprocess_cleans_the_frame():
+    df, report = preprocess.preprocess(frame(), DATA_TYPES)
+
+    assert list(df.columns) == ["title", "count", "score"]
+    # the empty row and the duplicate are gone
+    assert len(df) == 3
+    assert df["title"].str.len().max() == preprocess.MAX_TEXT_LENGTH
+    assert df["score"].dtype == np.float32
+    assert [stage["stage"] for stage in report["stages"]] == [name for name, _ in preprocess.STAGES]
+    assert report["bytes_saved"] == report["bytes_before"] - report["bytes_after"] > 0
+
+
+def test_missing_text_stays_missing():
+    df = preprocess.truncate_text(pd.DataFrame({"title": ["a", None]}), {})
+    assert df["title"].isna().tolist() == [False, True]
+
+
+def test_floats_are_narrowed_only_when_exact():
+    df = preprocess.downcast_numeric(pd.DataFrame({"exact": [0.5, 1.25], "precise": [0.1, 1 / 3], "small": [1, 2]}), {})
+    assert df["exact"].dtype == np.float32
+    assert df["precise"].dtype == np.float64
+    assert df["small"].dtype == np.int8
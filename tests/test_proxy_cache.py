@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from src.api import proxy_cache
+
+
+@pytest.mark.parametrize("headers, lifetime", [
+    ({"Cache-Control": "s-maxage=60, max-age=10"}, 60),
+    ({"Cache-Control": "max-age=60", "Age": "15"}, 45),
+    ({"Cache-Control": "max-age=10", "Age": "15"}, 0),
+    ({"Expires": "Thu, 01 Jan 2026 00:01:00 GMT", "Date": "Thu, 01 Jan 2026 00:00:00 GMT"}, 60),
+    ({"Cache-Control": "no-cache", "ETag": '"v1"'}, 0),
+    ({"ETag": '"v1"'}, 0),
+    ({"Cache-Control": "no-store, max-age=60"}, None),
+    ({"Cache-Control": "private, max-age=60"}, None),
+    ({}, None),
+])
+def test_freshness_lifetime(headers, lifetime):
+    assert proxy_cache.freshness_lifetime(headers) == lifetime
+
+
+@pytest.mark.parametrize("status, headers, cacheable", [
+    (200, {"Cache-Control": "max-age=60"}, True),
+    (200, {"Cache-Control": "max-age=60", "Vary": "Accept-Encoding"}, True),
+    (200, {"Cache-Control": "max-age=60", "Vary": "Cookie"}, False),
+    (200, {"Cache-Control": "max-age=60", "Set-Cookie": "a=b"}, False),
+    (206, {"Cache-Control": "max-age=60"}, False),
+    (200, {}, False),
+])
+def test_is_cacheable(status, headers, cacheable):
+    assert proxy_cache.is_cacheable(status, headers) == cacheable
+
+
+def entry(lifetime: float = 60, stored_at: float | None = None, **headers) -> proxy_cache.CacheEntry:
+    headers = {"ETag": '"v1"', "Last-Modified": "Thu, 01 Jan 2026 00:00:00 GMT", **headers}
+    return proxy_cache.CacheEntry(200, headers, b"tile", stored_at or time.time(), lifetime)
+
+
+def test_entry_goes_stale_after_its_lifetime():
+    assert entry().is_fresh()
+    assert not entry(stored_at=time.time() - 61).is_fresh()
+
+
+def test_conditional_headers_match_the_entry():
+    cached = entry()
+    assert cached.validators() == {"If-None-Match": '"v1"', "If-Modified-Since": "Thu, 01 Jan 2026 00:00:00 GMT"}
+    assert cached.matches('"v0", "v1"', None)
+    assert not cached.matches('"v2"', "Fri, 02 Jan 2026 00:00:00 GMT")
+    assert cached.matches(None, "Fri, 02 Jan 2026 00:00:00 GMT")
+    assert not cached.matches(None, "Wed, 31 Dec 2025 00:00:00 GMT")
+
+
+def test_refreshed_entry_keeps_the_body_with_new_headers():
+    refreshed = entry(0, stored_at=time.time() - 100).refreshed({"Cache-Control": "max-age=30", "Connection": "close"})
+    assert refreshed.body == b"tile"
+    assert refreshed.is_fresh() and refreshed.lifetime == 30
+    assert "Connection" not in refreshed.headers
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = proxy_cache.ProxyCache(max_bytes=8, max_entry_bytes=8)
+    cache.put("a", entry())
+    cache.put("b", entry())
+    cache.get("a")
+    cache.put("c", entry())
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.snapshot()["evictions"] == 1
+    cache.put("large", proxy_cache.CacheEntry(200, {}, b"x" * 9, time.time(), 60))
+    assert cache.get("large") is None
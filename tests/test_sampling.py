@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("mantis_sdk")
+
+from mantis_sdk.client import DataType
+
+from src.tasks import sampling
+
+
+def frame(rows: int = 1000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "category": np.where(np.arange(rows) % 10 == 0, "rare", "common"),
+        "value": rng.normal(size=rows),
+        "text": [f"item {i}" * (i % 5 + 1) for i in range(rows)],
+    })
+
+
+def test_allocation_gives_leftover_rows_to_the_largest_remainders():
+    assert sampling._allocate(pd.Series({"a": 70, "b": 20, "c": 10}), 20).to_dict() == {"a": 14, "b": 4, "c": 2}
+    assert sampling._allocate(pd.Series({"a": 5, "b": 3, "c": 2}), 7).to_dict() == {"a": 4, "b": 2, "c": 1}
+
+
+def test_stratified_sample_keeps_category_shares():
+    df = frame()
+    sample = sampling.reduce_rows(df, 100, {"category": DataType.Categoric}, method="stratified")
+    assert len(sample) == 100
+    assert (sample["category"] == "rare").sum() == 10
+
+
+@pytest.mark.parametrize("method", ["stratified", "cluster"])
+def test_sample_size_and_determinism(method):
+    df = frame()
+    data_types = {"value": DataType.Numeric, "text": DataType.Semantic}
+    sample = sampling.reduce_rows(df, 200, data_types, method=method)
+    assert len(sample) == 200
+    assert sample.equals(sampling.reduce_rows(df, 200, data_types, method=method))
+    assert sample["value"].isin(df["value"]).all()
+
+
+def test_small_frames_are_returned_whole():
+    df = frame(50)
+    assert sampling.reduce_rows(df, 100, {}) is df
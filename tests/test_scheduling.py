@@ -0,0 +1,37 @@
+import pytest
+
+from src import scheduling
+from src.tasks import ingest
+
+
+@pytest.mark.parametrize("dataset_format", [ingest.ARROW_STREAM, ingest.ARROW_FILE, ingest.PARQUET])
+def test_binary_formats_are_costed_as_compressed(dataset_format):
+    data = {"dataset": {"body": b"x" * 100, "format": dataset_format}}
+    assert scheduling.estimate_cost(data) == 100 * scheduling.COMPRESSED_SIZE_FACTOR
+
+
+def test_text_formats_are_costed_by_size_unless_compressed():
+    assert scheduling.estimate_cost({"dataset": {"body": b"x" * 100, "format": ingest.CSV}}) == 100
+    assert scheduling.estimate_cost({"dataset": {"body": b"x" * 100, "format": ingest.CSV, "compression": "gzip"}}) == 400
+
+
+def test_json_cost_counts_semantic_text_only():
+    data = {
+        "data": {"title": ["abcd"] * 10, "value": [1] * 10},
+        "data_types": {"title": "semantic", "value": "numeric"},
+    }
+    assert scheduling.estimate_cost(data) == 40
+
+
+def test_route_stamps_queue_and_user():
+    data = scheduling.route({"cookie": "cookie", "data": {"title": ["a"]}, "data_types": {}})
+    assert data["queue"] == scheduling.QUEUE_SMALL
+    assert data["user"] == scheduling.user_key("cookie") != scheduling.user_key("other")
+
+
+def test_queue_status_uses_observed_durations(monkeypatch):
+    monkeypatch.setattr(scheduling, "_depths", lambda queues: {queue: 3 for queue in queues})
+    scheduling.observe(scheduling.QUEUE_SMALL, 10)
+    status = scheduling.queue_status()
+    assert status[scheduling.QUEUE_SMALL] == {"depth": 3, "average_stage_seconds": 10, "estimated_wait_seconds": 30}
+    assert status[scheduling.QUEUE_LARGE]["average_stage_seconds"] == scheduling.DEFAULT_STAGE_SECONDS[scheduling.QUEUE_LARGE]
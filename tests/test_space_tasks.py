@@ -0,0 +1,137 @@
+import time
+
+import pytest
+
+pytest.importorskip("mantis_sdk")
+
+from src import jobs, validation
+from src.tasks import backend_guard, resume, space_tasks
+
+
+class FakeMantis:
+    """
+    Stands in for the pooled Mantis client: start_space answers with the given
+    outcome and probe_space with the given status.
+    """
+
+    def __init__(self, status: str = "running", upload=None):
+        self.status = status
+        self.upload = upload
+        self.uploads = []
+
+    def probe_space(self, space_id):
+        if isinstance(self.status, Exception):
+            raise self.status
+        return self.status
+
+    def is_timeout_error(self, message):
+        return "timeout" in message.lower()
+
+    def start_space(self, space_id, data, on_recieve_id=None, **kwargs):
+        self.uploads.append(data)
+        if isinstance(self.upload, Exception):
+            raise self.upload
+        on_recieve_id(space_id, space_id)
+        return {"space_id": space_id, "layer_id": space_id}
+
+
+@pytest.fixture
+def mantis(monkeypatch):
+    client = FakeMantis()
+    monkeypatch.setattr(space_tasks, "make_client", lambda cookie, host=None: client)
+    monkeypatch.setattr(space_tasks, "backoff_delay", lambda attempt: 0)
+    return client
+
+
+def submission(rows: int = validation.MIN_ROWS, **fields) -> dict:
+    return {
+        "name": "space",
+        "cookie": "cookie",
+        "job": "job-1",
+        "backend": "https://a.test",
+        "data": {"title": [f"Item {i}" for i in range(rows)], "value": list(range(rows))},
+        "data_types": {"title": "title", "value": "numeric"},
+        **fields,
+    }
+
+
+def started(stage: str = "uploading", **state) -> dict:
+    state = {**space_tasks._space_state(submission(), "cookie", "space-1", "space-1"), **state}
+    resume.save("task-1", state, stage)
+    return state
+
+
+def test_nothing_to_resume(mantis):
+    assert space_tasks._resume_space("task-1") is None
+
+
+def test_space_still_building_is_resumed(mantis):
+    state = started("synthesis")
+    assert space_tasks._resume_space("task-1") == state
+
+
+def test_space_gone_from_the_backend_is_uploaded_again(mantis):
+    started()
+    mantis.status = "missing"
+    assert space_tasks._resume_space("task-1") is None
+    assert resume.load("task-1") is None
+
+
+def test_unknown_upload_is_probed_again_until_retries_run_out(mantis):
+    started()
+    mantis.status = "unknown"
+    retry = space_tasks._resume_space("task-1")
+    assert retry == {"retry_after": space_tasks.POLL_INTERVAL, "upload_attempts": 1}
+
+    failed = space_tasks._resume_space("task-1", space_tasks.MAX_RETRIES)
+    assert failed["error_type"] == space_tasks.TIMEOUT_ERROR["error_type"]
+    assert resume.load("task-1") is None
+
+
+def test_busy_backend_puts_the_stage_back(mantis):
+    started()
+    mantis.status = backend_guard.BackendBusy("https://a.test", "rate limited (poll)", 3)
+    assert space_tasks._resume_space("task-1") == {"retry_after": 3}
+
+
+def test_space_past_the_deadline_fails(mantis):
+    started(started_at=time.time() - space_tasks.SYNTHESIS_DEADLINE - 1)
+    assert space_tasks._resume_space("task-1")["error_type"] == "timeout"
+
+
+def test_upload_records_the_space_for_resuming(mantis):
+    state = space_tasks._upload_space(submission(), "task-1")
+    assert state["job"] == "job-1" and state["backend"] == "https://a.test"
+    assert resume.load("task-1")[1] == "uploaded"
+    assert jobs.lookup("job-1") == {"space_id": state["space_id"], "layer_id": state["layer_id"], "backend": "https://a.test"}
+
+
+def test_timed_out_upload_is_re_enqueued(mantis):
+    mantis.upload = RuntimeError("Request timeout: read timed out")
+    mantis.status = "unknown"
+    assert space_tasks._upload_space(submission(), "task-1") == {"retry_after": 0, "upload_attempts": 1}
+    # the next attempt probes the space before uploading again
+    assert resume.load("task-1")[1] == "uploading"
+
+
+def test_timed_out_upload_the_backend_kept_building_is_resumed(mantis):
+    mantis.upload = RuntimeError("Request timeout: read timed out")
+    state = space_tasks._upload_space(submission(), "task-1")
+    assert state["space_id"] == resume.load("task-1")[0]["space_id"]
+
+
+def test_large_dataset_is_split_into_even_shards(mantis, monkeypatch):
+    monkeypatch.setattr(space_tasks, "MAX_ROWS", 100)
+    result = space_tasks._upload_space(submission(250, large_dataset_mode="shard"), "task-1")
+
+    shards = result["shards"]
+    assert [len(shard["data"]["title"]) for shard in shards] == [83, 83, 84]
+    assert all(shard["job"] == "job-1" and shard["large_dataset_mode"] == "reject" for shard in shards)
+    assert not mantis.uploads
+
+
+def test_large_dataset_is_sampled(mantis, monkeypatch):
+    monkeypatch.setattr(space_tasks, "MAX_ROWS", 100)
+    monkeypatch.setattr(space_tasks, "UPLOAD_STREAMING", False)
+    space_tasks._upload_space(submission(250, large_dataset_mode="sample"), "task-1")
+    assert len(mantis.uploads[0]) == 100
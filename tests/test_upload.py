@@ -0,0 +1,32 @@
+import gzip
+
+import pandas as pd
+
+from src.tasks import upload
+
+
+def frame(rows: int = 1200) -> pd.DataFrame:
+    return pd.DataFrame({"title": [f"Item {i}" for i in range(rows)], "value": [i * 0.5 for i in range(rows)]})
+
+
+def test_chunks_match_a_single_serialization():
+    df = frame()
+    payload = upload.CsvPayload(df, compress=False)
+    assert b"".join(payload.chunks()) == df.to_csv(index=False).encode("utf-8")
+
+
+def test_gzip_chunks_decompress_to_the_csv():
+    df = frame()
+    payload = upload.CsvPayload(df, compress=True)
+    assert payload.file_extension == "csv.gz"
+    assert gzip.decompress(b"".join(payload.chunks())) == df.to_csv(index=False).encode("utf-8")
+
+
+def test_multipart_body_carries_fields_and_file():
+    df = frame(3)
+    body = upload.MultipartBody({"name": "space"}, "file", "data.csv", upload.CsvPayload(df, compress=False))
+    raw = b"".join(body)
+    assert body.content_type == f"multipart/form-data; boundary={body.boundary}"
+    assert b'name="name"\r\n\r\nspace\r\n' in raw
+    assert b'filename="data.csv"\r\nContent-Type: text/csv\r\n\r\n' + df.to_csv(index=False).encode("utf-8") in raw
+    assert raw.endswith(f"--{body.boundary}--\r\n".encode("ascii"))
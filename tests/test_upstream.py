@@ -0,0 +1,42 @@
+import gzip
+import io
+
+import requests
+from urllib3.response import HTTPResponse
+
+from src.api import upstream
+
+
+def response(body: bytes, **headers) -> requests.Response:
+    result = requests.Response()
+    result.status_code = 200
+    result.raw = HTTPResponse(body=io.BytesIO(body), headers=headers, preload_content=False)
+    result.headers = requests.structures.CaseInsensitiveDict(headers)
+    return result
+
+
+def test_passthrough_relays_encoded_bytes_in_chunks(monkeypatch):
+    monkeypatch.setattr(upstream, "PASSTHROUGH", True)
+    monkeypatch.setattr(upstream, "STREAM_BUFFER_SIZE", 1024)
+    encoded = gzip.compress(bytes(range(256)) * 64)
+
+    chunks = list(upstream.iter_body(response(encoded, **{"Content-Encoding": "gzip"})))
+    assert b"".join(chunks) == encoded
+    assert max(len(chunk) for chunk in chunks) <= 1024
+
+
+def test_without_passthrough_the_body_is_decoded(monkeypatch):
+    monkeypatch.setattr(upstream, "PASSTHROUGH", False)
+    body = b"alpha beta" * 100
+    assert b"".join(upstream.iter_body(response(gzip.compress(body), **{"Content-Encoding": "gzip"}))) == body
+
+
+def test_relay_headers_drop_hop_by_hop_and_stale_encoding(monkeypatch):
+    monkeypatch.setattr(upstream, "PASSTHROUGH", False)
+    headers = upstream.relay_headers(response(b"", **{
+        "connection": "keep-alive",
+        "content-encoding": "gzip",
+        "content-length": "10",
+        "ETag": '"v1"',
+    }))
+    assert dict(headers) == {"ETag": '"v1"'}
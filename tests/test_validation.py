@@ -0,0 +1,165 @@
+import io
+import json
+
+import ijson
+import pytest
+
+from src import validation
+
+
+def make_body(rows: int = validation.MIN_ROWS, **fields) -> bytes:
+    body = {
+        "name": "test",
+        "cookie": "cookie",
+        "data": {
+            "title": [f"Item {i}" for i in range(rows)],
+            "value": [i * 0.5 for i in range(rows)],
+        },
+        "data_types": {"title": "title", "value": "numeric"},
+    }
+    body.update(fields)
+    return json.dumps(body).encode("utf-8")
+
+
+def error_type(raw: bytes) -> str:
+    with pytest.raises(validation.Invalid) as excinfo:
+        validation.read_json_submission(io.BytesIO(raw))
+    return excinfo.value.error_type
+
+
+def scan(raw: bytes):
+    return validation._scan(ijson.basic_parse(io.BytesIO(raw), use_float=True))
+
+
+def test_valid_body_is_returned_whole():
+    raw = make_body()
+    assert validation.read_json_submission(io.BytesIO(raw)) == raw
+
+
+def test_scan_counts_rows_of_nested_values():
+    raw = make_body(data={
+        "title": [{"text": "a", "tags": ["x", "y"]}, [1, [2, 3]], "plain"],
+        "value": [1, 2, 3],
+    })
+    options, dataset = scan(raw)
+    assert dataset["rows"] == {"title": 3, "value": 3}
+    assert dataset["data_types"] == {"title": "title", "value": "numeric"}
+    assert options["cookie"] == "cookie"
+
+
+def test_scan_ignores_nested_options():
+    raw = make_body(extra={"cookie": "", "data_types": 1})
+    options, _ = scan(raw)
+    assert "extra" not in options
+
+
+def test_unequal_columns_are_rejected():
+    raw = make_body(data={"title": ["a"] * validation.MIN_ROWS, "value": [1] * (validation.MIN_ROWS + 1)})
+    assert error_type(raw) == "invalid_dataset"
+
+
+def test_truncated_body_is_invalid_json():
+    raw = make_body()
+    assert error_type(raw[: len(raw) // 2]) == "invalid_json"
+
+
+def test_empty_cookie_stops_the_scan_before_the_dataset():
+    raw = make_body(cookie="")
+    # Cut inside the dataset: the cookie has to be rejected before the parser gets there
+    assert error_type(raw[: raw.index(b'"data"') + 20]) == "authentication_missing"
+
+
+def test_missing_cookie_is_rejected():
+    body = json.loads(make_body())
+    del body["cookie"]
+    assert error_type(json.dumps(body).encode("utf-8")) == "authentication_missing"
+
+
+@pytest.mark.parametrize("data_types", [[], "title", 1])
+def test_data_types_must_be_an_object(data_types):
+    assert error_type(make_body(data_types=data_types)) == "invalid_data_types"
+
+
+def test_data_types_must_cover_a_column():
+    assert error_type(make_body(data_types={"other": "title", "title": "delete"})) == "no_columns"
+
+
+def test_long_value_is_rejected():
+    raw = make_body(data={"title": ["x" * (validation.MAX_VALUE_LENGTH + 1)], "value": [1]})
+    assert error_type(raw) == "value_too_large"
+
+
+def test_row_limit_stops_the_scan():
+    raw = make_body(validation.MAX_TOTAL_ROWS + 1)
+    assert error_type(raw) == "dataset_too_large"
+
+
+@pytest.mark.parametrize("rows, mode, expected", [
+    (validation.MIN_ROWS - 1, None, "insufficient_data"),
+    (validation.MIN_ROWS, None, None),
+    (validation.MAX_TOTAL_ROWS, "sample", None),
+    (validation.MAX_TOTAL_ROWS + 1, "sample", "dataset_too_large"),
+    (validation.REJECT_MAX_ROWS, "reject", None),
+    (validation.REJECT_MAX_ROWS + 1, "reject", "dataset_too_large"),
+])
+def test_check_rows_boundaries(rows, mode, expected):
+    if expected is None:
+        validation.check_rows(rows, mode)
+    else:
+        with pytest.raises(validation.Invalid) as excinfo:
+            validation.check_rows(rows, mode)
+        assert excinfo.value.error_type == expected
+        assert excinfo.value.response()["row_count"] == rows
+
+
+def read_batch(body: dict, max_items: int = 10):
+    raw = json.dumps(body).encode("utf-8")
+    returned, errors = validation.read_json_batch(io.BytesIO(raw), ("cookie", "data_types", "large_dataset_mode"), max_items)
+    assert returned == raw
+    return {index: e.error_type for index, e in errors.items()}
+
+
+def spec(rows: int = validation.MIN_ROWS, **fields) -> dict:
+    body = json.loads(make_body(rows))
+    del body["cookie"], body["data_types"]
+    return {**body, **fields}
+
+
+def test_batch_specs_are_checked_with_the_shared_fields():
+    body = {
+        "spaces": [
+            spec(),
+            spec(validation.MIN_ROWS - 1),
+            spec(cookie=""),
+            spec(data_types={"title": "delete"}),
+            spec(data={"title": ["x" * (validation.MAX_VALUE_LENGTH + 1)], "value": [1]}),
+            spec(),
+            "not a spec",
+        ],
+        "cookie": "cookie",
+        "data_types": {"title": "title", "value": "numeric"},
+    }
+    assert read_batch(body) == {
+        1: "insufficient_data",
+        2: "authentication_missing",
+        3: "no_columns",
+        4: "value_too_large",
+    }
+
+
+def test_batch_without_shared_fields():
+    body = {"spaces": [spec(), spec(cookie="own", data_types={"title": "title"})]}
+    assert read_batch(body) == {0: "authentication_missing"}
+
+
+def test_batch_item_limit_stops_the_scan():
+    with pytest.raises(validation.Invalid) as excinfo:
+        read_batch({"spaces": [spec()] * 3, "cookie": "cookie"}, max_items=2)
+    assert excinfo.value.error_type == "batch_too_large"
+
+
+def test_truncated_batch_is_invalid_json():
+    raw = json.dumps({"spaces": [spec()], "cookie": "cookie"}).encode("utf-8")
+    with pytest.raises(validation.Invalid) as excinfo:
+        validation.read_json_batch(io.BytesIO(raw[:-10]), ("cookie",), 10)
+    assert excinfo.value.error_type == "invalid_json"